@@ -0,0 +1,412 @@
+"""
+Tag based invalidation of the cached model queries.
+
+Every tag (the home feed, a category, a playlist, the orphans...)
+has a generation counter in Redis, folded into the version
+of the entries tagged with it. Bumping a tag's generation makes
+its entries out of date, they're recomputed on their next read,
+so the listings can be cached for long and still be up to date.
+
+Each process keeps the hottest entries and the generations
+in a small local LRU cache in front of Redis, with a short TTL.
+The bumped tags are published over Redis pub/sub,
+so every process drops their generations at once.
+
+An expired or invalidated entry is recomputed by a single request
+holding a short Redis lock, while the others are served the stale value,
+so an expiry doesn't send every concurrent request to the database.
+The entries also expire probabilistically a bit early, the sooner the more
+expensive they are, and get refreshed in the background ahead of time.
+https://cseweb.ucsd.edu/~avattani/papers/cache_stampede.pdf
+"""
+
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import functools
+import threading
+from typing import Callable, NamedTuple
+from collections import OrderedDict
+
+from flask import current_app, request, g
+from flask import has_request_context, copy_current_request_context
+
+from app import db, cache
+
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+EARLY_EXPIRATION_BETA = 1.0  # > 1 favors earlier refreshes
+LOCK_WAIT = 5  # seconds to wait for another request computing a missing entry
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache whose entries expire after `ttl` seconds.
+    The least recently used entries are evicted beyond `maxsize` entries.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        """The value of the key, None if missing or expired."""
+        with self.lock:
+            if not (entry := self.entries.get(key)):
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+# the local cache of the current process, by pid, so a forked worker gets its own
+_local_caches: dict[int, LocalCache] = {}
+_local_lock = threading.Lock()
+
+
+def local_cache() -> LocalCache | None:
+    """
+    The local cache of this process, None if disabled (CACHE_LOCAL_SIZE is 0).
+    Subscribes to the invalidations the first time.
+    """
+    if not (maxsize := current_app.config["CACHE_LOCAL_SIZE"]):
+        return None
+    pid = os.getpid()
+    if local := _local_caches.get(pid):
+        return local
+    with _local_lock:
+        if not (local := _local_caches.get(pid)):
+            local = LocalCache(maxsize, current_app.config["CACHE_LOCAL_TTL"])
+            subscribe(local, current_app.config["REDIS_CLIENT"])
+            _local_caches.clear()
+            _local_caches[pid] = local
+    return local
+
+
+def subscribe(local: LocalCache, redis_client) -> None:
+    """Drop the generations of the tags bumped by any process."""
+
+    def on_message(message: dict) -> None:
+        tags = json.loads(message["data"])
+        local.delete(*(generation_key(tag) for tag in tags))
+
+    def on_error(error: Exception, pubsub, thread) -> None:
+        # messages could be missed while disconnected,
+        # the pubsub resubscribes when it reconnects
+        local.clear()
+        time.sleep(1)
+
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{INVALIDATION_CHANNEL: on_message})
+    pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=on_error)
+
+
+def generation_key(tag: str) -> str:
+    return f"cache:gen:{tag}"
+
+
+def get_generations(tags: list[str]) -> list[int]:
+    """
+    Current generations of the tags, 0 if never bumped.
+    Served from the local cache if there, the rest with one Redis call.
+    """
+    local = local_cache()
+    keys = [generation_key(tag) for tag in tags]
+    generations = {key: local.get(key) if local else None for key in keys}
+
+    if missing := [key for key, value in generations.items() if value is None]:
+        values = current_app.config["REDIS_CLIENT"].mget(missing)
+        for key, value in zip(missing, values):
+            generations[key] = int(value or 0)
+            if local:
+                local.set(key, generations[key])
+
+    return [generations[key] for key in keys]
+
+
+def bump(*tags: str) -> None:
+    """
+    Invalidate the entries of the tags by bumping their generations
+    and tell the other processes to drop the old generations.
+    """
+    if not (tags := tuple(set(tags))):
+        return
+    pipe = current_app.config["REDIS_CLIENT"].pipeline()
+    for tag in tags:
+        pipe.incr(generation_key(tag))
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(tags))
+    pipe.execute()
+    if local := local_cache():
+        local.delete(*(generation_key(tag) for tag in tags))
+
+
+def invalidate(*tags: str) -> None:
+    """
+    Bump the tags once the current transaction commits,
+    so no request caches the old data in the meantime.
+    For changes the session can't see, e.g. bulk UPDATE statements.
+    """
+    db.session.info.setdefault("cache_tags", set()).update(tags)
+
+
+def arg_key(arg) -> str:
+    """Stable representation of an argument, models by their primary key."""
+    if isinstance(arg, db.Model):
+        return f"{type(arg).__name__}:{arg.id}"
+    if isinstance(arg, type):
+        return arg.__name__
+    return repr(arg)
+
+
+class Entry(NamedTuple):
+    """A cached value along with what tells when to refresh it."""
+
+    value: object
+    version: tuple  # generations of the tags it was computed with
+    expires_at: float  # soft expiry, epoch seconds
+    delta: float  # seconds it took to compute
+
+
+def lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+def acquire(key: str) -> bool:
+    """Take the lock to recompute the key, it expires if the holder dies."""
+    redis_client = current_app.config["REDIS_CLIENT"]
+    timeout = current_app.config["CACHE_LOCK_TIMEOUT"]
+    return bool(redis_client.set(lock_key(key), 1, nx=True, ex=timeout))
+
+
+def release(key: str) -> None:
+    current_app.config["REDIS_CLIENT"].delete(lock_key(key))
+
+
+def store(key: str, compute: Callable, version: tuple, timeout: int):
+    """
+    Compute the value and cache it, soft expiring after `timeout` seconds.
+    The stale value can be served for CACHE_STALE_TIMEOUT more seconds.
+    """
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    hard_timeout = timeout + current_app.config["CACHE_STALE_TIMEOUT"]
+    cache.set(key, Entry(value, version, start + delta + timeout, delta), hard_timeout)
+    return value
+
+
+def reattach(arg):
+    """Model instance of another thread's session, merged into this thread's."""
+    return db.session.merge(arg) if isinstance(arg, db.Model) else arg
+
+
+def in_background(func: Callable) -> None:
+    """Run the function in a thread, within a copy of the current context."""
+    if has_request_context():
+        target = copy_current_request_context(func)
+    else:
+        app = current_app._get_current_object()  # type: ignore
+
+        def target():
+            with app.app_context():
+                func()
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+def fetch(
+    key: str,
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    version: tuple,
+    timeout: int,
+):
+    """
+    Get the function's result from the cache, computing it at most once
+    across the processes when missing, stale or invalidated.
+
+    Parameters:
+    key (str): The cache key.
+    func (Callable): The function computing the value.
+    args (tuple), kwargs (dict): The function's arguments.
+    version (tuple): The generations of the value's tags.
+    timeout (int): Seconds until the value is stale.
+
+    Returns:
+    The cached or the computed value.
+    """
+
+    def compute():
+        return func(*args, **kwargs)
+
+    entry = cache.get(key)
+    if not isinstance(entry, Entry):
+        if acquire(key):
+            try:
+                return store(key, compute, version, timeout)
+            finally:
+                release(key)
+        # another request is computing it, wait for its result
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if isinstance(entry, Entry) and entry.version == version:
+                return entry.value
+        return compute()
+
+    if entry.version != version:
+        # invalidated, the lock holder gets the fresh value, the others the old one
+        if acquire(key):
+            try:
+                return store(key, compute, version, timeout)
+            finally:
+                release(key)
+        return entry.value
+
+    # the closer to the soft expiry and the more expensive the computation,
+    # the likelier the entry is refreshed ahead of time
+    early = entry.delta * EARLY_EXPIRATION_BETA * -math.log(1 - random.random())
+    if time.time() + early >= entry.expires_at and acquire(key):
+
+        def refresh():
+            try:
+                args_ = [reattach(arg) for arg in args]
+                kwargs_ = {name: reattach(arg) for name, arg in kwargs.items()}
+                store(key, lambda: func(*args_, **kwargs_), version, timeout)
+            except Exception:
+                current_app.logger.exception(f"Unable to refresh {key}.")
+            finally:
+                release(key)
+
+        in_background(refresh)
+
+    return entry.value
+
+
+def recompute(
+    key: str,
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    version: tuple,
+    timeout: int,
+) -> bool:
+    """
+    Recompute the entry ahead of its expiry, e.g. to warm it up,
+    unless another request already is. Return True if recomputed.
+    """
+    if not acquire(key):
+        return False
+    try:
+        store(key, lambda: func(*args, **kwargs), version, timeout)
+    finally:
+        release(key)
+    return True
+
+
+def tagged(
+    *tags: str | Callable, timeout: int | None = None, codec=None
+) -> Callable:
+    """
+    Cache the function's result under a key made of its name and arguments,
+    versioned by the generations of its tags. A tag is either a string
+    or a callable receiving the function's arguments and returning a string.
+    The function without caching is available as `uncached`.
+
+    Parameters:
+    tags (str | Callable): The tags of the cached results.
+    timeout (int): Seconds until stale, CACHE_TAGGED_TIMEOUT if not supplied.
+    codec (Codec): Packs the results for the shared cache and unpacks them,
+    its version is part of the keys, e.g. `app.cards.page`.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = f"{func.__module__}.{func.__qualname__}"
+        if codec:
+            name = f"{name}:v{codec.version}"
+
+        def packed(*args, **kwargs):
+            return codec.pack(func(*args, **kwargs))
+
+        def cache_key(*args, **kwargs) -> tuple[str, tuple]:
+            """The key of the call and the current version of its result."""
+            call_tags = [tag(*args, **kwargs) if callable(tag) else tag for tag in tags]
+            version = tuple(get_generations(call_tags))
+            parts = [arg_key(arg) for arg in args]
+            parts += [f"{key}={arg_key(kwargs[key])}" for key in sorted(kwargs)]
+            digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+            return f"cache:{name}:{digest}", version
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key, version = cache_key(*args, **kwargs)
+            # the hot entries are served from the process memory
+            local = local_cache()
+            local_key = f"{key}@{'.'.join(map(str, version))}"
+            if local and (value := local.get(local_key)) is not None:
+                return value
+            timeout_ = timeout or current_app.config["CACHE_TAGGED_TIMEOUT"]
+            if codec:
+                payload = fetch(key, packed, args, kwargs, version, timeout_)
+                value = codec.unpack(payload)
+            else:
+                value = fetch(key, func, args, kwargs, version, timeout_)
+            if local:
+                local.set(local_key, value)
+            return value
+
+        wrapper.uncached = func  # type: ignore
+        wrapper.cache_key = cache_key  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def cached(timeout: int) -> Callable:
+    """
+    Cache the view's result by the request path, in place of `cache.cached`,
+    with the same protection against the concurrent recomputations.
+
+    Parameters:
+    timeout (int): Seconds until stale.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = f"cache:view:{request.path}"
+            # set by the cache warmer, the view isn't invalidated by tags
+            if g.get("refresh_cache"):
+                recompute(key, func, args, kwargs, (), timeout)
+            return fetch(key, func, args, kwargs, (), timeout)
+
+        wrapper.uncached = func  # type: ignore
+        return wrapper
+
+    return decorator
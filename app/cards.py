@@ -0,0 +1,100 @@
+"""
+Compact serialization of the post cards in the cached listings.
+
+A card (the `Post.to_dict` of a listing) is stored as a tuple
+in the order of the schema below, instead of a pickled dict
+with a Markup title and the thumbnail dict. The thumbnail URLs and srcsets
+differ only by the video id, so each is stored once per listing
+as a template with the video id cut out, the cards refer to them by index.
+The timestamps stay datetimes, pickled compactly as they are.
+
+The schema version is part of the cache keys, so a changed schema
+never reads the entries written by the previous one.
+"""
+
+import datetime as dt
+from markupsafe import Markup
+
+
+VERSION = 2
+
+# (video_id, title, thumbnail url, width, height, srcset, created_at, updated_at),
+# the url and the srcset being indexes of their templates
+Row = tuple[str, str, int, int, int | None, int, dt.datetime, dt.datetime]
+
+
+def pack(cards: list[dict]) -> tuple[int, tuple[str, ...], tuple[Row, ...]]:
+    """The cards as a versioned tuple of the URL templates and the rows."""
+    templates: dict[str, int] = {}
+    rows = []
+    for card in cards:
+        video_id, thumb = card["video_id"], card["thumbnail"]
+
+        def intern(text: str) -> int:
+            template = text.replace(video_id, "\0")
+            return templates.setdefault(template, len(templates))
+
+        rows.append(
+            (
+                video_id,
+                str(card["title"]),  # already escaped
+                intern(thumb["url"]),
+                thumb["width"],
+                thumb.get("height"),
+                intern(card["srcset"]),
+                card["created_at"],
+                card["updated_at"],
+            )
+        )
+    return VERSION, tuple(templates), tuple(rows)
+
+
+def unpack(payload: tuple) -> list[dict]:
+    """The cards from their packed tuple."""
+    version, templates, rows = payload
+    if version != VERSION:
+        raise ValueError(f"Unknown cards schema version {version}.")
+    cards = []
+    for video_id, title, url, width, height, srcset, created, updated in rows:
+        thumbnail = {"url": templates[url].replace("\0", video_id), "width": width}
+        if height is not None:
+            thumbnail["height"] = height
+        cards.append(
+            {
+                "video_id": video_id,
+                "title": Markup(title),
+                "thumbnail": thumbnail,
+                "created_at": created,
+                "updated_at": updated,
+                "srcset": templates[srcset].replace("\0", video_id),
+            }
+        )
+    return cards
+
+
+class Codec:
+    """
+    Packs the cached listings' cards, the pages of cards
+    along with their cursor if paged.
+    """
+
+    version = VERSION
+
+    def __init__(self, paged: bool = False):
+        self.paged = paged
+
+    def pack(self, value):
+        if self.paged:
+            cards, cursor = value
+            return pack(cards), cursor
+        return pack(value)
+
+    def unpack(self, payload):
+        if self.paged:
+            cards, cursor = payload
+            return unpack(cards), cursor
+        return unpack(payload)
+
+
+listing = Codec()
+page = Codec(paged=True)
@@ -7,10 +7,10 @@ from flask import (
     request,
     render_template,
     abort,
-    make_response,
 )
 
 from app import db
+from app.helpers import scroll_response
 from app.models import Category
 
 
@@ -24,20 +24,20 @@ def category(slug: str) -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number from URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
     category = db.one_or_404(db.select(Category).filter_by(slug=slug))
-    posts = category.get_posts(page=page, per_page=per_page)
+    posts, cursor = category.get_posts(cursor=cursor, per_page=per_page)
 
     # return JSON response for scroll content
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     if not posts:
         abort(404)
 
-    return render_template("category.html", posts=posts, category=category)
+    return render_template(
+        "category.html", posts=posts, cursor=cursor, category=category
+    )
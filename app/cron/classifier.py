@@ -0,0 +1,121 @@
+"""
+Multinomial Naive Bayes text classifier for the posts categories.
+https://nlp.stanford.edu/IR-book/html/htmledition/naive-bayes-text-classification-1.html
+
+Words are hashed into a fixed number of features (the hashing trick),
+so the model can learn from new posts incrementally
+without rebuilding a vocabulary.
+"""
+
+import os
+import re
+import zlib
+import numpy as np
+
+
+class CategoryClassifier:
+    """Predict a category id from a post title and tags."""
+
+    def __init__(self, n_features: int = 2**16, alpha: float = 1.0):
+        self.n_features = n_features
+        self.alpha = alpha  # Laplace smoothing
+        # category id of each row in the counts matrix
+        self.labels = np.zeros(0, dtype=np.int64)
+        # word (feature) counts per category
+        self.counts = np.zeros((0, n_features), dtype=np.float32)
+        # number of documents per category
+        self.docs = np.zeros(0, dtype=np.int64)
+        # ids of the posts the model already learned from, and their categories
+        self.trained: dict[int, int] = {}
+
+    def features(self, text: str) -> np.ndarray:
+        """Hash the words of a text into feature indices."""
+        words = re.findall(r"\w+", text.lower())
+        hashes = [zlib.crc32(word.encode()) % self.n_features for word in words]
+        return np.array(hashes, dtype=np.int64)
+
+    def _row(self, label: int) -> int:
+        """Get the row of a category in the counts matrix, add it if missing."""
+        if (rows := np.flatnonzero(self.labels == label)).size:
+            return int(rows[0])
+        self.labels = np.append(self.labels, label)
+        self.docs = np.append(self.docs, 0)
+        row = np.zeros((1, self.n_features), dtype=np.float32)
+        self.counts = np.vstack([self.counts, row])
+        return len(self.labels) - 1
+
+    def partial_fit(self, post_id: int, text: str, label: int) -> None:
+        """Learn from one labelled post, unless already learned."""
+        if post_id in self.trained:
+            return
+        row = self._row(label)
+        np.add.at(self.counts[row], self.features(text), 1)
+        self.docs[row] += 1
+        self.trained[post_id] = label
+
+    def relabelled(self, labels: dict[int, int]) -> bool:
+        """Whether any of the learned posts has a different category now."""
+        return any(
+            labels.get(post_id, label) != label
+            for post_id, label in self.trained.items()
+        )
+
+    def predict(self, text: str) -> tuple[int | None, float]:
+        """
+        Predict the category of a text.
+
+        Returns:
+        tuple: The category id (None if untrained) and the probability.
+        """
+        if not self.labels.size or not (features := self.features(text)).size:
+            return None, 0.0
+
+        idx, freq = np.unique(features, return_counts=True)
+        totals = self.counts.sum(axis=1) + self.alpha * self.n_features
+
+        # log P(category) + sum of log P(word | category) for every word
+        scores = np.log(self.docs / self.docs.sum())
+        scores += (np.log(self.counts[:, idx] + self.alpha) * freq).sum(axis=1)
+        scores -= freq.sum() * np.log(totals)
+
+        # normalize into probabilities (softmax)
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+
+        best = int(probs.argmax())
+        return int(self.labels[best]), float(probs[best])
+
+    @property
+    def num_docs(self) -> int:
+        return int(self.docs.sum())
+
+    def save(self, path: str) -> None:
+        """Save the model to disk, atomically replacing the previous one."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            n_features=self.n_features,
+            alpha=self.alpha,
+            labels=self.labels,
+            counts=self.counts,
+            docs=self.docs,
+            trained=np.array(list(self.trained), dtype=np.int64),
+            trained_labels=np.array(list(self.trained.values()), dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryClassifier":
+        """Load the model from disk, or return an untrained one."""
+        try:
+            with np.load(path) as data:
+                model = cls(int(data["n_features"]), float(data["alpha"]))
+                model.labels = data["labels"]
+                model.counts = data["counts"]
+                model.docs = data["docs"]
+                trained = data["trained"].tolist()
+                model.trained = dict(zip(trained, data["trained_labels"].tolist()))
+        except (OSError, KeyError, ValueError):
+            model = cls()
+        return model
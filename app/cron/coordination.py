@@ -0,0 +1,259 @@
+"""
+Coordination of the worker instances on Redis.
+
+A lease is a Redis key holding a random token with an expiry,
+kept alive by a background thread for as long as its holder runs.
+If the holder dies the lease expires and another instance can take over.
+https://redis.io/docs/latest/develop/use/patterns/distributed-locks/
+
+The catalog can be split into shards, the playlists and the posts
+are assigned to the shards by consistent hashing.
+"""
+
+import uuid
+import bisect
+import hashlib
+import threading
+
+from flask import current_app
+
+from app import db
+from app.models import Post
+
+
+# extend or delete the key only if it still holds our token
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# the posts are hashed by id into this many buckets, the buckets onto the shards
+NUM_BUCKETS = 1024
+
+# set when a shard is done, until the catalog wide work is taken
+CATALOG_PENDING_KEY = "worker:catalog:pending"
+
+
+class Lease:
+    """
+    Exclusive lease on a Redis key, renewed in the background
+    every third of its ttl while used as a context manager.
+    """
+
+    def __init__(self, redis_client, key: str, ttl: int = 60):
+        self.redis = redis_client
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+        # set if the lease couldn't be renewed and may be held by someone else
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    def acquire(self) -> bool:
+        px = self.ttl * 1000
+        self.acquired = bool(self.redis.set(self.key, self.token, nx=True, px=px))
+        return self.acquired
+
+    def renew(self) -> bool:
+        args = [self.token, self.ttl * 1000]
+        return bool(self._renew(keys=[self.key], args=args))
+
+    def release(self) -> None:
+        self._release(keys=[self.key], args=[self.token])
+        self.acquired = False
+
+    def _keep_alive(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.renew()
+            except Exception:
+                renewed = False
+            if not renewed:
+                self.lost.set()
+                return
+
+    def __enter__(self) -> "Lease":
+        if not self.acquired and not self.acquire():
+            raise LeaseNotAcquiredError(f"The lease {self.key} is held by another.")
+        self._thread = threading.Thread(target=self._keep_alive, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.release()
+
+
+def run_lock_key(name: str) -> str:
+    return f"worker:lock:{name}"
+
+
+def shard_lock_key(index: int | str) -> str:
+    return f"worker:lock:shard:{index}"
+
+
+def run_lock(name: str) -> Lease:
+    """The lease that prevents overlapping runs of a worker command."""
+    return Lease(
+        current_app.config["REDIS_CLIENT"],
+        run_lock_key(name),
+        current_app.config["WORKER_LOCK_TTL"],
+    )
+
+
+def shards_in_progress() -> bool:
+    """
+    If any shard is leased. A plain run takes its lease first and checks
+    this after, a sharded run the other way around, so they never overlap.
+    """
+    redis_client = current_app.config["REDIS_CLIENT"]
+    return next(redis_client.scan_iter(match=shard_lock_key("*")), None) is not None
+
+
+class HashRing:
+    """
+    Consistent hashing ring with virtual nodes, so adding a node
+    moves only about 1/N of the keys.
+    https://en.wikipedia.org/wiki/Consistent_hashing
+    """
+
+    def __init__(self, nodes: list[int], replicas: int = 100):
+        points = sorted(
+            (self._hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node(self, key: str) -> int:
+        """The first node clockwise from the key's position on the ring."""
+        i = bisect.bisect(self.hashes, self._hash(key)) % len(self.hashes)
+        return self.nodes[i]
+
+
+class Shard:
+    """One part of the catalog, the whole catalog if it's the only shard."""
+
+    def __init__(self, index: int = 0, count: int = 1, lease: Lease | None = None):
+        self.index = index
+        self.count = count
+        self.lease = lease
+        self.ring = HashRing(list(range(count)))
+        self.buckets = [
+            bucket
+            for bucket in range(NUM_BUCKETS)
+            if self.ring.node(f"bucket:{bucket}") == index
+        ]
+
+    @property
+    def name(self) -> str:
+        return f"{self.index + 1}/{self.count}"
+
+    def owns_playlist(self, playlist_id: str) -> bool:
+        return self.count == 1 or self.ring.node(playlist_id) == self.index
+
+    def posts(self):
+        """SQL filter for the posts of this shard."""
+        if self.count == 1:
+            return db.true()
+        return (Post.id % NUM_BUCKETS).in_(self.buckets)
+
+    def mark_done(self) -> None:
+        """
+        Leave the shard alone for the cooldown, the next run will take it,
+        and leave the catalog wide work pending.
+        """
+        redis_client = current_app.config["REDIS_CLIENT"]
+        cooldown = current_app.config["WORKER_SHARD_COOLDOWN"]
+        pipe = redis_client.pipeline()
+        pipe.setex(shard_done_key(self.index), cooldown, 1)
+        pipe.set(CATALOG_PENDING_KEY, 1)
+        pipe.execute()
+
+
+def shard_done_key(index: int) -> str:
+    return f"worker:shard:{index}:done"
+
+
+def claim_shard(exclude: set[int]) -> Shard | None:
+    """
+    Take the lease of a shard which isn't leased by another instance
+    and isn't processed recently. A shard whose holder died is taken over
+    when its lease expires, the run journal resumes its work.
+    None while a plain (not sharded) run is in progress.
+    """
+    redis_client = current_app.config["REDIS_CLIENT"]
+    count = current_app.config["WORKER_SHARDS"]
+    ttl = current_app.config["WORKER_LOCK_TTL"]
+
+    for index in range(count):
+        if index in exclude or redis_client.exists(shard_done_key(index)):
+            continue
+        lease = Lease(redis_client, shard_lock_key(index), ttl)
+        if not lease.acquire():
+            continue
+        # a plain run processes the whole catalog
+        if redis_client.exists(run_lock_key("run")):
+            lease.release()
+            return None
+        # the previous holder could have finished it in the meantime
+        if redis_client.exists(shard_done_key(index)):
+            lease.release()
+            continue
+        return Shard(index, count, lease)
+
+    return None
+
+
+def claim_catalog() -> Lease | None:
+    """
+    Take the lease of the catalog wide work (the related posts,
+    the cache warming) once every shard of the cycle is done,
+    so only one instance does it, after the last shard.
+    None if a shard isn't done yet, if the work isn't pending
+    or if another instance is doing it.
+    """
+    redis_client = current_app.config["REDIS_CLIENT"]
+    count = current_app.config["WORKER_SHARDS"]
+
+    if not all(redis_client.exists(shard_done_key(index)) for index in range(count)):
+        return None
+    lease = run_lock("catalog")
+    if not lease.acquire():
+        return None
+    # taken, a shard done in the meantime leaves it pending again
+    if not redis_client.delete(CATALOG_PENDING_KEY):
+        lease.release()
+        return None
+    return lease
+
+
+def mark_catalog_pending() -> None:
+    """Leave the catalog wide work to the next instance, e.g. if it failed."""
+    current_app.config["REDIS_CLIENT"].set(CATALOG_PENDING_KEY, 1)
+
+
+class LeaseNotAcquiredError(Exception):
+    pass
+
+
+class LeaseLostError(Exception):
+    pass
@@ -1,19 +1,45 @@
+import os
+import json
+import math
+import hashlib
+import threading
+from queue import Queue, Full
+from typing import Callable, Iterator
+from collections import Counter, defaultdict
 from pydantic import BaseModel
+from datetime import datetime, timezone
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from wtforms.validators import ValidationError
 from sqlalchemy.orm.exc import ObjectDeletedError
 from sqlalchemy.exc import IntegrityError, StatementError
 
-from flask import current_app
+from flask import Flask, current_app
 
 from app import db
+from app.caching import invalidate
 from app.helpers import youtube_build
-from app.posts.helpers import validate_video
-from app.models import Post, Playlist, Category
-from app.sources.helpers import validate_playlist
+from app.posts.helpers import validate_video, fetch_video_data
+from app.websub.helpers import PENDING_KEY, ATTEMPTS_KEY
+from app.models import Post, PostLike, PostFave, Playlist, Category, DeletedPost
+from app.sources.helpers import fetch_playlists_metadata
+from app.cron.journal import RunJournal
+from app.cron.coordination import (
+    Shard,
+    claim_shard,
+    claim_catalog,
+    mark_catalog_pending,
+)
+from app.cron.classifier import CategoryClassifier
+from app.cron.similarity import SimilarityIndex, fingerprint
+from app.cron.warmer import warm_caches
 from app.cron.helpers import (
     retry,
+    is_retryable,
+    get_upstream,
+    log_api_usage,
     YouTubeAPI,
-    get_playlist_videos,
+    iter_playlist_videos,
+    SeenVideos,
     MaxRetriesExceededError,
 )
 
@@ -24,229 +50,976 @@ class Documentary(BaseModel):
     category: str
 
 
-def get_youtube_videos_from_playlists() -> tuple[list[dict], bool]:
-    all_videos, complete = [], []
-    # get all playlists from db
-    playlists = Playlist.query.all()
-    current_app.logger.info(f"Getting videos from {len(playlists)} YT sources...")
+# messages from the fetching threads to the ingesting thread
+PAGE, END, ERROR = "page", "end", "error"
 
-    # construct youtube API service
-    with youtube_build() as youtube:
 
-        # loop through the playlists
-        for playlist in playlists:
-            # refresh playlist thumbs
-            source_info = validate_playlist(playlist.playlist_id, youtube)
-            playlist.channel_thumbnails = source_info["channel_thumbnails"]
-            db.session.commit()
-
-            # get playlist VALID videos from YT
-            playlist_videos, done = get_playlist_videos(playlist.playlist_id, youtube)
-            # record bool value if all videos from this playlist are fetched
-            complete.append(done)
+def fetch_playlist(
+    app: Flask,
+    playlist_id: str,
+    banned: set[str],
+    out: Queue,
+    stop: threading.Event,
+    last_video_id: str | None = None,
+    last_published_at: datetime | None = None,
+) -> None:
+    """
+    Fetch the VALID videos of a single playlist.
+    Meant to run in a worker thread, so it pushes its own app context
+    and builds its own YouTube client (the client is not thread-safe).
+    Every page of videos is put in the bounded queue as soon as it's fetched,
+    which blocks while the ingesting thread is behind (backpressure).
+    The last message for the playlist is either END or ERROR.
 
-            # loop through the videos in this playlist
-            for video in playlist_videos:
-                # add relationship with this playlist to the video metadata
-                video["playlist"] = playlist
-            # add this batch of videos to the total list of videos
-            all_videos += playlist_videos
+    Parameters:
+    app (Flask): The app object.
+    playlist_id (str): YouTube playlist id.
+    banned (set): Ids of the deleted (banned) videos.
+    out (Queue): The queue to the ingesting thread.
+    stop (Event): Set if the ingesting thread gave up.
+    last_video_id (str): Last seen video id, if incremental sync.
+    last_published_at (datetime): Newest publish date, if incremental sync.
+    """
 
-    # remove duplicates if any
-    all_videos = list({v["video_id"]: v for v in all_videos}.values())
-    # sort by upload date
-    all_videos = sorted(all_videos, key=lambda d: d["upload_date"])
+    def put(message: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(message, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
 
-    return all_videos, all(complete)
+    try:
+        with app.app_context(), youtube_build() as youtube:
+            # get playlist VALID videos from YT, page by page
+            pages = iter_playlist_videos(
+                playlist_id, youtube, last_video_id, last_published_at, banned
+            )
+            while True:
+                try:
+                    videos = next(pages)
+                except StopIteration as done:
+                    put((END, playlist_id, done.value))
+                    return
+                if not put((PAGE, playlist_id, videos)):
+                    return
+    except Exception as e:
+        put((ERROR, playlist_id, e))
 
 
-def revalidate_single_video(post: Post) -> bool:
+def ingest_playlists(
+    playlists: list[Playlist], journal: RunJournal | None = None
+) -> Counter:
     """
-    Check if the video satisfies the posting criteria.
-    Delete from database if it doesn't. Return True.
-    Otherwise return False.
+    Stream the VALID videos from the playlists into the database:
+    page, validate and normalize in the fetching threads,
+    dedupe and upsert in this thread, so the writes start while fetching
+    is still going on and the memory doesn't grow with the catalog.
+    The queue between the stages and the dedupe window are bounded.
+
+    The only ordering that matters is per playlist: its sync state
+    (watermarks, full scan time) moves on only after all its videos
+    are committed. Playlists which are due for a full scan are paged through
+    entirely and their posts missing at YouTube are revalidated,
+    the rest are synced incrementally up to their watermarks.
+    If a run journal is supplied, the playlists done earlier in the run
+    are skipped and the stats are added to it.
 
     Parameters:
-    post (Post): The post sqlalcheymy object.
+    playlists (list[Playlist]): The playlists to ingest.
+    journal (RunJournal): The journal of the current run.
 
     Returns:
-    bool: True of deleted, otherwise False.
+    Counter: Numbers of fetched videos, new, updated and deleted posts.
+    """
+    stats = Counter()
+    done_playlists = journal.done_playlists() if journal else set()
+    pending = {pl.playlist_id: pl for pl in playlists}
+    pending = {k: v for k, v in pending.items() if k not in done_playlists}
+    current_app.logger.info(f"Getting videos from {len(pending)} YT sources...")
+
+    # the real app object, the proxy can't be passed to other threads
+    app = current_app._get_current_object()  # type: ignore
+    max_workers = current_app.config["WORKER_CONCURRENCY"]
+    interval = current_app.config["WORKER_FULL_SCAN_INTERVAL"]
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
+
+    # playlists that need reconciliation scan, the others are synced incrementally
+    full_scans = {k for k, pl in pending.items() if pl.needs_full_scan(interval)}
+    # load the banned videos ids once, instead of a query per video
+    banned = set(db.session.execute(db.select(DeletedPost.video_id)).scalars())
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    out = Queue(maxsize=current_app.config["WORKER_QUEUE_SIZE"])
+    stop = threading.Event()
+    seen = SeenVideos(current_app.config["WORKER_DEDUPE_SIZE"])
+    # ids of the fetched videos of the playlists being fully scanned
+    fetched_ids: dict[str, set[str]] = defaultdict(set)
+    # newest fetched video of each playlist being fetched (upload date, video id)
+    newest: dict[str, tuple[datetime, str]] = {}
+    fetched: Counter = Counter()
+    batch: list[dict] = []
+
+    def flush() -> None:
+        new, updated = upsert_videos(batch, pending)
+        batch.clear()
+        stats.update(new=new, updated=updated)
+        if journal:
+            journal.add_stats(new=new, updated=updated)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for playlist_id, playlist in pending.items():
+            args = [app, playlist_id, banned, out, stop]
+            if playlist_id not in full_scans:
+                args += [playlist.last_video_id, playlist.last_published_at]
+            executor.submit(fetch_playlist, *args)
+
+        try:
+            remaining = len(pending)
+            while remaining:
+                kind, playlist_id, payload = out.get()
+
+                if kind == PAGE:
+                    fetched[playlist_id] += len(payload)
+                    for video in payload:
+                        if playlist_id in full_scans:
+                            fetched_ids[playlist_id].add(video["video_id"])
+                        mark = (video["upload_date"], video["video_id"])
+                        newest[playlist_id] = max(newest.get(playlist_id, mark), mark)
+                        # a video can be in more than one playlist
+                        if seen.add(video["video_id"]):
+                            batch.append(video)
+                    if len(batch) >= batch_size:
+                        flush()
+                    continue
+
+                remaining -= 1
+                mark = newest.pop(playlist_id, None)
+                playlist_fetched_ids = fetched_ids.pop(playlist_id, set())
+                count_fetched = fetched.pop(playlist_id, 0)
+
+                if kind == ERROR:
+                    # one failing playlist should not break the whole run
+                    msg = f"Could not fetch playlist {playlist_id}. Error: {payload}"
+                    current_app.logger.warning(msg)
+                    continue
+
+                # the playlist's videos must be saved before its sync state moves on
+                flush()
+                done, playlist = payload, pending[playlist_id]
+                count_deleted = 0
+
+                # advance the watermarks only if nothing new was missed
+                if done and mark:
+                    upload_date, video_id = mark
+                    if (
+                        not playlist.last_published_at
+                        or upload_date >= playlist.last_published_at
+                    ):
+                        playlist.last_video_id = video_id
+                        playlist.last_published_at = upload_date
+
+                # the playlist was scanned from top to bottom,
+                # revalidate its posts which were not fetched from YT
+                if done and playlist_id in full_scans:
+                    count_deleted = delete_missing_videos(
+                        playlist_id, playlist_fetched_ids
+                    )
+                    playlist.last_full_scan = now
+
+                # save the sync state
+                commit_batch()
+                stats.update(fetched=count_fetched, deleted=count_deleted)
+                if journal:
+                    journal.mark_playlist_done(
+                        playlist_id, fetched=count_fetched, deleted=count_deleted
+                    )
+        finally:
+            # let the fetching threads go if this thread gave up
+            stop.set()
 
+    return stats
+
+
+def refresh_playlists_metadata(playlists: list[Playlist]) -> int:
     """
-    try:
-        with youtube_build() as youtube:
-            api = YouTubeAPI(youtube)
+    Refresh the metadata of the playlists and their channels
+    if older than SOURCE_METADATA_TTL, with one playlists.list
+    and one channels.list call per 50 playlists.
+    All the changes are saved in one transaction.
+    Return the number of refreshed playlists.
+    """
+    ttl = current_app.config["SOURCE_METADATA_TTL"]
+    stale = [pl for pl in playlists if pl.needs_metadata_refresh(ttl)]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    count = 0
+
+    with youtube_build() as youtube:
+        for i in range(0, len(stale), 50):
+            batch = stale[i : i + 50]
+            try:
+                # this will raise MaxRetriesExceededError if unsuccessful
+                playlist_ids = [pl.playlist_id for pl in batch]
+                metadata = fetch_playlists_metadata(playlist_ids, youtube)
+            except MaxRetriesExceededError:
+                # try these on the next run
+                continue
+
+            for playlist in batch:
+                # the playlist is gone from YouTube, its videos will be revalidated
+                if not (info := metadata.get(playlist.playlist_id)):
+                    continue
+                # write only the changed values
+                for key, value in info.items():
+                    if getattr(playlist, key) != value:
+                        setattr(playlist, key, value)
+                playlist.metadata_refreshed_at = now
+                count += 1
+
+    commit_batch()
+    return count
+
+
+def revalidate_videos(posts: list[Post]) -> set[str]:
+    """
+    Check if the videos still satisfy the posting criteria,
+    50 videos (the API maximum) per YouTube API call with one API client.
+    Delete from database the posts whose videos are not valid
+    or don't exist at YouTube anymore.
+
+    Parameters:
+    posts (list[Post]): The post sqlalchemy objects.
+
+    Returns:
+    set[str]: Video ids of the deleted posts.
+    """
+    invalid = []
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
 
+    with youtube_build() as youtube:
+        api = YouTubeAPI(youtube)
+
+        for i in range(0, len(posts), 50):
+            batch = posts[i : i + 50]
             scope = {
-                "id": post.video_id,
+                "id": [post.video_id for post in batch],
                 "part": ["status", "snippet", "contentDetails"],
             }
-            # this will raise MaxRetriesExceededError if unsuccessful
-            res = api.get_videos(scope)
 
-        # this will raise ValueError or IndexError
-        res = res["items"][0]
+            try:
+                # this will raise MaxRetriesExceededError if unsuccessful
+                res = api.get_videos(scope)
+                # this will raise KeyError if unable to access "items"
+                items = {item["id"]: item for item in res["items"]}
+            except (MaxRetriesExceededError, KeyError):
+                # we couldn't connect to YouTube API,
+                # so we can't evaluate these videos
+                continue
+
+            for post in batch:
+                try:
+                    # video absent from response doesn't exist at YouTube (KeyError)
+                    # this will raise ValidationError if video's invalid
+                    validate_video(items[post.video_id])
+                    post.last_checked_at = now
+                except (KeyError, ValidationError):
+                    invalid.append(post)
+
+    # delete the invalid posts and save the check times of the valid ones
+    deleted = delete_posts(invalid)
+    commit_batch()
+
+    return deleted
+
+
+def delete_posts(posts: list[Post]) -> set[str]:
+    """
+    Delete the posts in one transaction. If that fails fall back
+    to a transaction per post. Return the video ids of the deleted posts.
+    """
+    if not posts:
+        return set()
 
-        # this will raise ValidationError if video's invalid
-        validate_video(res)
+    video_ids = {post.video_id for post in posts}
+    try:
+        for post in posts:
+            db.session.delete(post)
+        db.session.commit()
+        return video_ids
+    except (ObjectDeletedError, StatementError):
+        db.session.rollback()
 
-    # video is not validated or doesn't exist at YouTube
-    except (IndexError, ValueError, ValidationError):
+    deleted = set()
+    for post in posts:
         try:
+            video_id = post.video_id
             db.session.delete(post)
             db.session.commit()
-            return True
+            deleted.add(video_id)
         except (ObjectDeletedError, StatementError) as e:
             db.session.rollback()
             msg = f"Could not delete: {post.title.upper()}. Error: {e}"
             current_app.logger.warning(msg)
-    except MaxRetriesExceededError as e:
-        # we couldn't connect to YouTube API,
-        # so we can't evaluate the video
-        pass
 
-    return False
+    return deleted
 
 
-def process_videos() -> None:
-    # get all VALID videos from our playlists from YouTube
-    all_videos, complete = get_youtube_videos_from_playlists()
-
-    # get sources/playlists ids
-    sources = [pl.playlist_id for pl in Playlist.query.all()]
+def delete_missing_videos(playlist_id: str, fetched_ids: set[str]) -> int:
+    """
+    Revalidate the posts of a fully scanned playlist
+    which were not fetched from YouTube, those are probably gone.
+    Return the number of deleted posts.
+    """
+    posted = db.select(Post.id, Post.video_id).filter_by(playlist_id=playlist_id)
+    posted = db.session.execute(posted)
+    missing = [row.id for row in posted if row.video_id not in fetched_ids]
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
 
-    # delete missing videos if all VALID videos are fetched from YT
     count_deleted = 0
-    if complete:
-        fetched_ids = {video["video_id"] for video in all_videos}
-        posted = Post.query.filter(Post.playlist_id.in_(sources)).all()
-        posted_ids = {post.video_id for post in posted}
-        to_delete_ids = Post.video_id.in_(posted_ids - fetched_ids)
-        for post in Post.query.filter(to_delete_ids).all():
-            if revalidate_single_video(post):  # call to YT
-                count_deleted += 1
-
-    # get all possible categories in a string
-    categories = db.session.execute(db.select(Category)).scalars().all()
-    categories = {category.name: category for category in categories}
-    cat_prompt = ", ".join(categories).replace('"', "")
-    info = Documentary(title="", description="", category="")
+    for i in range(0, len(missing), batch_size):
+        batch = Post.query.filter(Post.id.in_(missing[i : i + batch_size])).all()
+        count_deleted += len(revalidate_videos(batch))  # calls to YT
+    return count_deleted
 
-    count_updated, count_new = 0, 0
-    for video in all_videos:  # loop through total number of videos
-        # if video is NOT already posted
-        if not (posted := Post.query.filter_by(video_id=video["video_id"]).first()):
 
-            # generate description and category for the video
-            try:
-                info = generate_info(video["title"], cat_prompt)
-            except MaxRetriesExceededError:
-                info = Documentary(title="", description="", category="")
+def upsert_videos(
+    videos: list[dict], playlists: dict[str, Playlist]
+) -> tuple[int, int]:
+    """
+    Insert the new videos and match the playlist of the already posted ones
+    in one transaction. The AI generated content is added later.
 
-            if info.description:
-                video["short_description"] = info.description
+    Parameters:
+    videos (list): The normalized videos.
+    playlists (dict): The playlists of the videos by their playlist ids.
 
-            # categorize the video
-            if info.category in categories:
-                video["category_id"] = categories[info.category].id
-                video["category"] = categories[info.category]
+    Returns:
+    tuple: Number of new posts, number of updated posts.
+    """
+    if not videos:
+        return 0, 0
 
-            # create object from Model
-            post = Post(**video)
-            try:
-                db.session.add(post)
-                db.session.commit()
-                count_new += 1
-            except IntegrityError:
-                db.session.rollback()
+    # load the already posted videos in one query
+    video_ids = [video["video_id"] for video in videos]
+    existing = Post.query.filter(Post.video_id.in_(video_ids)).all()
+    existing = {post.video_id: post for post in existing}
 
-            # start the loop over
+    new_posts, count_updated = [], 0
+    for video in videos:
+        # associate with the playlist in our db
+        playlist = playlists[video["playlist_id"]]
+        # if video is NOT already posted
+        if not (posted := existing.get(video["video_id"])):
+            # create object from Model,
+            # the AI generated content is added in the enrichment stage
+            # by the key, a backref append would flush the post too early
+            new_posts.append(Post(**video, playlist_db_id=playlist.id))
             continue
 
-        is_updated = False
-        try:
-            # if it doesn't match the playlist id
-            if posted.playlist_id != video["playlist_id"]:
-                # match playlist id
-                posted.playlist_id = video["playlist_id"]
-                # associate with existing playlist in our db
-                posted.playlist = video["playlist"]
-                is_updated = True
-
-            # update AI generated content if missing
-            if not posted.short_description or not posted.category:
-                try:
-                    info = generate_info(posted.title, cat_prompt)
-                except MaxRetriesExceededError:
-                    info = Documentary(title="", description="", category="")
+        # if it doesn't match the playlist id, match it
+        if posted.playlist_id != video["playlist_id"]:
+            posted.playlist_id = video["playlist_id"]
+            posted.playlist = playlist
+            count_updated += 1
 
-            if not posted.short_description and info.description:
-                posted.short_description = info.description
-                is_updated = True
+    # insert the new posts and the pending updates in one transaction
+    count_new = save_posts(new_posts)
+    commit_batch()
 
-            if not posted.category and info.category in categories:
-                posted.category_id = categories[info.category].id
-                posted.category = categories[info.category]
-                is_updated = True
-        finally:
-            # If no pending changes are detected,
-            # then no SQL is emitted to the database
-            # https://docs.sqlalchemy.org/en/20/orm/session_basics.html#committing
-            db.session.commit()
-            if is_updated:
-                count_updated += 1
+    return count_new, count_updated
 
-    # get orphan videos (not attached to any source/playlist)
-    orphan_posts = (Post.playlist_id == None) | (Post.playlist_id.not_in(sources))
-    orphan_posts = Post.query.filter(orphan_posts).all()
 
-    # revalidate orphan videos (not attached to any source/playlist)
-    for post in orphan_posts:
-        if revalidate_single_video(post):  # call to YT
-            count_deleted += 1
-            continue
+def process_videos(
+    fresh: bool = False, shard: Shard | None = None, whole_catalog: bool = True
+) -> None:
+    """
+    Sync the posts with the playlists at YouTube, revalidate the orphan posts,
+    generate the missing AI content, precompute the related posts
+    and refresh the search index.
+    Every phase (playlists ingest, orphan revalidation, enrichment, reindex)
+    checkpoints its progress in the run journal,
+    so an interrupted run resumes where it stopped, unless `fresh`.
 
-        is_updated = False
-        try:
-            # update AI generated content if missing
-            if not post.short_description or not post.category:
-                try:
-                    info = generate_info(post.title, cat_prompt)
-                except MaxRetriesExceededError:
-                    info = Documentary(title="", description="", category="")
+    Parameters:
+    fresh (bool): Discard the checkpoints of an interrupted run.
+    shard (Shard): Process only this part of the catalog, all if not supplied.
+    whole_catalog (bool): Precompute the related posts and warm the caches,
+    the sharded runs do it once after all of their shards.
+    """
+    shard = shard or Shard()
+    key = "worker:journal" if shard.count == 1 else f"worker:journal:{shard.index}"
+    journal = RunJournal.from_app(key, shard.lease)
+    if shard.count > 1:
+        current_app.logger.info(f"Processing shard {shard.name}...")
+    if started_at := journal.start(fresh):
+        current_app.logger.info(f"Resuming the run started at {started_at}.")
 
-            if not post.short_description and info.description:
-                post.short_description = info.description
-                is_updated = True
+    # stream the VALID (new) videos from our playlists from YouTube into the db,
+    # the playlists done before an interruption are skipped
+    playlists = Playlist.query.all()
+    sources = [pl.playlist_id for pl in playlists]
+    playlists = [pl for pl in playlists if shard.owns_playlist(pl.playlist_id)]
+    if not journal.is_done("ingest"):
+        refresh_playlists_metadata(playlists)
+        ingest_playlists(playlists, journal)
+        journal.mark_done("ingest")
 
-            # if the video is not categorized, do it
-            if not post.category and info.category in categories:
-                post.category_id = categories[info.category].id
-                post.category = categories[info.category]
-                is_updated = True
-        finally:
-            db.session.commit()
-            if is_updated:
-                count_updated += 1
+    # get all possible categories
+    categories = db.session.execute(db.select(Category)).scalars().all()
+    categories = {category.name: category for category in categories}
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
+
+    # orphan videos (not attached to any source/playlist)
+    orphans = (Post.playlist_id == None) | (Post.playlist_id.not_in(sources))
+    orphans &= shard.posts()
+
+    # revalidate only the most overdue orphan videos within the budget,
+    # the checked ones drop to the bottom, so a resumed run continues with the rest
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # each shard gets its part of the budget
+    budget = math.ceil(current_app.config["WORKER_REVALIDATION_BUDGET"] / shard.count)
+    budget -= (count_checked := journal.cursor("revalidate"))
+    overdue = Post.query.filter(orphans)
+    overdue = overdue.order_by(Post.revalidation_priority(now).desc())
+    for batch in query_in_batches(overdue.limit(max(budget, 0)), batch_size):
+        deleted = len(revalidate_videos(batch))  # calls to YT
+        count_checked += len(batch)
+        journal.checkpoint("revalidate", count_checked, deleted=deleted)
+
+    # generate the missing AI content for all the posts (including the new ones),
+    # in the order of their ids, the cursor is the last enriched id
+    missing_info = (Post.short_description == None) | (Post.category_id == None)
+    classifier = train_classifier()
+    missing_info = Post.query.filter(missing_info, shard.posts())
+    missing_info = missing_info.filter(Post.id > journal.cursor("enrich"))
+    enrich_posts(
+        missing_info,
+        categories,
+        classifier,
+        checkpoint=lambda last_id, updated: journal.checkpoint(
+            "enrich", last_id, updated=updated
+        ),
+    )
+
+    # precompute the related posts of the new and changed posts
+    if whole_catalog and not journal.is_done("similar"):
+        update_similar_posts()
+        journal.mark_done("similar")
+
+    # refresh the search index documents, in the order of the ids
+    reindex = Post.query.filter(shard.posts(), Post.id > journal.cursor("reindex"))
+    for batch in query_in_batches(reindex, batch_size):
+        for post in batch:
+            post.add_to_index()
+        journal.checkpoint("reindex", max(post.id for post in batch))
+
+    if whole_catalog:
+        warm_caches()
 
     # singular or plural
     vs = lambda num: "video" if num == 1 else "videos"
 
-    # log the processing stats
-    total_videos = len(all_videos) + len(orphan_posts)
+    # log the processing stats of the whole run
+    stats = journal.stats()
+    count_new, count_deleted = stats.get("new", 0), stats.get("deleted", 0)
+    count_updated = stats.get("updated", 0)
+    total_videos = stats.get("fetched", 0) + count_checked
     current_app.logger.info(f"Processed {total_videos} {vs(total_videos)}.")
     current_app.logger.info(f"Added {count_new} new {vs(count_new)}.")
     current_app.logger.info(f"Deleted {count_deleted} invalid {vs(count_deleted)}.")
     current_app.logger.info(f"Updated {count_updated} current {vs(count_updated)}.")
+    log_api_usage()
+    journal.finish()
     current_app.logger.info("Worker job done.")
     current_app.logger.info("-" * 40)
 
 
-@retry(start_delay=1)
-def generate_info(title: str, categories: str) -> Documentary:
+def process_shards(fresh: bool = False) -> int:
+    """
+    Process the shards of the catalog which are not leased
+    by other worker instances and not processed recently,
+    one at a time, each under its lease. The instance which finds all the shards
+    done updates the related posts and warms the caches.
+    Return the number of processed shards.
+    """
+    processed = set()
+    while shard := claim_shard(exclude=processed):
+        processed.add(shard.index)
+        with shard.lease:  # type: ignore
+            process_videos(fresh, shard, whole_catalog=False)
+            shard.mark_done()
+    # the related posts and the caches span the whole catalog,
+    # one instance updates them once per cycle, after the last shard
+    if lease := claim_catalog():
+        with lease:
+            try:
+                update_similar_posts()
+                warm_caches()
+            except Exception:
+                mark_catalog_pending()
+                raise
+    return len(processed)
+
+
+def ingest_pending_videos() -> None:
+    """
+    Ingest the videos notified by the WebSub hub, through the same
+    validate_video and fetch_video_data path as the playlist scans.
+    A notification covers every upload of a channel, so the video
+    is posted only if it's in the channel's source playlist.
+    """
+    redis_client = current_app.config["REDIS_CLIENT"]
+    pending = redis_client.hgetall(PENDING_KEY)
+    # video id -> channel id
+    pending = {key.decode(): value.decode() for key, value in pending.items()}
+    if not pending:
+        return
+
+    channels = set(pending.values())
+    playlists = Playlist.query.filter(Playlist.channel_id.in_(channels)).all()
+    playlists = {playlist.channel_id: playlist for playlist in playlists}
+    posted = db.select(Post.video_id).filter(Post.video_id.in_(pending))
+    skip = set(db.session.execute(posted).scalars())
+    banned = db.select(DeletedPost.video_id).filter(DeletedPost.video_id.in_(pending))
+    skip |= set(db.session.execute(banned).scalars())
+
+    # the already posted, banned and not our sources' videos are done
+    done = {vid for vid, channel_id in pending.items() if channel_id not in playlists}
+    done |= skip
+    video_ids = [vid for vid in pending if vid not in done]
+
+    new_posts, failed = [], set()
+    with youtube_build() as youtube:
+        api = YouTubeAPI(youtube)
+
+        for i in range(0, len(video_ids), 50):
+            batch = video_ids[i : i + 50]
+            scope = {"id": batch, "part": ["status", "snippet", "contentDetails"]}
+            try:
+                # this will raise MaxRetriesExceededError if unsuccessful
+                items = api.get_videos(scope)["items"]
+            except (MaxRetriesExceededError, KeyError):
+                # leave them pending, try again on the next run
+                failed.update(batch)
+                continue
+            for item in items:
+                video_id = item.get("id")
+                try:
+                    playlist = playlists[pending[video_id]]
+                    # this will raise ValidationError if video's invalid
+                    validate_video(item)
+                    if not in_playlist(api, playlist.playlist_id, video_id):
+                        continue
+                    video = fetch_video_data(item, playlist_id=playlist.playlist_id)
+                    video["playlist_db_id"] = playlist.id
+                    new_posts.append(Post(**video))
+                except ValidationError:
+                    continue
+                except MaxRetriesExceededError:
+                    # leave it pending, try again on the next run
+                    failed.add(video_id)
+                except KeyError as e:
+                    # a malformed item won't get any better, drop it
+                    msg = f"Could not ingest notified video {video_id}. Error: {e}"
+                    current_app.logger.warning(msg)
+            # the videos not returned are unavailable, done with them too
+            done.update(vid for vid in batch if vid not in failed)
+
+    # give up on the videos failing over and over
+    if failed := sorted(failed):
+        pipe = redis_client.pipeline()
+        for video_id in failed:
+            pipe.hincrby(ATTEMPTS_KEY, video_id, 1)
+        attempts = pipe.execute()
+        max_attempts = current_app.config["WEBSUB_MAX_ATTEMPTS"]
+        given_up = {vid for vid, n in zip(failed, attempts) if n >= max_attempts}
+        if given_up:
+            msg = f"Gave up on {len(given_up)} notified videos, failed {max_attempts}x."
+            current_app.logger.warning(msg)
+            done |= given_up
+
+    count_new = save_posts(new_posts)
+    video_ids = [post.video_id for post in new_posts]
+    commit_batch()
+
+    if done:
+        redis_client.hdel(PENDING_KEY, *done)
+        redis_client.hdel(ATTEMPTS_KEY, *done)
+
+    # generate the AI content for the new posts
+    categories = db.session.execute(db.select(Category)).scalars().all()
+    categories = {category.name: category for category in categories}
+    new_posts = Post.query.filter(Post.video_id.in_(video_ids))
+    enrich_posts(new_posts, categories, train_classifier())
+
+    msg = f"Added {count_new} of {len(pending)} notified videos."
+    current_app.logger.info(msg)
+    log_api_usage()
+
+
+def in_playlist(api: YouTubeAPI, playlist_id: str, video_id: str) -> bool:
+    """Check if a video is in a playlist."""
+    # the channel's uploads playlist has every video of the channel
+    if playlist_id.startswith("UU"):
+        return True
+    scope = {"playlistId": playlist_id, "videoId": video_id, "part": "id"}
+    try:
+        return bool(api.get_playlist_videos(scope)["items"])
+    except (MaxRetriesExceededError, KeyError):
+        return False
+
+
+def query_in_batches(query, batch_size: int) -> Iterator[list[Post]]:
+    """
+    Yield the posts of a query in batches with one query per batch.
+    Only the ids are loaded upfront, so the posts of each batch are loaded
+    fresh after the previous batch's commit expired the session objects.
+    The batches go in the order of the ids.
+    """
+    ids = sorted(row.id for row in query.with_entities(Post.id))
+    for i in range(0, len(ids), batch_size):
+        yield Post.query.filter(Post.id.in_(ids[i : i + batch_size])).all()
+
+
+def classifier_path() -> str:
+    return os.path.join(current_app.instance_path, "category_classifier.npz")
+
+
+def train_classifier() -> CategoryClassifier:
+    """
+    Load the category classifier from disk and train it incrementally
+    on the posts categorized by Gemini or an admin it hasn't learned from yet,
+    never on its own predictions. If an admin changed the category
+    of a learned post, the classifier is trained again from scratch.
+    Save it back to disk if it learned something new.
+    """
+    classifier = CategoryClassifier.load(path := classifier_path())
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
+
+    # the trusted categories of the posts
+    labelled = db.select(Post.id, Post.category_id).filter(
+        Post.category_id != None, Post.category_source.in_(("gemini", "admin"))
+    )
+    labels = dict(db.session.execute(labelled).all())
+
+    # the old counts of a recategorized post can't be taken back
+    if classifier.relabelled(labels):
+        classifier = CategoryClassifier(classifier.n_features, classifier.alpha)
+        current_app.logger.info("Retraining the category classifier.")
+
+    # ids of the categorized posts not learned yet
+    ids = sorted(set(labels) - set(classifier.trained))
+
+    for i in range(0, len(ids), batch_size):
+        rows = db.session.execute(
+            db.select(Post.id, Post.title, Post.tags, Post.category_id).filter(
+                Post.id.in_(ids[i : i + batch_size])
+            )
+        )
+        for row in rows:
+            text = f"{row.title} {row.tags or ''}"
+            classifier.partial_fit(row.id, text, row.category_id)
+
+    if ids:
+        classifier.save(path)
+        msg = f"Category classifier learned from {len(ids)} new posts."
+        current_app.logger.info(msg)
+
+    return classifier
+
+
+def classify_post(
+    post: Post, classifier: CategoryClassifier, categories: dict[int, Category]
+) -> bool:
+    """
+    Categorize the post locally if the classifier is trained enough
+    and confident enough. Changes are left pending in the session.
+    Return True if categorized.
+    """
+    if classifier.num_docs < current_app.config["CLASSIFIER_MIN_DOCS"]:
+        return False
+
+    category_id, probability = classifier.predict(f"{post.title} {post.tags or ''}")
+    if category_id not in categories:
+        return False
+    if probability < current_app.config["CLASSIFIER_THRESHOLD"]:
+        return False
+
+    post.category_id = category_id
+    post.category = categories[category_id]
+    post.category_source = "classifier"
+    return True
+
+
+def update_similar_posts() -> int:
+    """
+    Precompute the related posts of the new and changed posts
+    by TF-IDF cosine similarity over the title, tags and short description,
+    along with the posts they are related to, whose lists may now include them,
+    and the posts whose lists include deleted posts.
+    The results are written back one commit per batch.
+    Return the number of updated posts.
+    """
+    num_related = current_app.config["NUM_RELATED_POSTS"]
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
+
+    query = db.select(
+        Post.id,
+        Post.title,
+        Post.tags,
+        Post.short_description,
+        Post.similar,
+        Post.similar_fingerprint,
+    )
+    docs, changed, related = {}, [], {}
+    for row in db.session.execute(query):
+        docs[row.id] = f"{row.title} {row.tags or ''} {row.short_description or ''}"
+        related[row.id] = row.similar or []
+        if fingerprint(docs[row.id]) != row.similar_fingerprint:
+            changed.append(row.id)
+
+    # the lists pointing at the deleted posts
+    stale = [i for i, similar in related.items() if set(similar) - docs.keys()]
+    if not changed and not stale:
+        return 0
+
+    index = SimilarityIndex(docs)
+    affected = set(changed) | set(stale)
+    for post_id in changed:
+        affected.update(index.most_similar(post_id, num_related))
+
+    ids = sorted(affected)
+    for i in range(0, len(ids), batch_size):
+        posts = Post.query.filter(Post.id.in_(ids[i : i + batch_size])).all()
+        for post in posts:
+            post.similar = index.most_similar(post.id, num_related)
+            post.similar_fingerprint = fingerprint(docs[post.id])
+        commit_batch()
+
+    current_app.logger.info(f"Updated the related posts of {len(ids)} posts.")
+    return len(ids)
+
+
+def enrich_posts(
+    query,
+    categories: dict[str, Category],
+    classifier: CategoryClassifier | None = None,
+    generate_content: Callable | None = None,
+    checkpoint: Callable | None = None,
+) -> int:
+    """
+    Generate the missing short descriptions and categories for the posts
+    of a query. If a classifier is supplied, the posts it can confidently
+    categorize get their category locally and skip Gemini
+    unless they also need a description. The calls to Gemini run
+    concurrently under a token bucket matching the model's
+    requests-per-minute limit (GEMINI_RPM),
+    and the results are written back one commit per batch.
+
+    Parameters:
+    query (Query): Query of the posts to enrich.
+    categories (dict): Category objects by name.
+    classifier (CategoryClassifier): Local category classifier.
+    generate_content (Callable): The Gemini `generate_content` partial, if
+    not supplied the one from the app config is used.
+    checkpoint (Callable): Called after each commit with the batch's
+    last post id and number of updated posts.
+
+    Returns:
+    int: Number of updated posts.
+    """
+    # the real app object, the proxy can't be passed to other threads
+    app = current_app._get_current_object()  # type: ignore
+    generate_content = generate_content or current_app.config["generate_content"]
+    max_workers = current_app.config["WORKER_CONCURRENCY"]
+    batch_size = current_app.config["WORKER_BATCH_SIZE"]
+    # sorted, the prompt is part of the generated info cache key
+    cat_prompt = ", ".join(sorted(categories)).replace('"', "")
+
+    def generate(title: str) -> tuple[Documentary, bool]:
+        with app.app_context():
+            return memoized_generate_info(title, cat_prompt, generate_content)
+
+    categories_by_id = {category.id: category for category in categories.values()}
+
+    updated, classified, hits, misses = set(), 0, 0, 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in query_in_batches(query, batch_size):
+            last_id, count_updated = max(post.id for post in batch), len(updated)
+
+            # categorize locally what the classifier is confident about
+            for post in batch:
+                if classifier and not post.category:
+                    if classify_post(post, classifier, categories_by_id):
+                        updated.add(post.id)
+                        classified += 1
+
+            # call Gemini only for what's still missing
+            batch = [p for p in batch if not p.short_description or not p.category]
+            futures = {executor.submit(generate, post.title): post for post in batch}
+            for future in as_completed(futures):
+                try:
+                    info, hit = future.result()
+                except MaxRetriesExceededError:
+                    misses += 1
+                    continue
+
+                if hit:
+                    hits += 1
+                else:
+                    misses += 1
+
+                if apply_generated_info(post := futures[future], info, categories):
+                    updated.add(post.id)
+
+            # save the updates for this batch
+            commit_batch()
+
+            if checkpoint:
+                checkpoint(last_id, len(updated) - count_updated)
+
+    current_app.logger.info(f"Categorized {classified} posts locally.")
+    current_app.logger.info(f"Generated info cache: {hits} hits, {misses} misses.")
+    return len(updated)
+
+
+def reconcile_counters() -> int:
+    """
+    Repair the drift of the posts' like and fave counters
+    by recounting the likes and faves, one UPDATE per counter
+    touching only the posts whose counter is off.
+    Return the number of repaired counters.
+    """
+    repaired = 0
+    for cls, counter in (
+        (PostLike, Post.like_count),
+        (PostFave, Post.fave_count),
+    ):
+        count = db.select(db.func.count()).where(cls.post_id == Post.id)
+        count = count.scalar_subquery()
+        update = db.update(Post).where(counter != count).values({counter: count})
+        update = update.execution_options(synchronize_session=False)
+        repaired += db.session.execute(update).rowcount
+
+    if repaired:
+        invalidate("likes")
+    db.session.commit()
+    current_app.logger.info(f"Repaired {repaired} like and fave counters.")
+    return repaired
+
+
+def generated_info_key(title: str, categories: str, model: str) -> str:
+    """
+    Redis key of a memoized Gemini output. Hash of the normalized title,
+    the categories prompt and the model name, so changing the model
+    or the set of categories invalidates the entries automatically.
+    """
+    title = " ".join(title.lower().split())
+    digest = hashlib.sha256(json.dumps([title, categories, model]).encode())
+    return f"generated_info:{digest.hexdigest()}"
+
+
+def memoized_generate_info(
+    title: str, categories: str, generate_content: Callable | None = None
+) -> tuple[Documentary, bool]:
+    """
+    Look up the memoized Gemini output in Redis before calling the API.
+    Memoize the output if it's not empty.
+
+    Returns:
+    tuple: The info, True if it was a cache hit.
+    """
+    redis_client = current_app.config["REDIS_CLIENT"]
+    key = generated_info_key(title, categories, current_app.config["GEMINI_MODEL"])
+
+    if cached := redis_client.get(key):
+        redis_client.hincrby("generated_info:stats", "hits", 1)
+        return Documentary.model_validate_json(cached), True
+
+    redis_client.hincrby("generated_info:stats", "misses", 1)
+    # this will raise MaxRetriesExceededError if unsuccessful
+    info = generate_info(title, categories, generate_content)
+
+    if info.description or info.category:
+        timeout = current_app.config["GENERATED_INFO_CACHE_TIMEOUT"]
+        redis_client.setex(key, timeout, info.model_dump_json())
+
+    return info, False
+
+
+def apply_generated_info(
+    post: Post, info: Documentary, categories: dict[str, Category]
+) -> bool:
+    """
+    Set the missing short description and/or category for a post.
+    Changes are left pending in the session. Return True if updated.
+    """
+    is_updated = False
+    if not post.short_description and info.description:
+        post.short_description = info.description
+        is_updated = True
+
+    # if the video is not categorized, do it
+    if not post.category and info.category in categories:
+        post.category_id = categories[info.category].id
+        post.category = categories[info.category]
+        post.category_source = "gemini"
+        is_updated = True
+
+    return is_updated
+
+
+def save_posts(posts: list[Post]) -> int:
+    """
+    Insert the posts with one multi-row INSERT inside a savepoint.
+    If that fails fall back to a savepoint per post, so one bad row
+    doesn't discard the whole batch. Return the number of inserted posts.
+    """
+    if not posts:
+        return 0
+
+    try:
+        with db.session.begin_nested():
+            db.session.add_all(posts)
+        return len(posts)
+    except IntegrityError:
+        pass
+
+    count = 0
+    for post in posts:
+        try:
+            with db.session.begin_nested():
+                db.session.add(post)
+            count += 1
+        except IntegrityError as e:
+            msg = f"Could not insert: {post.title.upper()}. Error: {e}"
+            current_app.logger.warning(msg)
+
+    return count
+
+
+def commit_batch() -> None:
+    """
+    Commit the pending changes of a batch.
+    If no pending changes are detected, then no SQL is emitted to the database
+    https://docs.sqlalchemy.org/en/20/orm/session_basics.html#committing
+    """
+    try:
+        db.session.commit()
+    except (IntegrityError, StatementError) as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not commit batch. Error: {e}")
+
+
+@retry(retryable=is_retryable)
+def generate_info(
+    title: str, categories: str, generate_content: Callable | None = None
+) -> Documentary:
     """
     Call to Gemini API.
     Generate description and a category from a generative AI based given a title and categories.
+    The call goes through the shared Gemini upstream guards.
     """
     prompt = (
         f'Write one short paragraph synopsis for the documentary "{title}".\n\n'
@@ -261,8 +1034,10 @@ def generate_info(title: str, categories: str) -> Documentary:
         f"from these categories: {categories}."
     )
 
-    generate_content = current_app.config["generate_content"]
-    response = generate_content(contents=prompt)
+    generate_content = generate_content or current_app.config["generate_content"]
+    response = get_upstream("gemini").call(
+        "models.generate_content", lambda: generate_content(contents=prompt)
+    )
 
     return (
         response.parsed
@@ -1,19 +1,53 @@
+import json
 import time
 import random
+import hashlib
 import functools
-from typing import Any, Callable
+import threading
+from datetime import datetime
+from typing import Any, Callable, Generator
+from collections import Counter, OrderedDict, defaultdict
 
+import httpx
+import httplib2
 from flask import current_app
 from wtforms.validators import ValidationError
 from app.posts.helpers import video_banned, validate_video, fetch_video_data
 
 
-def get_playlist_videos(playlist_id: str, youtube) -> tuple[list[dict], bool]:
-    # videos epmty list and first page token is None
-    videos, next_page_token, complete = [], None, False
+def iter_playlist_videos(
+    playlist_id: str,
+    youtube,
+    last_video_id: str | None = None,
+    last_published_at: datetime | None = None,
+    banned: set[str] | None = None,
+) -> Generator[list[dict], None, bool]:
+    """
+    Yield the VALID videos from a playlist, one page at a time,
+    so the caller holds only a page of videos in memory.
+    If a watermark (last seen video id and/or newest publish date) is provided
+    stop paging once a page reaches already known items (incremental sync).
+    The watermark holds only if the playlist lists its newest videos first,
+    the playlists in any other order (e.g. oldest first or sorted by hand)
+    are paged through entirely.
+    If a preloaded set of `banned` video ids is provided use it
+    instead of querying the database for every video.
+
+    Returns:
+    bool: True if all the new videos are fetched (the generator's return value).
+    """
+    # first page token is None
+    next_page_token, complete = None, False
+    # whether the playlist lists the newest videos first, known after the first page
+    newest_on_top = None
 
     api = YouTubeAPI(youtube)
 
+    # the watermark as YouTube formatted date string, comparable as a string
+    published_mark = (
+        last_published_at.strftime("%Y-%m-%dT%H:%M:%SZ") if last_published_at else None
+    )
+
     # iterate through all the items in the Uploads playlist
     while True:
         try:
@@ -47,10 +81,15 @@ def get_playlist_videos(playlist_id: str, youtube) -> tuple[list[dict], bool]:
 
         # loop through this batch of videos
         # if there are no videos res['items'] will be empty list
+        videos = []
         for item in items:
             try:
+                if banned is not None:
+                    is_banned = item["id"] in banned
+                else:
+                    is_banned = video_banned(item["id"])
                 # this will raise ValidationError if video's invalid
-                if validate_video(item) and not video_banned(item["id"]):
+                if validate_video(item) and not is_banned:
                     video_info = fetch_video_data(item, playlist_id=playlist_id)
                     videos.append(video_info)
             except ValidationError:
@@ -58,6 +97,18 @@ def get_playlist_videos(playlist_id: str, youtube) -> tuple[list[dict], bool]:
                 # continue, try the next video
                 continue
 
+        yield videos
+
+        if newest_on_top is None:
+            newest_on_top = newest_first(uploads["items"])
+
+        # stop paging if this page reached already known items
+        if newest_on_top and reached_watermark(
+            uploads["items"], last_video_id, published_mark
+        ):
+            complete = True
+            break
+
         # update the next page token
         next_page_token = uploads.get("nextPageToken")
 
@@ -66,15 +117,83 @@ def get_playlist_videos(playlist_id: str, youtube) -> tuple[list[dict], bool]:
             complete = True
             break
 
-    return videos, complete
+    return complete
+
+
+def newest_first(items: list[dict]) -> bool:
+    """Check if a page of playlist items is ordered by publish date, newest first."""
+    # deleted or private videos in the playlist have no publish date
+    dates = [item["contentDetails"].get("videoPublishedAt") for item in items]
+    dates = [date for date in dates if date]
+    return all(newer >= older for newer, older in zip(dates, dates[1:]))
+
+
+def reached_watermark(
+    items: list[dict], last_video_id: str | None, published_mark: str | None
+) -> bool:
+    """
+    Check if a page of playlist items reached the already synced items,
+    i.e. it contains the last seen video or no item newer than the watermark.
+    """
+    if not (last_video_id or published_mark):
+        return False
+
+    details = [item["contentDetails"] for item in items]
+    if last_video_id and any(d["videoId"] == last_video_id for d in details):
+        return True
+
+    # deleted or private videos in the playlist have no publish date
+    dates = [d["videoPublishedAt"] for d in details if d.get("videoPublishedAt")]
+    return bool(published_mark and dates and max(dates) <= published_mark)
+
+
+# the network errors of the YouTube (httplib2) and the Gemini (httpx) clients,
+# the socket errors and timeouts are OSErrors
+NETWORK_ERRORS = (OSError, httplib2.HttpLib2Error, httpx.TransportError)
+
+
+def status_code(error: Exception) -> int | None:
+    """
+    Get the HTTP status code of an API error if any.
+    Works with both Gemini and YouTube API client errors.
+    """
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(error, "resp", None), "status", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check if an API error is worth retrying, i.e. if it's a rate limit (429),
+    a server error (5xx) or a network error. Anything else (e.g. a parsing bug)
+    fails right away, as does an open circuit breaker.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if (code := status_code(error)) is None:
+        return isinstance(error, NETWORK_ERRORS)
+    return code == 429 or code >= 500
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """
+    Check if an API error means that the upstream is down or unusable,
+    i.e. it's a retryable error or the quota is exceeded (403).
+    """
+    return is_retryable(error) or status_code(error) == 403
 
 
 def retry(
     _func: Callable | None = None,
     start_delay: float = 0,
     max_retries: int = 5,
+    retryable: Callable[[Exception], bool] | None = None,
 ) -> Callable:
-    """Provide retry and error logging for an API call."""
+    """
+    Provide retry and error logging for an API call.
+    If `retryable` is supplied retry only the errors for which it returns True.
+    """
 
     def decorator(func: Callable) -> Callable:
 
@@ -86,24 +205,27 @@ def retry(
                 time.sleep(start_delay)
 
             retry_delay, last_exception = start_delay + 1, None
-            for _ in range(max_retries):
+            for attempt in range(1, max_retries + 1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
+                    # no point in retrying, or no retries left
+                    if (retryable and not retryable(e)) or attempt == max_retries:
+                        break
                     time.sleep(retry_delay)
                     retry_delay *= 2
                     retry_delay += random.uniform(0, 1)
 
             current_app.logger.exception(
-                f"All {max_retries} attempts failed for '{func.__name__}.\n"
+                f"All {attempt} attempts failed for '{func.__name__}.\n"
                 f"Args: {args}.\n"
                 f"Kwargs: {kwargs}.\n"
                 f"Original Error: {last_exception}."
             )
 
             raise MaxRetriesExceededError(
-                f"Operation '{func.__name__}' failed after {max_retries} retries.",
+                f"Operation '{func.__name__}' failed after {attempt} attempts.",
                 original_exception=last_exception,
                 func_name=func.__name__,
                 func_args=args,
@@ -115,27 +237,258 @@ def retry(
     return decorator(_func) if _func else decorator
 
 
+class SeenVideos:
+    """
+    Bounded set of the most recently seen video ids (LRU),
+    the oldest ids are forgotten once it's full.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.ids: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, video_id: str) -> bool:
+        """Remember the video id. Return True if it wasn't seen recently."""
+        if video_id in self.ids:
+            self.ids.move_to_end(video_id)
+            return False
+        self.ids[video_id] = None
+        if len(self.ids) > self.maxsize:
+            self.ids.popitem(last=False)
+        return True
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Tokens are added at `rate` tokens per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                # time until the next token is available
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+    After `threshold` consecutive failures the circuit opens and the calls
+    fail fast for `reset_timeout` seconds. Then one trial call is let through
+    (half-open), its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check if a call can go through."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # half-open, let one trial call through
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures, self.opened_at = 0, None
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """
+    Guards shared by all the clients of an upstream API:
+    a token bucket per endpoint, a circuit breaker and quota accounting.
+    """
+
+    def __init__(self, name: str, rate: float, threshold: int, reset_timeout: float):
+        self.name = name
+        self.rate = rate
+        self.breaker = CircuitBreaker(threshold, reset_timeout)
+        self.buckets: dict[str, TokenBucket] = {}
+        # endpoint -> {"calls": ..., "units": ..., "errors": ..., ...}
+        self.usage: dict[str, Counter] = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        with self.lock:
+            if endpoint not in self.buckets:
+                self.buckets[endpoint] = TokenBucket(rate=self.rate)
+            return self.buckets[endpoint]
+
+    def record(self, endpoint: str, **counts: int) -> None:
+        with self.lock:
+            self.usage[endpoint].update(counts)
+
+    def call(self, endpoint: str, func: Callable, units: int = 1) -> Any:
+        """
+        Make the API call through the circuit breaker and the endpoint's
+        token bucket, and account the quota units it costs.
+        """
+        if not self.breaker.allow():
+            self.record(endpoint, rejected=1)
+            msg = f"Circuit open for {self.name}, skipping {endpoint}."
+            raise CircuitOpenError(msg)
+
+        self.bucket(endpoint).acquire()
+
+        try:
+            result = func()
+        except Exception as e:
+            # the call still costs quota units
+            self.record(endpoint, calls=1, units=units, errors=1)
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            raise
+
+        self.record(endpoint, calls=1, units=units)
+        self.breaker.record_success()
+        return result
+
+    def summary(self) -> list[str]:
+        with self.lock:
+            return [
+                f"{self.name} {endpoint}: {c['calls']} calls, {c['units']} units, "
+                f"{c['not_modified']} not modified, {c['errors']} errors, "
+                f"{c['rejected']} rejected."
+                for endpoint, c in sorted(self.usage.items())
+            ]
+
+
+# the app-wide upstreams, shared between threads
+_upstreams: dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    """Get the shared guards of an upstream API ("youtube" or "gemini")."""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            config = current_app.config
+            rates = {
+                "youtube": config["YOUTUBE_RPS"],
+                "gemini": config["GEMINI_RPM"] / 60,
+            }
+            _upstreams[name] = Upstream(
+                name,
+                rate=rates[name],
+                threshold=config["API_FAILURE_THRESHOLD"],
+                reset_timeout=config["API_RESET_TIMEOUT"],
+            )
+        return _upstreams[name]
+
+
+def log_api_usage() -> None:
+    """Log the API calls and quota usage summary and reset the counters."""
+    with _upstreams_lock:
+        for upstream in _upstreams.values():
+            for line in upstream.summary():
+                current_app.logger.info(line)
+            with upstream.lock:
+                upstream.usage.clear()
+
+
 class YouTubeAPI:
     """Provides methods to fetch various resources from the YouTube API."""
 
+    # quota units per call
+    # https://developers.google.com/youtube/v3/determine_quota_cost
+    QUOTA_COSTS = {
+        "videos.list": 1,
+        "playlists.list": 1,
+        "channels.list": 1,
+        "playlistItems.list": 1,
+    }
+
     def __init__(self, youtube_resource):
         self.youtube = youtube_resource
+        self.upstream = get_upstream("youtube")
+        self.redis_client = current_app.config["REDIS_CLIENT"]
+        self.etag_timeout = current_app.config["YOUTUBE_ETAG_TIMEOUT"]
+
+    @staticmethod
+    def etag_key(endpoint: str, scope: dict) -> str:
+        """Redis key of a cached response, by endpoint and normalized scope."""
+        scope = json.dumps(scope, sort_keys=True, default=str)
+        return f"etag:{endpoint}:{hashlib.sha256(scope.encode()).hexdigest()}"
+
+    def _execute(self, endpoint: str, request, scope: dict) -> dict:
+        """
+        Make a conditional request with the ETag of the cached response if any.
+        If the resource hasn't changed (304) return the cached response,
+        otherwise cache the fresh response along with its ETag.
+        """
+        key = self.etag_key(endpoint, scope)
+        if cached := self.redis_client.get(key):
+            cached = json.loads(cached)
+            request.headers["If-None-Match"] = cached["etag"]
+
+        def execute() -> dict:
+            try:
+                return request.execute()
+            except Exception as e:
+                if cached and status_code(e) == 304:
+                    self.upstream.record(endpoint, not_modified=1)
+                    return cached
+                raise
 
-    @retry(max_retries=3)
+        response = self.upstream.call(endpoint, execute, self.QUOTA_COSTS[endpoint])
+        if response is not cached and response.get("etag"):
+            self.redis_client.setex(key, self.etag_timeout, json.dumps(response))
+
+        return response
+
+    @retry(max_retries=3, retryable=is_retryable)
     def get_videos(self, scope: dict) -> dict:
-        return self.youtube.videos().list(**scope).execute()
+        request = self.youtube.videos().list(**scope)
+        return self._execute("videos.list", request, scope)
 
-    @retry(max_retries=3)
+    @retry(max_retries=3, retryable=is_retryable)
     def get_playlists(self, scope: dict) -> dict:
-        return self.youtube.playlists().list(**scope).execute()
+        request = self.youtube.playlists().list(**scope)
+        return self._execute("playlists.list", request, scope)
 
-    @retry(max_retries=3)
+    @retry(max_retries=3, retryable=is_retryable)
     def get_channels(self, scope: dict) -> dict:
-        return self.youtube.channels().list(**scope).execute()
+        request = self.youtube.channels().list(**scope)
+        return self._execute("channels.list", request, scope)
 
-    @retry(max_retries=3)
+    @retry(max_retries=3, retryable=is_retryable)
     def get_playlist_videos(self, scope: dict) -> dict:
-        return self.youtube.playlistItems().list(**scope).execute()
+        request = self.youtube.playlistItems().list(**scope)
+        return self._execute("playlistItems.list", request, scope)
 
 
 class MaxRetriesExceededError(Exception):
@@ -154,3 +507,7 @@ class MaxRetriesExceededError(Exception):
         self.func_name = func_name
         self.func_args = func_args
         self.func_kwargs = func_kwargs
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the upstream's circuit is open."""
@@ -0,0 +1,242 @@
+"""
+The typed jobs of the job queue and the long running consumers.
+"""
+
+import time
+import signal
+import threading
+from typing import Callable
+from datetime import datetime, timezone
+from wtforms.validators import ValidationError
+
+from flask import Flask, current_app
+
+from app import db
+from app.helpers import youtube_build
+from app.models import Post, Playlist, Category
+from app.posts.helpers import validate_video, fetch_video_data, video_banned
+from app.sources.helpers import validate_playlist
+from app.cron.queue import HIGH, LOW, get_queue
+from app.cron.classifier import CategoryClassifier
+from app.cron.helpers import YouTubeAPI, log_api_usage
+from app.cron.handlers import (
+    classifier_path,
+    classify_post,
+    apply_generated_info,
+    memoized_generate_info,
+    revalidate_videos,
+    ingest_playlists,
+    refresh_playlists_metadata,
+    update_similar_posts,
+)
+
+
+JOBS: dict[str, Callable] = {}
+
+
+def job(name: str) -> Callable:
+    """Register a function as the handler of a job type."""
+
+    def decorator(func: Callable) -> Callable:
+        JOBS[name] = func
+        return func
+
+    return decorator
+
+
+@job("add_playlist")
+def add_playlist(playlist_id: str, user_id: int) -> None:
+    """Add a playlist suggested by an admin, then ingest its videos."""
+    if not Playlist.query.filter_by(playlist_id=playlist_id).first():
+        with youtube_build() as youtube:
+            # this will raise ValidationError if unable to fetch data
+            playlist = Playlist(**validate_playlist(playlist_id, youtube))
+        playlist.user_id = user_id
+        # just fetched, no need to refresh before the ingest
+        playlist.metadata_refreshed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        db.session.add(playlist)
+        db.session.commit()
+
+    get_queue().enqueue("ingest_playlist", HIGH, playlist_id=playlist_id)
+
+
+@job("add_post")
+def add_post(video_id: str, user_id: int) -> None:
+    """Post a video suggested by an admin, then enrich it."""
+    if Post.query.filter_by(video_id=video_id).first():
+        return
+
+    with youtube_build() as youtube:
+        scope = {"id": video_id, "part": ["status", "snippet", "contentDetails"]}
+        # this will raise MaxRetriesExceededError if unsuccessful
+        items = YouTubeAPI(youtube).get_videos(scope).get("items")
+
+    if not items:
+        raise ValidationError("Unable to fetch the video.")
+
+    # this will raise ValidationError if video's invalid
+    validate_video(items[0])
+
+    # the admin overrides a previous deletion
+    if banned := video_banned(video_id):
+        db.session.delete(banned)
+
+    post = Post(**fetch_video_data(items[0]))
+    post.user_id = user_id
+    db.session.add(post)
+    db.session.commit()
+
+    job_id = f"enrich_post:{post.id}"
+    get_queue().enqueue("enrich_post", HIGH, job_id, post_id=post.id)
+
+
+@job("ingest_playlist")
+def ingest_playlist(playlist_id: str) -> None:
+    """Fetch the new videos of a playlist, post them and queue their enrichment."""
+    if not (playlist := Playlist.query.filter_by(playlist_id=playlist_id).first()):
+        return
+
+    refresh_playlists_metadata([playlist])
+    stats = ingest_playlists([playlist])
+
+    missing_info = (Post.short_description == None) | (Post.category_id == None)
+    query = db.select(Post.id).filter_by(playlist_id=playlist_id).filter(missing_info)
+    queue = get_queue()
+    for post_id in db.session.execute(query).scalars():
+        # by job id, a post still waiting from a previous run isn't queued twice
+        queue.enqueue("enrich_post", job_id=f"enrich_post:{post_id}", post_id=post_id)
+
+    current_app.logger.info(f"Added {stats['new']} videos from {playlist_id}.")
+
+
+@job("revalidate_batch")
+def revalidate_batch(post_ids: list[int]) -> None:
+    """Revalidate up to 50 posts with one YouTube call."""
+    posts = Post.query.filter(Post.id.in_(post_ids)).all()
+    revalidate_videos(posts)
+
+
+@job("enrich_post")
+def enrich_post(post_id: int) -> None:
+    """Generate the missing short description and category of a post."""
+    post = db.session.get(Post, post_id)
+    if not post or (post.short_description and post.category):
+        return
+
+    categories = db.session.execute(db.select(Category)).scalars().all()
+    categories = {category.name: category for category in categories}
+    categories_by_id = {category.id: category for category in categories.values()}
+
+    # the classifier is trained by the scheduled runs, here it's only used
+    if not post.category:
+        classifier = CategoryClassifier.load(classifier_path())
+        classify_post(post, classifier, categories_by_id)
+
+    if not post.short_description or not post.category:
+        cat_prompt = ", ".join(sorted(categories)).replace('"', "")
+        # this will raise MaxRetriesExceededError if unsuccessful
+        info, _ = memoized_generate_info(post.title, cat_prompt)
+        apply_generated_info(post, info, categories)
+
+    db.session.commit()
+
+
+@job("update_similar")
+def update_similar() -> None:
+    """Precompute the related posts of the new and changed posts."""
+    update_similar_posts()
+
+
+def enqueue_scheduled_jobs() -> int:
+    """
+    Queue the periodic work as jobs, so it's spread over the consumers:
+    the ingestion of every playlist, the revalidation
+    of the most overdue orphan posts within the budget
+    and the related posts update.
+    Return the number of queued jobs.
+    """
+    queue = get_queue()
+    count = 0
+    for (playlist_id,) in Playlist.query.with_entities(Playlist.playlist_id):
+        queue.enqueue("ingest_playlist", LOW, playlist_id=playlist_id)
+        count += 1
+
+    sources = db.select(Playlist.playlist_id)
+    orphans = (Post.playlist_id == None) | (Post.playlist_id.not_in(sources))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    budget = current_app.config["WORKER_REVALIDATION_BUDGET"]
+    overdue = db.select(Post.id).filter(orphans)
+    overdue = overdue.order_by(Post.revalidation_priority(now).desc()).limit(budget)
+    post_ids = list(db.session.execute(overdue).scalars())
+    for i in range(0, len(post_ids), 50):
+        queue.enqueue("revalidate_batch", LOW, post_ids=post_ids[i : i + 50])
+        count += 1
+
+    # the posts not ingested or enriched by then are picked up by the next round
+    queue.enqueue("update_similar", LOW)
+    return count + 1
+
+
+def run_job(job: dict) -> None:
+    """Run a reserved job, acknowledge it or report the failure to the queue."""
+    queue = get_queue()
+    if not (handler := JOBS.get(job["type"])):
+        queue.fail(job, f"Unknown job type {job['type']}.", permanent=True)
+        return
+
+    try:
+        handler(**job["args"])
+    except ValidationError as e:
+        # the input is invalid, retrying won't help
+        db.session.rollback()
+        queue.fail(job, str(e), permanent=True)
+    except Exception as e:
+        db.session.rollback()
+        msg = f"Job {job['type']} {job['id']} failed. Error: {e}"
+        current_app.logger.warning(msg)
+        queue.fail(job, str(e))
+    else:
+        queue.ack(job)
+
+
+def consume(app: Flask, stop: threading.Event, poll_interval: float = 1.0) -> None:
+    """Reserve and run jobs until stopped, a fresh app context per job."""
+    while not stop.is_set():
+        with app.app_context():
+            if job := get_queue().reserve():
+                run_job(job)
+                continue
+        # the queue is empty
+        stop.wait(poll_interval)
+
+
+def run_consumers(app: Flask, num_workers: int) -> None:
+    """
+    Run a number of concurrent consumers until SIGINT or SIGTERM.
+    The consumers finish their current jobs before exiting.
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=consume, args=(app, stop), daemon=True)
+        for _ in range(num_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    app.logger.info(f"Started {num_workers} job consumers.")
+    last_log = time.monotonic()
+    try:
+        while not stop.wait(60):
+            # log the queue and the API usage every hour
+            if time.monotonic() - last_log >= 3600:
+                with app.app_context():
+                    app.logger.info(f"Job queue: {get_queue().stats()}")
+                    log_api_usage()
+                last_log = time.monotonic()
+    except KeyboardInterrupt:
+        stop.set()
+
+    for thread in threads:
+        thread.join()
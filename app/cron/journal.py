@@ -0,0 +1,113 @@
+"""
+Run journal of the worker, so an interrupted run can resume
+from its last checkpoint instead of starting over.
+
+The journal lives in Redis and expires if not checkpointed
+for a while, so an abandoned run is not resumed days later.
+"""
+
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from app.cron.coordination import Lease, LeaseLostError
+
+
+class RunJournal:
+    def __init__(
+        self,
+        redis_client,
+        key: str = "worker:journal",
+        ttl: int = 86400,
+        lease: Lease | None = None,
+    ):
+        self.redis = redis_client
+        self.ttl = ttl
+        # the run's lease, no checkpoint is saved if it's lost
+        self.lease = lease
+        self.key = key  # hash, run state (phases, cursors, stats)
+        self.playlists_key = f"{key}:playlists"  # set, ids of the ingested playlists
+
+    @classmethod
+    def from_app(
+        cls, key: str = "worker:journal", lease: Lease | None = None
+    ) -> "RunJournal":
+        return cls(
+            current_app.config["REDIS_CLIENT"],
+            key=key,
+            ttl=current_app.config["WORKER_JOURNAL_TTL"],
+            lease=lease,
+        )
+
+    def start(self, fresh: bool = False) -> datetime | None:
+        """
+        Start a run, discarding the previous journal if fresh.
+        Return the start time of the resumed run, None if starting over.
+        """
+        if fresh:
+            self.finish()
+        if started_at := self.redis.hget(self.key, "started_at"):
+            return datetime.fromisoformat(started_at.decode())
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.redis.hset(self.key, "started_at", now.isoformat())
+        self._touch()
+        return None
+
+    def finish(self) -> None:
+        """The run is complete, nothing to resume."""
+        self.redis.delete(self.key, self.playlists_key)
+
+    def _touch(self) -> None:
+        pipe = self.redis.pipeline()
+        pipe.expire(self.key, self.ttl)
+        pipe.expire(self.playlists_key, self.ttl)
+        pipe.execute()
+
+    def is_done(self, phase: str) -> bool:
+        return bool(self.redis.hexists(self.key, f"done:{phase}"))
+
+    def mark_done(self, phase: str, **stats: int) -> None:
+        """Mark the phase as complete and add to the run stats, atomically."""
+        self._save({f"done:{phase}": 1}, stats)
+
+    def cursor(self, phase: str) -> int:
+        return int(self.redis.hget(self.key, f"cursor:{phase}") or 0)
+
+    def checkpoint(self, phase: str, cursor: int, **stats: int) -> None:
+        """Save the phase's cursor and add to the run stats, atomically."""
+        self._save({f"cursor:{phase}": cursor}, stats)
+
+    def _save(
+        self, fields: dict, stats: dict[str, int], playlist_id: str | None = None
+    ) -> None:
+        # another instance could have taken over the run
+        if self.lease and self.lease.lost.is_set():
+            raise LeaseLostError(f"The lease {self.lease.key} was lost.")
+        pipe = self.redis.pipeline()
+        if fields:
+            pipe.hset(self.key, mapping=fields)
+        if playlist_id:
+            pipe.sadd(self.playlists_key, playlist_id)
+        for name, value in stats.items():
+            pipe.hincrby(self.key, f"stat:{name}", value)
+        pipe.expire(self.key, self.ttl)
+        pipe.expire(self.playlists_key, self.ttl)
+        pipe.execute()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            key.decode().removeprefix("stat:"): int(value)
+            for key, value in self.redis.hgetall(self.key).items()
+            if key.startswith(b"stat:")
+        }
+
+    def add_stats(self, **stats: int) -> None:
+        self._save({}, stats)
+
+    def mark_playlist_done(self, playlist_id: str, **stats: int) -> None:
+        """Mark a playlist as ingested and add to the run stats, atomically."""
+        self._save({}, stats, playlist_id)
+
+    def done_playlists(self) -> set[str]:
+        """Ids of the playlists ingested so far in this run."""
+        return {member.decode() for member in self.redis.smembers(self.playlists_key)}
@@ -0,0 +1,187 @@
+"""
+Redis backed job queue for the worker.
+
+Jobs wait in a sorted set ordered by priority and then by enqueue time.
+A reserved job is moved to the processing set with a deadline
+(the visibility timeout), if it's not acknowledged by then
+it becomes visible to the consumers again. Failed jobs are retried
+with exponential backoff and dead-lettered after the last attempt.
+Delivery is at least once, so the jobs should be idempotent.
+"""
+
+import json
+import time
+import uuid
+
+from flask import current_app
+
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+# atomically move a job between two sorted sets, only if it's still in the first one,
+# so two consumers can never both take the same job
+MOVE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        redis_client,
+        name: str = "jobs",
+        visibility_timeout: int = 1800,
+        max_attempts: int = 5,
+        retry_delay: int = 30,
+        dead_letter_size: int = 1000,
+    ):
+        self.redis = redis_client
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dead_letter_size = dead_letter_size
+        self.ready = f"{name}:ready"  # zset, job id -> priority score
+        self.delayed = f"{name}:delayed"  # zset, job id -> time to retry
+        self.processing = f"{name}:processing"  # zset, job id -> deadline
+        self.data = f"{name}:data"  # hash, job id -> job json
+        self.attempts = f"{name}:attempts"  # hash, job id -> number of reservations
+        self.dead = f"{name}:dead"  # list of the dead-lettered jobs
+        self._move = self.redis.register_script(MOVE_SCRIPT)
+
+    @staticmethod
+    def score(job: dict) -> float:
+        """Sort by priority first, then first in first out."""
+        return job["priority"] * 1e10 + job["enqueued_at"]
+
+    def enqueue(
+        self,
+        job_type: str,
+        priority: int = NORMAL,
+        job_id: str | None = None,
+        **args,
+    ) -> str:
+        """
+        Add a job to the queue. Return the job id.
+        A job with a supplied id is added only if no job with that id
+        is still in the queue, so the same work isn't queued twice.
+        """
+        job = {
+            "id": job_id or uuid.uuid4().hex,
+            "type": job_type,
+            "args": args,
+            "priority": priority,
+            "enqueued_at": time.time(),
+        }
+        if not self.redis.hsetnx(self.data, job["id"], json.dumps(job)):
+            return job["id"]  # already queued, reserved or waiting for a retry
+        self.redis.zadd(self.ready, {job["id"]: self.score(job)})
+        return job["id"]
+
+    def get(self, job_id: str) -> dict | None:
+        if data := self.redis.hget(self.data, job_id):
+            return json.loads(data)
+        return None
+
+    def move(self, source: str, destination: str, job_id: str, score: float) -> bool:
+        return bool(self._move(keys=[source, destination], args=[job_id, score]))
+
+    def promote(self) -> int:
+        """
+        Make visible again the jobs whose retry delay passed
+        and the jobs whose visibility timeout expired. Return their number.
+        """
+        count, now = 0, time.time()
+        for key in (self.delayed, self.processing):
+            for job_id in self.redis.zrangebyscore(key, "-inf", now):
+                if not (job := self.get(job_id := _decode(job_id))):
+                    self.redis.zrem(key, job_id)
+                    continue
+                count += self.move(key, self.ready, job_id, self.score(job))
+        return count
+
+    def reserve(self) -> dict | None:
+        """
+        Take the job with the highest priority, hiding it from the other
+        consumers for the visibility timeout. Return None if the queue is empty.
+        """
+        self.promote()
+        while job_ids := self.redis.zrange(self.ready, 0, 0):
+            job_id = _decode(job_ids[0])
+            deadline = time.time() + self.visibility_timeout
+            # another consumer was faster, try the next job
+            if not self.move(self.ready, self.processing, job_id, deadline):
+                continue
+            if not (job := self.get(job_id)):
+                self.redis.zrem(self.processing, job_id)
+                continue
+
+            job["attempts"] = self.redis.hincrby(self.attempts, job_id, 1)
+            # the job timed out on every attempt, probably crashing the consumer
+            if job["attempts"] > self.max_attempts:
+                self.bury(job, "Visibility timeout expired on every attempt.")
+                continue
+            return job
+
+        return None
+
+    def ack(self, job: dict) -> None:
+        """Remove a successfully done job."""
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.processing, job["id"])
+        pipe.hdel(self.data, job["id"])
+        pipe.hdel(self.attempts, job["id"])
+        pipe.execute()
+
+    def fail(self, job: dict, error: str, permanent: bool = False) -> None:
+        """Retry a failed job later or dead-letter it if out of attempts."""
+        if permanent or job["attempts"] >= self.max_attempts:
+            self.bury(job, error)
+            return
+        delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+        self.move(self.processing, self.delayed, job["id"], time.time() + delay)
+
+    def bury(self, job: dict, error: str) -> None:
+        """Move a job to the dead letter list, keeping the most recent ones."""
+        job = job | {"error": error, "failed_at": time.time()}
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.processing, job["id"])
+        pipe.hdel(self.data, job["id"])
+        pipe.hdel(self.attempts, job["id"])
+        pipe.lpush(self.dead, json.dumps(job))
+        pipe.ltrim(self.dead, 0, self.dead_letter_size - 1)
+        pipe.execute()
+
+    def dead_letters(self, count: int = 100) -> list[dict]:
+        return [json.loads(job) for job in self.redis.lrange(self.dead, 0, count - 1)]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "ready": self.redis.zcard(self.ready),
+            "delayed": self.redis.zcard(self.delayed),
+            "processing": self.redis.zcard(self.processing),
+            "dead": self.redis.llen(self.dead),
+        }
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_queue() -> JobQueue:
+    """The job queue of the app, configured from the app config."""
+    return JobQueue(
+        current_app.config["REDIS_CLIENT"],
+        visibility_timeout=current_app.config["JOB_VISIBILITY_TIMEOUT"],
+        max_attempts=current_app.config["JOB_MAX_ATTEMPTS"],
+    )
+
+
+def enqueue(
+    job_type: str, priority: int = NORMAL, job_id: str | None = None, **args
+) -> str:
+    """Add a job to the app's job queue. Return the job id."""
+    return get_queue().enqueue(job_type, priority, job_id, **args)
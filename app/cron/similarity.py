@@ -0,0 +1,106 @@
+"""
+TF-IDF cosine similarity of the posts, for the related posts lists.
+https://nlp.stanford.edu/IR-book/html/htmledition/dot-products-1.html
+
+The document-term matrix is kept sparse (CSR for the documents,
+CSC postings for the terms), so the similarity of a post to all the others
+is a single weighted bincount over the postings of its terms.
+"""
+
+import re
+import hashlib
+import numpy as np
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase words, without the one and two letter ones."""
+    return [word for word in re.findall(r"\w+", text.lower()) if len(word) > 2]
+
+
+def fingerprint(text: str) -> str:
+    """Hash of a post's text, to tell if it changed since the last computation."""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class SimilarityIndex:
+    """TF-IDF vectors of a collection of documents, by document id."""
+
+    def __init__(self, docs: dict[int, str], max_df: float = 0.5):
+        """
+        Parameters:
+        docs (dict): The texts of the documents by their ids.
+        max_df (float): Ignore the terms found in more than this share
+        of the documents, they don't tell the documents apart.
+        """
+        self.ids = np.array(list(docs), dtype=np.int64)
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids.tolist())}
+        n_docs = len(self.ids)
+
+        # (row, term) pair for every word of every document
+        vocabulary: dict[str, int] = {}
+        rows, terms = [], []
+        for row, text in enumerate(docs.values()):
+            for word in tokenize(text):
+                rows.append(row)
+                terms.append(vocabulary.setdefault(word, len(vocabulary)))
+        n_terms = len(vocabulary)
+
+        # term frequencies, the pairs are unique and sorted by row
+        pairs, tf = np.unique(
+            np.array(rows, dtype=np.int64) * n_terms + np.array(terms, dtype=np.int64),
+            return_counts=True,
+        )
+        rows, terms = pairs // max(n_terms, 1), pairs % max(n_terms, 1)
+
+        # drop the too common terms, smoothed idf
+        df = np.bincount(terms, minlength=n_terms)
+        keep = df[terms] <= max(max_df * n_docs, 1)
+        rows, terms, tf = rows[keep], terms[keep], tf[keep]
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+
+        # sublinear tf, l2 normalized rows, so the dot product is the cosine
+        weights = (1 + np.log(tf)) * idf[terms]
+        norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=n_docs))
+        weights /= norms[rows]
+
+        # CSR, the terms of each document
+        self.terms, self.weights = terms, weights
+        self.indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(rows, minlength=n_docs)))
+        )
+
+        # CSC, the documents of each term
+        order = np.argsort(terms, kind="stable")
+        self.postings, self.posting_weights = rows[order], weights[order]
+        self.term_indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(terms, minlength=n_terms)))
+        )
+
+    def scores(self, doc_id: int) -> np.ndarray:
+        """Cosine similarity of a document to every document, in the ids order."""
+        row = self.rows[doc_id]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        terms, weights = self.terms[start:end], self.weights[start:end]
+
+        # gather the postings of the document's terms into one flat index
+        starts, ends = self.term_indptr[terms], self.term_indptr[terms + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        idx = np.arange(lengths.sum()) + offsets
+
+        return np.bincount(
+            self.postings[idx],
+            weights=self.posting_weights[idx] * np.repeat(weights, lengths),
+            minlength=len(self.ids),
+        )
+
+    def most_similar(self, doc_id: int, k: int) -> list[int]:
+        """Ids of the k most similar documents, the document itself excluded."""
+        scores = self.scores(doc_id)
+        scores[self.rows[doc_id]] = 0
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[top[scores[top] > 0]].tolist()
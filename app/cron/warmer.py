@@ -0,0 +1,187 @@
+"""
+Cache warmer, precomputing the most visited listings and the sitemaps
+after the worker's run, or before a deploy takes traffic,
+so the first visitors don't pay for the cold caches.
+
+The entries are computed through the same cached functions and views
+the routes use, with the same arguments, so they land under the same keys.
+"""
+
+import time
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy
+from flask import Flask, current_app, g, url_for
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from app.main.routes import get_categories
+from app.models import Post, Category
+
+
+# name of the entries, for the logs, and the function computing them
+Task = tuple[str, Callable[[], object]]
+
+
+def warm_pages(get_page: Callable, pages: int) -> Callable:
+    """Task computing the first pages of a listing, following the cursors."""
+
+    def task():
+        cursor = None
+        for _ in range(pages):
+            _, cursor = get_page(cursor)
+            if not cursor:
+                break
+
+    return task
+
+
+def category_page(category_id: int, per_page: int) -> Callable:
+    def get_page(cursor):
+        category = db.session.get(Category, category_id)
+        return category.get_posts(cursor=cursor, per_page=per_page)  # type: ignore
+
+    return get_page
+
+
+def playlist_page(playlist_id: str, per_page: int) -> Callable:
+    return lambda cursor: Post.get_playlist_posts(playlist_id, cursor, per_page)
+
+
+def warm_view(endpoint: str, **values) -> Callable:
+    """
+    Task recomputing a cached view, in a request to the site's domain,
+    so the external URLs it renders are the same as the visitors get.
+    """
+
+    def task():
+        app = current_app._get_current_object()  # type: ignore
+        base_url = f"https://{app.config['DOMAIN'] or 'localhost'}"
+        with app.test_request_context(base_url=base_url):
+            path = url_for(endpoint, **values)
+        with app.test_request_context(path, base_url=base_url):
+            g.refresh_cache = True
+            try:
+                app.dispatch_request()
+            except HTTPException:
+                pass  # nothing to show, e.g. an empty sitemap
+            finally:
+                g.pop("refresh_cache")
+
+    return task
+
+
+def warming_tasks(pages: int) -> list[Task]:
+    """
+    The entries to warm, the most visited first: the categories menu
+    of every page, the home feed, the categories and the sources
+    by their likes, then the other listings and the sitemaps.
+    """
+    per_page = current_app.config["POSTS_PER_PAGE"]
+    tasks: list[Task] = [
+        ("categories", get_categories),
+        ("home", warm_pages(lambda cursor: Post.get_posts(cursor, per_page), pages)),
+    ]
+
+    # there's no visits data, the most liked listings are the likely most visited
+    likes = sqlalchemy.func.sum(Post.like_count).desc()
+    count = sqlalchemy.func.count(Post.id).desc()
+
+    category_ids = db.session.execute(
+        db.select(Post.category_id)
+        .filter(Post.category_id.isnot(None))
+        .group_by(Post.category_id)
+        .order_by(likes, count)
+    ).scalars()
+    for category_id in category_ids:
+        get_page = category_page(category_id, per_page)
+        tasks.append((f"category {category_id}", warm_pages(get_page, pages)))
+
+    playlist_ids = db.session.execute(
+        db.select(Post.playlist_id)
+        .filter(Post.playlist_id.isnot(None))
+        .group_by(Post.playlist_id)
+        .order_by(likes, count)
+    ).scalars()
+    for playlist_id in playlist_ids:
+        get_page = playlist_page(playlist_id, per_page)
+        tasks.append((f"source {playlist_id}", warm_pages(get_page, 1)))
+
+    tasks += [
+        ("orphans", warm_pages(lambda cursor: Post.get_orphans(cursor, per_page), 1)),
+        ("most liked", warm_pages(lambda c: Post.get_posts_by_likes(c, per_page), 1)),
+    ]
+
+    # the sitemaps, the index first, then the posts by month, the latest first
+    sitemaps = ("sitemap_index", "pages_sitemap", "categories_sitemap")
+    sitemaps += ("sources_sitemap", "misc_sitemap")
+    tasks += [(name, warm_view(f"sitemap.{name}")) for name in sitemaps]
+    year = sqlalchemy.extract("year", Post.upload_date)
+    month = sqlalchemy.extract("month", Post.upload_date)
+    months = db.session.execute(
+        db.select(year, month).distinct().order_by(year.desc(), month.desc())
+    ).all()
+    for y, m in months:
+        date = f"{int(y)}-{int(m):02d}"
+        view = warm_view("sitemap.posts_sitemap", date=date)
+        tasks.append((f"sitemap {date}", view))
+
+    return tasks
+
+
+def run_tasks(app: Flask, tasks: list[Task], workers: int, deadline: float) -> int:
+    """
+    Run the tasks on a pool of workers, in their order, each in its own
+    app context. The tasks not started by the deadline are skipped.
+
+    Parameters:
+    app (Flask): The app.
+    tasks (list): The names of the tasks and their functions.
+    workers (int): The maximum number of tasks running at once.
+    deadline (float): The time.monotonic() after which to stop.
+
+    Returns:
+    int: Number of completed tasks.
+    """
+
+    def run(task: Task) -> bool:
+        name, func = task
+        if time.monotonic() > deadline:
+            return False
+        with app.app_context():
+            try:
+                func()
+            except Exception:
+                app.logger.exception(f"Unable to warm the cache of {name}.")
+                return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(run, tasks))
+
+
+def warm_caches(pages: int | None = None) -> int:
+    """
+    Warm the cached listings and sitemaps in ranked order,
+    within the CACHE_WARM_TIMEOUT time budget and with at most
+    CACHE_WARM_WORKERS queries at once. Return the number of warmed tasks.
+
+    Parameters:
+    pages (int): The pages to warm of the home feed and the categories,
+    CACHE_WARM_PAGES if not supplied.
+    """
+    config = current_app.config
+    start = time.monotonic()
+    tasks = warming_tasks(pages or config["CACHE_WARM_PAGES"])
+    warmed = run_tasks(
+        current_app._get_current_object(),  # type: ignore
+        tasks,
+        workers=config["CACHE_WARM_WORKERS"],
+        deadline=start + config["CACHE_WARM_TIMEOUT"],
+    )
+    elapsed = time.monotonic() - start
+    current_app.logger.info(
+        f"Warmed {warmed} of {len(tasks)} cache entries in {elapsed:.1f}s."
+    )
+    return warmed
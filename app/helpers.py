@@ -1,3 +1,6 @@
+import json
+import base64
+import binascii
 import functools
 from typing import Callable
 from googleapiclient.discovery import build as google_discovery_build
@@ -24,6 +27,31 @@ def dump_datetime(value) -> list[str] | None:
     return [value.strftime("%Y-%m-%d"), value.strftime("%H:%M:%S")] if value else None
 
 
+def encode_cursor(values) -> str:
+    """Opaque pagination cursor of the sort key values of a page's last item."""
+    data = json.dumps(list(values), default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> list | None:
+    """Sort key values from a pagination cursor, None if missing or invalid."""
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def scroll_response(posts: list, cursor: str | None) -> Response:
+    """JSON response of an infinite scroll page with the next page's cursor."""
+    if not posts:
+        return make_response({"posts": [], "cursor": None}, 404)
+    return make_response({"posts": posts, "cursor": cursor})
+
+
 def youtube_build():
     """Instantiate google discovery build object."""
     return google_discovery_build(
@@ -12,14 +12,13 @@ from flask import (
     request,
     current_app,
     Blueprint,
-    make_response,
     send_from_directory,
     redirect,
 )
 
-from app import cache
-from app.helpers import serve_as
-from app.models import User, Post, Category
+from app.caching import tagged, cached
+from app.helpers import serve_as, scroll_response
+from app.models import User, Post, Category, paginate_keyset
 from app.auth.helpers import get_avatar_abs_path, download_avatar
 
 
@@ -58,11 +57,13 @@ def redirect_www() -> Response | None:
 def cloudflare_cache(response: Response) -> Response:
     """
     Add Cloudflare cache header for non logged users and non static routes.
+    The WebSub callback is never cached, the hub's challenges are unique.
     https://developers.cloudflare.com/cache/concepts/cdn-cache-control/
     """
     if (
         not current_user.is_authenticated
         and "/static/" not in request.path
+        and not request.path.startswith("/websub/")
         and not request.path.endswith(FAVICONS)
     ):
         response.headers["CDN-Cache-Control"] = "14400"
@@ -144,7 +145,7 @@ def avatar(user: User, redis_client: Redis | None = None) -> pathlib.Path:
     return default_avatar
 
 
-@cache.cached(timeout=86400, key_prefix="all_categories")
+@tagged("categories")
 def get_categories():
     categories = Category.query.order_by(Category.name).all()
     return [cat for cat in categories if cat.posts.first()]
@@ -161,8 +162,8 @@ def template_vars():
 
 
 @bp.route("/ads.txt")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/plain")
+@cached(86400)
 def ads_txt() -> str:
     if not (aa := current_app.config["ADSENSE_ACCOUNT"]):
         return ""
@@ -176,33 +177,31 @@ def home() -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
     if current_user.is_authenticated and current_user.is_admin:
         if request.args.get("order_by") == "likes":
-            posts = Post.get_posts_by_likes(page, per_page)
+            posts, cursor = Post.get_posts_by_likes(cursor, per_page)
         elif request.args.get("short_desc") == "no":
-            date = Post.upload_date.desc()
-            query = Post.query.filter_by(short_description=None).order_by(date)
-            posts = query.paginate(page=page, per_page=per_page, error_out=False).items
+            query = Post.query.filter_by(short_description=None)
+            keys = [Post.upload_date, Post.id]
+            posts, cursor = paginate_keyset(query, keys, cursor, per_page)
             posts = [post.to_dict for post in posts]
         else:
             uncached_posts = Post.get_posts.uncached
-            posts = uncached_posts(Post, page, per_page)
+            posts, cursor = uncached_posts(Post, cursor, per_page)
     else:
-        posts = (
-            Post.get_posts_by_likes(page, per_page)
+        posts, cursor = (
+            Post.get_posts_by_likes(cursor, per_page)
             if request.args.get("order_by") == "likes"
-            else Post.get_posts(page, per_page)
+            else Post.get_posts(cursor, per_page)
         )
 
     # return JSON response for scroll content
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     # render HTML template for the first view
-    return render_template("home.html", posts=posts)
+    return render_template("home.html", posts=posts, cursor=cursor)
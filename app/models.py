@@ -5,13 +5,16 @@ from slugify import slugify
 from markdown import markdown
 from markupsafe import escape
 from sqlalchemy.orm import mapped_column
+from sqlalchemy.dialects import postgresql
 from redis.commands.search.query import Query
 from redis.commands.search.result import Result
 
 from flask_login import UserMixin
 from flask import current_app, json
 
-from app import db, login_manager, cache
+from app import db, login_manager, cache, cards
+from app.helpers import encode_cursor, decode_cursor
+from app.caching import tagged, invalidate, bump
 
 
 @login_manager.user_loader
@@ -26,6 +29,67 @@ class Base(db.Model):
     updated_at = mapped_column(db.DateTime, default=dt.datetime.now(dt.timezone.utc))
 
 
+def cursor_values(cursor: str, keys: list) -> list | None:
+    """
+    Sort key values from a pagination cursor, checked against the types
+    of the sort key columns, so a tampered cursor never reaches the database.
+    None if invalid, e.g. of another listing.
+    """
+    values = decode_cursor(cursor)
+    if not values or len(values) != len(keys):
+        return None
+    converted = []
+    for key, value in zip(keys, values):
+        if isinstance(key.type, db.DateTime):
+            try:
+                value = dt.datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                return None
+        elif isinstance(key.type, db.Integer):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return None
+        else:
+            return None
+        converted.append(value)
+    return converted
+
+
+def paginate_keyset(query, keys: list, cursor: str | None, per_page: int):
+    """
+    Get a page of the query's items in descending order of the sort keys,
+    after the item the cursor points to (keyset pagination).
+    The page is seeked by the keys instead of skipping the previous pages
+    with OFFSET, so any page is as fast as the first one
+    and the pages don't shift when new items are added.
+    https://use-the-index-luke.com/no-offset
+
+    Parameters:
+    query (Query): Query of the items.
+    keys (list): Sort key columns, the last one unique (usually the id).
+    cursor (str): Opaque cursor of the previous page's last item, if any.
+    per_page (int): Number of items per page.
+
+    Returns:
+    tuple: The items and the cursor of the next page, None if no next page.
+    An invalid cursor (e.g. of another listing) gets an empty page.
+    """
+    if cursor:
+        # the scroll ends, instead of starting over from the first page
+        if not (values := cursor_values(cursor, keys)):
+            return [], None
+        query = query.filter(sqlalchemy.tuple_(*keys) < tuple(values))
+
+    # fetch one more item to know if there's a next page
+    query = query.add_columns(*keys).order_by(*(key.desc() for key in keys))
+    rows = query.limit(per_page + 1).all()
+    items = [row[0] for row in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(rows[per_page - 1][1:])
+    return items, next_cursor
+
+
 class User(Base, UserMixin):
     id = mapped_column(db.Integer, primary_key=True)
     token = mapped_column(db.String(2048))
@@ -59,24 +123,82 @@ class User(Base, UserMixin):
         """Check if user is admin."""
         return self.google_id == current_app.config["ADMIN_OPENID"]
 
-    def cast(self, post, action: str) -> None:
-        obj = PostLike() if action in ["like", "unlike"] else PostFave()
-        # if user hasn't liked/faved the post record her like/fave
-        if not self.has_casted(post, action):
-            obj.user_id, obj.post_id = self.id, post.id
-            db.session.add(obj)
-        else:  # if user already liked/faved this post delete her like/fave
-            cast = obj.query.filter_by(user_id=self.id, post_id=post.id)
-            cast.delete()
+    def cast(self, video_id: str, action: str) -> int | None:
+        """
+        Like/fave the post or take back the like/fave and update the post's
+        counter, all in one statement. The like/fave is inserted unless
+        it exists already (unique per user and post) or deleted if it exists,
+        so repeated clicks don't change anything.
 
-    def has_casted(self, post, action):
-        cls = PostLike if action in ["like", "unlike"] else PostFave
-        query = cls.query.filter_by(user_id=self.id, post_id=post.id)
-        return query.count() > 0
+        Parameters:
+        video_id (str): The post's YouTube video id.
+        action (str): One of like, unlike, fave, unfave.
+
+        Returns:
+        int: The post's new like/fave count, None if there's no such post.
+        """
+        cls, counter = (
+            (PostLike, Post.like_count)
+            if action in ["like", "unlike"]
+            else (PostFave, Post.fave_count)
+        )
+        post_id = db.select(Post.id).filter_by(video_id=video_id)
+
+        if action in ["like", "fave"]:
+            values = post_id.add_columns(sqlalchemy.literal(self.id))
+            change = postgresql.insert(cls).from_select(["post_id", "user_id"], values)
+            change, delta = change.on_conflict_do_nothing(), 1
+        else:
+            post_id = post_id.scalar_subquery()
+            change = db.delete(cls).filter_by(user_id=self.id, post_id=post_id)
+            delta = -1
+
+        # count the inserted/deleted rows (0 or 1) into the counter
+        change = change.returning(cls.id).cte("change")
+        changed = db.select(sqlalchemy.func.count()).select_from(change)
+        update = db.update(Post).filter_by(video_id=video_id)
+        update = update.values({counter: counter + delta * changed.scalar_subquery()})
+        update = update.returning(counter)
+        update = update.execution_options(synchronize_session=False)
+        if counter is Post.like_count:
+            invalidate("likes")
+        return db.session.execute(update).scalar()
+
+    def uncast_all(self) -> None:
+        """Take back the user's likes and faves from the posts' counters."""
+        for cls, counter in (
+            (PostLike, Post.like_count),
+            (PostFave, Post.fave_count),
+        ):
+            posts = db.select(cls.post_id).filter_by(user_id=self.id)
+            update = db.update(Post).where(Post.id.in_(posts))
+            update = update.values({counter: counter - 1})
+            db.session.execute(update.execution_options(synchronize_session=False))
+        invalidate("likes")
+
+    def casts(self, post) -> dict[str, bool]:
+        """Check if the user liked and faved the post, with one query."""
+        liked = db.select(PostLike.id).filter_by(user_id=self.id, post_id=post.id)
+        faved = db.select(PostFave.id).filter_by(user_id=self.id, post_id=post.id)
+        query = db.select(liked.exists().label("like"), faved.exists().label("fave"))
+        return dict(db.session.execute(query).one()._mapping)
 
 
 class Post(Base):
     __searchable__ = ["title", "short_description", "tags"]
+    # the fields shown or sorted by in the cached listings
+    __cached__ = ["video_id", "title", "thumbnails", "upload_date"]
+    # the listings are paginated by (upload_date, id)
+    __table_args__ = (
+        db.Index("ix_post_upload_date_id", "upload_date", "id"),
+        db.Index(
+            "ix_post_playlist_id_upload_date_id", "playlist_id", "upload_date", "id"
+        ),
+        db.Index(
+            "ix_post_category_id_upload_date_id", "category_id", "upload_date", "id"
+        ),
+        db.Index("ix_post_like_count_id", "like_count", "id"),
+    )
 
     id = mapped_column(db.Integer, primary_key=True)
     provider = mapped_column(db.String(7), default="YouTube")
@@ -90,9 +212,22 @@ class Post(Base):
     duration = mapped_column(db.String(20), nullable=False)
     upload_date = mapped_column(db.DateTime, nullable=False)
     similar = mapped_column(db.PickleType, default=[])
+    # maintained by User.cast, repaired by the worker's --reconcile
+    like_count = mapped_column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
+    fave_count = mapped_column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
+    # hash of the text the related posts were computed from
+    similar_fingerprint = mapped_column(db.String(32))
+    last_checked_at = mapped_column(db.DateTime)
 
     user_id = mapped_column(db.Integer, db.ForeignKey("user.id"))
     category_id = mapped_column(db.Integer, db.ForeignKey("category.id"))
+    # who categorized the post, "gemini", "classifier" or "admin",
+    # the classifier learns only from the gemini and the admin categories
+    category_source = mapped_column(db.String(16))
     playlist_db_id = mapped_column(db.Integer, db.ForeignKey("playlist.id"))
 
     likes = db.relationship(
@@ -136,32 +271,36 @@ class Post(Base):
         }
 
     @classmethod
-    @cache.memoize(86400)
-    def get_posts(cls, page, per_page):
-        query = cls.query.order_by(cls.upload_date.desc())
-        posts = query.paginate(page=page, per_page=per_page, error_out=False).items
-        return [post.to_dict for post in posts]
+    @tagged("posts", codec=cards.page)
+    def get_posts(cls, cursor, per_page):
+        keys = [cls.upload_date, cls.id]
+        posts, cursor = paginate_keyset(cls.query, keys, cursor, per_page)
+        return [post.to_dict for post in posts], cursor
 
     @classmethod
-    @cache.memoize(86400)
-    def get_posts_by_likes(cls, page, per_page):
-        """
-        Query posts by likes (outerjoin)
-        https://stackoverflow.com/q/63889938
-        """
-        query = cls.query.outerjoin(PostLike).group_by(cls.id)
-        query = query.order_by(sqlalchemy.func.count().desc())
-        posts = query.paginate(page=page, per_page=per_page, error_out=False).items
-        return [post.to_dict for post in posts]
-
-    @cache.memoize(86400)
+    @tagged("posts", "likes", codec=cards.page)
+    def get_posts_by_likes(cls, cursor, per_page):
+        """Query posts by likes, the most liked first (index scan)."""
+        keys = [cls.like_count, cls.id]
+        posts, cursor = paginate_keyset(cls.query, keys, cursor, per_page)
+        return [post.to_dict for post in posts], cursor
+
+    @tagged("posts", codec=cards.listing)
     def get_random_posts(self, limit: int) -> list[dict]:
         """Get random posts excluding the current post."""
         posts = self.query.order_by(sqlalchemy.func.random()).limit(limit)
         return [p.to_dict for p in posts if p.title.lower() != self.title.lower()]
 
     def get_related_posts(self, limit: int) -> list[dict]:
-        """Get related posts from Redis index excluding the current post."""
+        """
+        Get the related posts precomputed by the worker with one id lookup.
+        Fall back to the Redis index if not computed yet for this post.
+        """
+        if self.similar:
+            related = self.get_posts_by_id(self.similar[:limit])
+            if len(related) == limit:
+                return related
+
         search_result = self.search(self.title, 0, limit + 1)
         search_result = [
             {
@@ -181,21 +320,39 @@ class Post(Base):
         return search_result
 
     @classmethod
-    @cache.memoize(86400)
-    def get_playlist_posts(cls, playlist_id, page, per_page):
+    @tagged(
+        lambda cls, playlist_id, *args: f"playlist:{playlist_id}",
+        codec=cards.page,
+    )
+    def get_playlist_posts(cls, playlist_id, cursor, per_page):
         query = cls.query.filter_by(playlist_id=playlist_id)
-        query = query.order_by(cls.upload_date.desc())
-        posts = query.paginate(page=page, per_page=per_page, error_out=False).items
-        return [post.to_dict for post in posts]
+        keys = [cls.upload_date, cls.id]
+        posts, cursor = paginate_keyset(query, keys, cursor, per_page)
+        return [post.to_dict for post in posts], cursor
 
     @classmethod
-    @cache.memoize(86400)
-    def get_orphans(cls, page, per_page):
+    @tagged("orphans", codec=cards.page)
+    def get_orphans(cls, cursor, per_page):
         src_ids = [pl.playlist_id for pl in Playlist.query.all()]
         orphans = (cls.playlist_id == None) | (cls.playlist_id.not_in(src_ids))
-        query = cls.query.filter(orphans).order_by(cls.upload_date.desc())
-        posts = query.paginate(page=page, per_page=per_page, error_out=False).items
-        return [post.to_dict for post in posts]
+        query, keys = cls.query.filter(orphans), [cls.upload_date, cls.id]
+        posts, cursor = paginate_keyset(query, keys, cursor, per_page)
+        return [post.to_dict for post in posts], cursor
+
+    @classmethod
+    def revalidation_priority(cls, now: dt.datetime):
+        """
+        SQL expression of how overdue a post is for revalidation.
+        The staleness (time since the last check) is weighted by the post age,
+        so newer uploads are checked more often than older stable ones.
+        Posts never checked are treated as checked at their upload date.
+        """
+        now = sqlalchemy.literal(now, db.DateTime)
+        checked = sqlalchemy.func.coalesce(cls.last_checked_at, cls.upload_date)
+        staleness = sqlalchemy.extract("epoch", now - checked)
+        age = sqlalchemy.extract("epoch", now - cls.upload_date)
+        # add a day to the age to avoid division by zero
+        return staleness / (age + 86400)
 
     @classmethod
     def search_posts(
@@ -220,7 +377,7 @@ class Post(Base):
         return docs, search_result.total
 
     @classmethod
-    @cache.memoize(86400)
+    @tagged("posts", codec=cards.listing)
     def get_posts_by_id(cls, ids):
         if not ids:
             return ids
@@ -292,21 +449,88 @@ class Post(Base):
         attrs = [getattr(inspected.attrs, key) for key in obj.__searchable__]
         return any([attr.history.has_changes() for attr in attrs])
 
+    def cache_tags(self, added_or_deleted: bool = False) -> set[str]:
+        """
+        Tags of the cached listings the post is in, before and after
+        the pending change, if the change affects the listings.
+        """
+        attrs = sqlalchemy.inspect(self).attrs
+        moved = attrs.category_id.history.has_changes()
+        moved |= attrs.playlist_id.history.has_changes()
+        shown = [getattr(attrs, key).history.has_changes() for key in self.__cached__]
+        if not (added_or_deleted or moved or any(shown)):
+            return set()
+
+        tags = {"posts", "orphans"}
+        tags |= {f"category:{cid}" for cid in attrs.category_id.history.sum() if cid}
+        tags |= {f"playlist:{pid}" for pid in attrs.playlist_id.history.sum() if pid}
+        # the category list shows only the categories with posts
+        if added_or_deleted or moved:
+            tags.add("categories")
+        return tags
+
     @classmethod
-    def before_commit(cls, session):
-        session._changes = {
-            "add": [obj for obj in session.new if isinstance(obj, cls)],
-            "update": [obj for obj in session.dirty if cls._fields_dirty(obj)],
-            "delete": [obj for obj in session.deleted if isinstance(obj, cls)],
-        }
+    def before_flush(cls, session, flush_context, instances):
+        # the worker marks the categories it sets,
+        # a category changed by anything else is the admin's call
+        for obj in session.new | session.dirty:
+            if not isinstance(obj, cls):
+                continue
+            attrs = sqlalchemy.inspect(obj).attrs
+            changed = attrs.category_id.history.has_changes()
+            changed |= attrs.category.history.has_changes()
+            if changed and not attrs.category_source.history.has_changes():
+                categorized = obj.category_id or obj.category
+                obj.category_source = "admin" if categorized else None
+
+    @classmethod
+    def after_flush(cls, session, flush_context):
+        # accumulate the changes of every flush until the commit,
+        # so the objects flushed earlier (e.g. in savepoints) are indexed too
+        changes = getattr(session, "_changes", None)
+        changes = changes or {"add": [], "update": [], "delete": []}
+        changes["add"] += [obj for obj in session.new if isinstance(obj, cls)]
+        changes["update"] += [obj for obj in session.dirty if cls._fields_dirty(obj)]
+        changes["delete"] += [obj for obj in session.deleted if isinstance(obj, cls)]
+        session._changes = changes
+
+        # the cached listings to invalidate once committed
+        tags = session.info.setdefault("cache_tags", set())
+        for obj in session.new | session.deleted:
+            if isinstance(obj, cls):
+                tags |= obj.cache_tags(added_or_deleted=True)
+            elif isinstance(obj, Playlist):  # the sources decide the orphans
+                tags.add("orphans")
+        for obj in session.dirty:
+            if isinstance(obj, cls):
+                tags |= obj.cache_tags()
 
     @classmethod
     def after_commit(cls, session):
-        for obj in session._changes["add"] + session._changes["update"]:
-            obj.add_to_index()
-        for obj in session._changes["delete"]:
+        # a released savepoint, the outer transaction may still roll back
+        if session.in_nested_transaction():
+            return
+        bump(*session.info.pop("cache_tags", ()))
+        if not (changes := getattr(session, "_changes", None)):
+            return
+        session._changes = None
+        # skip the objects whose savepoint was rolled back
+        state = sqlalchemy.inspect
+        deleted = {obj for obj in changes["delete"] if state(obj).was_deleted}
+        for obj in set(changes["add"] + changes["update"]) - deleted:
+            if state(obj).persistent:
+                obj.add_to_index()
+        for obj in deleted:
             obj.remove_from_index()
+
+    @classmethod
+    def after_soft_rollback(cls, session, previous_transaction):
+        # a savepoint rolled back, the changes flushed before it still stand,
+        # the tags of its own changes only invalidate a bit more than needed
+        if previous_transaction.parent is not None:
+            return
         session._changes = None
+        session.info.pop("cache_tags", None)
 
     @classmethod
     def reindex(cls):
@@ -325,11 +549,14 @@ class Category(Base):
             kwargs["slug"] = slugify(kwargs.get("name", ""), allow_unicode=True)
         super().__init__(*args, **kwargs)
 
-    @cache.memoize(86400)
-    def get_posts(self, page=1, per_page=24):
-        posts = self.posts.order_by(Post.upload_date.desc())  # type: ignore
-        posts = posts.paginate(page=page, per_page=per_page, error_out=False)
-        return [post.to_dict for post in posts.items]
+    @tagged(
+        lambda self, *args, **kwargs: f"category:{self.id}",
+        codec=cards.page,
+    )
+    def get_posts(self, cursor=None, per_page=24):
+        keys = [Post.upload_date, Post.id]
+        posts, cursor = paginate_keyset(self.posts, keys, cursor, per_page)
+        return [post.to_dict for post in posts], cursor
 
 
 class DeletedPost(Base):
@@ -370,22 +597,55 @@ class Playlist(Base):
     description = mapped_column(db.Text)
     channel_description = mapped_column(db.Text)
 
+    # incremental sync state (watermarks) maintained by the worker
+    last_video_id = mapped_column(db.String(20))
+    last_published_at = mapped_column(db.DateTime)
+    last_full_scan = mapped_column(db.DateTime)
+    # when the playlist and channel metadata was last refreshed from YouTube
+    metadata_refreshed_at = mapped_column(db.DateTime)
+
     user_id = mapped_column(db.Integer, db.ForeignKey("user.id"))
     posts = db.relationship("Post", backref="playlist", lazy=True)
 
+    def needs_full_scan(self, interval: int) -> bool:
+        """Check if the last full scan is older than `interval` seconds."""
+        if not self.last_full_scan:
+            return True
+        now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+        return (now - self.last_full_scan).total_seconds() > interval
+
+    def needs_metadata_refresh(self, ttl: int) -> bool:
+        """Check if the metadata is older than `ttl` seconds."""
+        if not self.metadata_refreshed_at:
+            return True
+        now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+        return (now - self.metadata_refreshed_at).total_seconds() > ttl
+
 
 class PostLike(Base):
+    # one like per user and post
+    __table_args__ = (
+        db.Index("ix_post_like_user_id_post_id", "user_id", "post_id", unique=True),
+    )
+
     id = mapped_column(db.Integer, primary_key=True)
     user_id = mapped_column(db.Integer, db.ForeignKey("user.id"))
     post_id = mapped_column(db.Integer, db.ForeignKey("post.id"))
 
 
 class PostFave(Base):
+    # one fave per user and post
+    __table_args__ = (
+        db.Index("ix_post_fave_user_id_post_id", "user_id", "post_id", unique=True),
+    )
+
     id = mapped_column(db.Integer, primary_key=True)
     user_id = mapped_column(db.Integer, db.ForeignKey("user.id"))
     post_id = mapped_column(db.Integer, db.ForeignKey("post.id"))
 
 
-# listen for commit and make changes to search index
-db.event.listen(db.session, "before_commit", Post.before_commit)
+# listen for flush and commit and make changes to search index
+db.event.listen(db.session, "before_flush", Post.before_flush)
+db.event.listen(db.session, "after_flush", Post.after_flush)
 db.event.listen(db.session, "after_commit", Post.after_commit)
+db.event.listen(db.session, "after_soft_rollback", Post.after_soft_rollback)
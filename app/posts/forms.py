@@ -3,9 +3,7 @@ from wtforms import StringField, SubmitField
 from wtforms.validators import DataRequired, URL, ValidationError
 
 from app.models import Post
-from app.helpers import youtube_build
-from app.cron.helpers import MaxRetriesExceededError, YouTubeAPI
-from app.posts.helpers import parse_video, validate_video, fetch_video_data
+from app.posts.helpers import parse_video
 
 
 class PostForm(FlaskForm):
@@ -18,7 +16,7 @@ class PostForm(FlaskForm):
 
     def __init__(self):
         super().__init__()
-        self.processed_content = None
+        self.video_id = None
 
     def validate_content(self, content):
         # parse url, it will raise ValidationError if unable
@@ -28,28 +26,5 @@ class PostForm(FlaskForm):
         if Post.query.filter_by(video_id=video_id).first():
             raise ValidationError("Video already posted.")
 
-        # construct youtube API service
-        with youtube_build() as youtube:
-            api = YouTubeAPI(youtube)
-
-            try:
-                # the scope for YouTube API
-                part = ["status", "snippet", "contentDetails"]
-                scope = dict(id=video_id, part=part)
-
-                # this will raise MaxRetriesExceededError if unsuccessful
-                res = api.get_videos(scope)
-
-                # this will raise ValueError or IndexError
-                res = res["items"][0]
-
-                # this will raise exception if unable to fetch
-                if validate_video(res):
-                    self.processed_content = fetch_video_data(res)
-            # if video's not valid
-            except ValidationError:
-                # re-raise the exception thrown from validate_video()
-                raise
-            # if ['items'] list is empty or unable to connect to YT API
-            except (MaxRetriesExceededError, ValueError, IndexError):
-                raise ValidationError("Unable to fetch the video.")
+        # the metadata is fetched and validated by the worker
+        self.video_id = video_id
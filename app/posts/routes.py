@@ -1,16 +1,16 @@
 import time
 from tracemalloc import start
-from wtforms.validators import ValidationError
 
 from flask_login import current_user, login_required
 from flask import render_template, url_for, flash, request
-from flask import redirect, Blueprint, current_app, make_response
+from flask import redirect, Blueprint, current_app, make_response, abort
 
 from app import db
 from app.posts.forms import PostForm
 from app.helpers import admin_required
+from app.cron.queue import HIGH, enqueue
 from app.models import Post, DeletedPost
-from app.posts.helpers import convertDuration, video_banned
+from app.posts.helpers import convertDuration
 
 
 bp = Blueprint("posts", __name__)
@@ -26,11 +26,14 @@ def post(video_id):
     thumb = max(post.thumbnails.values(), key=lambda x: x["width"])["url"]
 
     # get likes text
-    num_likes = post.likes.count()
+    num_likes = post.like_count
     likes = "1 Like" if num_likes == 1 else f"{num_likes} Likes"
     if not num_likes:
         likes = "Like"
 
+    # whether the user liked and faved the post
+    casts = current_user.casts(post) if current_user.is_authenticated else {}
+
     # get the first sentence from the short desc as meta desc
     short_desc = post.short_description
     meta_description = short_desc.partition(".")[0] if short_desc else None
@@ -45,6 +48,7 @@ def post(video_id):
         srcset=post.srcset(),
         human_duration=convertDuration(post.duration).human,
         likes=likes,
+        casts=casts,
         title=post.title,
         related_posts=post.get_related_posts(PER_PAGE),
         meta_description=meta_description,
@@ -55,28 +59,12 @@ def post(video_id):
 @admin_required
 def new_post():
     form = PostForm()
-    # the form will not validate if the video is already in the database,
-    # or if it can't fetch its medatata for various reasons
+    # the form will not validate if the video is already in the database
     if form.validate_on_submit():
-        # if nothing in processed_content
-        if not form.processed_content:
-            raise ValidationError("Unable to fetch the video data.")
-        # check if this video was already deleted
-        # and if true remove it from DeletedPost table
-        if banned := video_banned(form.processed_content["video_id"]):
-            db.session.delete(banned)
-
-        # form.processed_content is a dict, just unpack to transform into kwargs
-        post = Post(**form.processed_content)
-        post.user_id = current_user.id
-        post.author = current_user  # type: ignore
-
-        # add post to database
-        db.session.add(post)
-        db.session.commit()
-
-        flash("Your video has been posted!", "success")
-        return redirect(url_for("posts.post", video_id=post.video_id))
+        # the worker fetches, validates and posts the video
+        enqueue("add_post", HIGH, video_id=form.video_id, user_id=current_user.id)
+        flash("Your video has been queued and will be posted shortly!", "success")
+        return redirect(url_for("main.home"))
 
     return render_template(
         "form.html", title="Suggest YouTube Documentary", form=form, legend="New Video"
@@ -86,12 +74,15 @@ def new_post():
 @bp.route("/video/<string:video_id>/<string:action>", methods=["POST"])
 @login_required
 def perform_action(video_id, action):
-    post = Post.query.filter_by(video_id=video_id).first_or_404()
     if action in ["like", "unlike", "fave", "unfave"]:
-        current_user.cast(post, action)
+        # one statement, the post is looked up by the video id
+        if current_user.cast(video_id, action) is None:
+            abort(404)
         db.session.commit()
         return make_response("Success", 200)
-    elif action == "delete" and current_user.is_admin:
+
+    post = Post.query.filter_by(video_id=video_id).first_or_404()
+    if action == "delete" and current_user.is_admin:
         # add this post to DeletedPost table
         deleted_post = DeletedPost()
         deleted_post.video_id = post.video_id
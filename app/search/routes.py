@@ -8,11 +8,11 @@ from flask import (
     current_app,
     url_for,
     Blueprint,
-    make_response,
     g,
 )
 
 from app.models import Post
+from app.helpers import encode_cursor, decode_cursor, scroll_response
 from app.search.forms import SearchForm
 
 
@@ -34,20 +34,20 @@ def search_results() -> Response | str | list:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # the search results are paged by the index, the cursor holds the next page
+    values = decode_cursor(request.args.get("cursor"))
+    page = values[0] if values and isinstance(values[0], int) else 0
 
-    # starting page is actually ZERO on search
-    offset = page - 1
-
-    # return JSON response for scroll content if ids and total in session
-    if page > 1 and (phrase := request.args.get("q")):
+    # return JSON response for scroll content
+    if request.args.get("cursor"):
+        phrase = request.args.get("q")
+        # an invalid cursor ends the scroll, instead of repeating the first page
+        if not (page and phrase):
+            return scroll_response([], None)
         # get posts for this page
-        posts, _ = Post.search_posts(phrase, offset, per_page)
+        posts, total = Post.search_posts(phrase, page, per_page)
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, next_cursor(page, per_page, total))
 
     # note the time now
     start_time = time.perf_counter()
@@ -59,7 +59,7 @@ def search_results() -> Response | str | list:
     # get phrase from form
     phrase = g.search_form.q.data
     # get the search results
-    posts, total = Post.search_posts(phrase, offset, per_page)
+    posts, total = Post.search_posts(phrase, page, per_page)
 
     # calculate the time it took to get the search results
     time_took = time.perf_counter() - start_time
@@ -68,7 +68,13 @@ def search_results() -> Response | str | list:
     return render_template(
         "search.html",
         posts=posts,
+        cursor=next_cursor(page, per_page, total),
         total=total,
         time_took=f"{time_took:.2f}",
         title="Search",
     )
+
+
+def next_cursor(page: int, per_page: int, total: int) -> str | None:
+    """Cursor of the next search results page, None if it's the last page."""
+    return encode_cursor([page + 1]) if (page + 1) * per_page < total else None
@@ -8,7 +8,8 @@ from collections import OrderedDict
 from flask import Blueprint, make_response, Response
 from flask import render_template, current_app, abort, url_for
 
-from app import cache, db
+from app import db
+from app.caching import cached
 from app.helpers import serve_as
 from app.models import Playlist, Post, Page, Category
 
@@ -17,8 +18,8 @@ bp = Blueprint("sitemap", __name__)
 
 
 @bp.route("/sitemap.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def sitemap_index() -> str:
     """Route to return the sitemap index."""
 
@@ -51,7 +52,7 @@ def sitemap_index() -> str:
     # sources
     lastmods, per_page = [], current_app.config["POSTS_PER_PAGE"]
     for source in Playlist.query:
-        posts = Post.get_playlist_posts(source.playlist_id, 1, per_page)
+        posts, _ = Post.get_playlist_posts(source.playlist_id, None, per_page)
         dates = [post["created_at"] for post in posts]
         lastmods.append(max(dates)) if dates else None
     if lastmods:
@@ -76,8 +77,8 @@ def sitemap_index() -> str:
 
 
 @bp.route("/posts-sitemap-<string:date>.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def posts_sitemap(date: str) -> str:
     """Route to return the posts sitemap."""
 
@@ -101,8 +102,8 @@ def posts_sitemap(date: str) -> str:
 
 
 @bp.route("/pages-sitemap.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def pages_sitemap() -> str:
     """Route to return the pages sitemap."""
 
@@ -120,8 +121,8 @@ def pages_sitemap() -> str:
 
 
 @bp.route("/categories-sitemap.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def categories_sitemap() -> str:
     """Route to return the categories sitemap."""
 
@@ -148,8 +149,8 @@ def categories_sitemap() -> str:
 
 
 @bp.route("/sources-sitemap.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def sources_sitemap() -> str:
     """Route to return the sources sitemap."""
 
@@ -160,11 +161,12 @@ def sources_sitemap() -> str:
         url = url_for(
             "sources.playlist_videos", playlist_id=source.playlist_id, _external=True
         )
-        posts = Post.get_playlist_posts(source.playlist_id, 1, per_page)
+        posts, _ = Post.get_playlist_posts(source.playlist_id, None, per_page)
         dates = [post["created_at"] for post in posts]
         data[url] = max(dates).strftime("%Y-%m-%d")
 
-    if other_posts := Post.get_orphans(1, per_page):
+    other_posts, _ = Post.get_orphans(None, per_page)
+    if other_posts:
         lastmods = [post["created_at"] for post in other_posts]
         url = url_for("sources.orphan_videos", _external=True)
         data[url] = max(lastmods).strftime("%Y-%m-%d")
@@ -176,15 +178,16 @@ def sources_sitemap() -> str:
 
 
 @bp.route("/misc-sitemap.xml")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xml")
+@cached(86400)
 def misc_sitemap():
     """Route to return the miscellaneous sitemap."""
 
     # structure to gather the data
     data, per_page = OrderedDict(), current_app.config["POSTS_PER_PAGE"]
 
-    if posts := Post.get_posts(1, per_page):
+    posts, _ = Post.get_posts(None, per_page)
+    if posts:
         dates = [post["created_at"] for post in posts]
         home_lastmod = max(dates).strftime("%Y-%m-%d")
         data[url_for("main.home", _external=True)] = home_lastmod
@@ -200,7 +203,7 @@ def misc_sitemap():
 
 
 @bp.route("/sitemap.xsl")
-@cache.cached(timeout=86400)
 @serve_as(content_type="text/xsl")
+@cached(86400)
 def sitemap_style():
     return render_template("sitemap.xsl")
@@ -4,8 +4,7 @@ from wtforms.validators import DataRequired, URL, ValidationError
 from flask_wtf import FlaskForm
 
 from app.models import Playlist
-from app.helpers import youtube_build
-from app.sources.helpers import parse_playlist, validate_playlist
+from app.sources.helpers import parse_playlist
 
 
 class PlaylistForm(FlaskForm):
@@ -18,7 +17,7 @@ class PlaylistForm(FlaskForm):
 
     def __init__(self):
         super().__init__()
-        self.processed_content = None
+        self.playlist_id = None
 
     def validate_content(self, content):
         # parse url, it will raise ValidationError if unable
@@ -28,8 +27,5 @@ class PlaylistForm(FlaskForm):
         if Playlist.query.filter_by(playlist_id=playlist_id).first():
             raise ValidationError("Playlist already in the database.")
 
-        # construct youtube API service
-        with youtube_build() as youtube:
-            # get the playlist's metadata
-            # this will raise ValidationError if unable to fetch data
-            self.processed_content = validate_playlist(playlist_id, youtube)
+        # the metadata is fetched by the worker
+        self.playlist_id = playlist_id
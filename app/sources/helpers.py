@@ -14,28 +14,45 @@ def parse_playlist(url):
 
 
 def validate_playlist(playlist_id, youtube):
-    api = YouTubeAPI(youtube)
-
     try:
-        scope = {"id": playlist_id, "part": "snippet"}
-
         # this will raise MaxRetriesExceededError if unsuccessful
-        res = api.get_playlists(scope)
+        # or KeyError if the playlist or its channel doesn't exist
+        return fetch_playlists_metadata([playlist_id], youtube)[playlist_id]
 
-        # this will raise either ValueError or IndexError
-        res = res["items"][0]
+    # could not connect to YT API (MaxRetriesExceededError)
+    # or the playlist doesn't exist (KeyError)
+    except (MaxRetriesExceededError, KeyError):
+        raise ValidationError("Unable to fetch the playlist.")
 
-        channel_id = res["snippet"]["channelId"]
-        scope = {"id": channel_id, "part": "snippet"}
 
-        # this will raise MaxRetriesExceededError if unsuccessful
-        ch = api.get_channels(scope)
+def fetch_playlists_metadata(playlist_ids, youtube):
+    """
+    Get the metadata of up to 50 playlists and their channels
+    with one playlists.list and one channels.list call.
+    The playlists that don't exist (or whose channel doesn't) are left out.
+    This will raise MaxRetriesExceededError if unable to connect.
 
-        # this will raise either ValueError or IndexError
-        ch = ch["items"][0]
+    Returns:
+    dict: The metadata of the playlists by playlist id.
+    """
+    api = YouTubeAPI(youtube)
+
+    scope = {"id": list(playlist_ids), "part": "snippet", "maxResults": 50}
+    playlists = api.get_playlists(scope).get("items", [])
+
+    channel_ids = list({pl["snippet"]["channelId"] for pl in playlists})
+    if not channel_ids:
+        return {}
+    scope = {"id": channel_ids, "part": "snippet", "maxResults": 50}
+    channels = {ch["id"]: ch for ch in api.get_channels(scope).get("items", [])}
 
-        return {
-            "playlist_id": playlist_id,
+    metadata = {}
+    for res in playlists:
+        channel_id = res["snippet"]["channelId"]
+        if not (ch := channels.get(channel_id)):
+            continue
+        metadata[res["id"]] = {
+            "playlist_id": res["id"],
             "channel_id": channel_id,
             "title": res["snippet"]["title"],
             "channel_title": ch["snippet"]["title"],
@@ -45,7 +62,4 @@ def validate_playlist(playlist_id, youtube):
             "channel_description": ch["snippet"].get("description"),
         }
 
-    # could not connect to YT API (MaxRetriesExceededError)
-    # or the playlist doesn't exist (IndexError)
-    except (MaxRetriesExceededError, ValueError, IndexError):
-        raise ValidationError("Unable to fetch the playlist.")
+    return metadata
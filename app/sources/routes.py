@@ -1,5 +1,4 @@
 import time
-from wtforms.validators import ValidationError
 from werkzeug.wrappers.response import Response
 
 from flask_login import current_user
@@ -8,16 +7,15 @@ from flask import (
     Blueprint,
     current_app,
     request,
-    make_response,
     render_template,
     url_for,
     abort,
     flash,
 )
 
-from app import db
 from app.models import Post, Playlist
-from app.helpers import admin_required
+from app.helpers import admin_required, scroll_response
+from app.cron.queue import HIGH, enqueue
 from app.sources.forms import PlaylistForm
 
 
@@ -28,23 +26,12 @@ bp = Blueprint("sources", __name__)
 @admin_required
 def new_playlist() -> Response | str:
     form = PlaylistForm()
-    # the form will not validate if the channel is already in the database,
-    # or if it can't fetch its medatata for various reasons
+    # the form will not validate if the playlist is already in the database
     if form.validate_on_submit():
-        # if nothing in processed_content
-        if not form.processed_content:
-            raise ValidationError("Unable to fetch the source data.")
-        # create object from Model
-        # form.processed_content is a dict, just unpack to transform into kwargs
-        playlist = Playlist(**form.processed_content)
-        playlist.user_id = current_user.id
-        playlist.author = current_user  # type: ignore
-
-        # add to db
-        db.session.add(playlist)
-        db.session.commit()
-
-        flash("Playlist has been added to the database!", "success")
+        # the worker fetches the metadata, adds the playlist and ingests its videos
+        playlist_id, user_id = form.playlist_id, current_user.id
+        enqueue("add_playlist", HIGH, playlist_id=playlist_id, user_id=user_id)
+        flash("Playlist has been queued and will be added shortly!", "success")
         return redirect(url_for("sources.playlists"))
 
     return render_template(
@@ -59,25 +46,27 @@ def playlist_videos(playlist_id) -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
     # check if playlist exists
     playlist = Playlist.query.filter_by(playlist_id=playlist_id).first_or_404()
-    posts = Post.get_playlist_posts(playlist_id, page, per_page)
+    posts, cursor = Post.get_playlist_posts(playlist_id, cursor, per_page)
 
     # return JSON response for scroll content
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     if not posts:
         abort(404)
 
     return render_template(
-        "source.html", posts=posts, title=playlist.title, playlist_id=playlist_id
+        "source.html",
+        posts=posts,
+        cursor=cursor,
+        title=playlist.title,
+        playlist_id=playlist_id,
     )
 
 
@@ -88,23 +77,23 @@ def orphan_videos() -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
     # get orpahn posts
-    posts = Post.get_orphans(page, per_page)
+    posts, cursor = Post.get_orphans(cursor, per_page)
 
     # return JSON response for scroll content
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     if not posts:
         abort(404)
 
-    return render_template("source.html", posts=posts, title="Other Uploads")
+    return render_template(
+        "source.html", posts=posts, cursor=cursor, title="Other Uploads"
+    )
 
 
 @bp.route("/sources/")
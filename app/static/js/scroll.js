@@ -3,8 +3,7 @@ const scroller = document.getElementById("scroller");
 const template = document.getElementById("post_template");
 const sentinel = document.getElementById("sentinel");
 const spinner = sentinel.querySelector('div');
-const postsPerPage = 24; // should correspond with POSTS_PER_PAGE on backend
-let page = 2; // Use infinite scroll from the second page onwards
+let cursor = sentinel.dataset.cursor; // Opaque cursor of the next page
 let nextPage = true; // Assume there is next page to load
 
 
@@ -16,9 +15,9 @@ const noMoreScroll = () => {
 };
 
 // Function to request new items and render to the dom
-const loadItems = (url = '', pageValue = 2) => {
+const loadItems = (url = '', cursorValue = '') => {
 
-    getData(url, pageValue).then(response => {
+    getData(url, cursorValue).then(response => {
 
         // If bad response exit the function
         if (!response.ok) {
@@ -29,7 +28,7 @@ const loadItems = (url = '', pageValue = 2) => {
         response.json().then(data => {
 
             // Iterate over the items in the response
-            for (const item of data) {
+            for (const item of data.posts) {
 
                 // Clone the HTML template
                 const template_clone = template.content.cloneNode(true);
@@ -50,17 +49,22 @@ const loadItems = (url = '', pageValue = 2) => {
                 scroller.appendChild(template_clone);
             }
 
-            // If data.length < posts_per_page there is no next page
-            if (data.length < postsPerPage) {
+            // If there is no cursor there is no next page
+            if (!data.cursor) {
                 return noMoreScroll();
             }
 
-            // Increment the page counter
-            page += 1;
+            // Continue after the last loaded item
+            cursor = data.cursor;
         })
     })
 };
 
+// The first page is the last one
+if (!cursor) {
+    noMoreScroll();
+}
+
 if ('IntersectionObserver' in window) {
     // Create a new IntersectionObserver instance
     let intersectionObserver = new IntersectionObserver(([entry]) => {
@@ -70,7 +74,7 @@ if ('IntersectionObserver' in window) {
             spinner.setAttribute("id", "spinner");
 
             // Call the loadItems function
-            loadItems(`${window.location.href}`, page);
+            loadItems(`${window.location.href}`, cursor);
 
             // Unobserve the entry
             // intersectionObserver.unobserve(entry);
@@ -9,7 +9,6 @@ from flask import (
     redirect,
     Blueprint,
     current_app,
-    make_response,
     render_template,
     url_for,
     flash,
@@ -17,6 +16,8 @@ from flask import (
 )
 
 from app import db
+from app.helpers import scroll_response
+from app.models import PostLike, PostFave, paginate_keyset
 from app.auth.helpers import get_avatar_abs_path
 
 
@@ -38,17 +39,17 @@ def likes() -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
-    liked = current_user.liked.paginate(page=page, per_page=per_page, error_out=False)
-    posts = [item.post.to_dict for item in liked.items]
+    # the most recently liked first
+    keys = [PostLike.id]
+    liked, cursor = paginate_keyset(current_user.liked, keys, cursor, per_page)
+    posts = [item.post.to_dict for item in liked]
 
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     content_title = "Documentaries you like will show up here."
     if total := current_user.liked.count():
@@ -57,6 +58,7 @@ def likes() -> Response | list | str:
     return render_template(
         "library.html",
         posts=posts,
+        cursor=cursor,
         total=total,
         title="Liked",
         content_title=content_title,
@@ -71,17 +73,17 @@ def favorites() -> Response | list | str:
     # posts per page
     per_page = current_app.config["POSTS_PER_PAGE"]
 
-    try:  # get page number in URL query params
-        page = int(str(request.args.get("page")))
-    except ValueError:
-        page = 1
+    # cursor of the last post on the previous page, if any
+    cursor = request.args.get("cursor")
 
-    faved = current_user.faved.paginate(page=page, per_page=per_page, error_out=False)
-    posts = [item.post.to_dict for item in faved.items]
+    # the most recently faved first
+    keys = [PostFave.id]
+    faved, cursor = paginate_keyset(current_user.faved, keys, cursor, per_page)
+    posts = [item.post.to_dict for item in faved]
 
-    if page > 1:
+    if request.args.get("cursor"):
         time.sleep(0.4)
-        return posts or make_response([], 404)
+        return scroll_response(posts, cursor)
 
     content_title = "Your favorite documentaries will show up here."
     if total := current_user.faved.count():
@@ -90,6 +92,7 @@ def favorites() -> Response | list | str:
     return render_template(
         "library.html",
         posts=posts,
+        cursor=cursor,
         total=total,
         title="Favorites",
         content_title=content_title,
@@ -118,6 +121,8 @@ def delete_account():
 
     # get avatar absolute path before deleting user
     avatar_path = get_avatar_abs_path(current_user)
+    # the user's likes and faves are deleted along with the user
+    current_user.uncast_all()
     # remove user
     db.session.delete(current_user)
     db.session.commit()
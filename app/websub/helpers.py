@@ -0,0 +1,145 @@
+"""
+YouTube push notifications via WebSub (PubSubHubbub)
+https://developers.google.com/youtube/v3/guides/push_notifications
+https://www.w3.org/TR/websub/
+"""
+
+import hmac
+import hashlib
+import requests
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse, parse_qs
+
+from flask import current_app
+
+from app.models import Playlist
+
+
+# Redis hash of the notified videos waiting to be ingested (video id -> channel id)
+PENDING_KEY = "websub:pending"
+# Redis hash of the failed ingest attempts of the pending videos (video id -> count)
+ATTEMPTS_KEY = "websub:attempts"
+# seconds the hub has to verify a (un)subscription we asked for
+INTENT_TIMEOUT = 3600
+
+NAMESPACES = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "yt": "http://www.youtube.com/xml/schemas/2015",
+}
+
+
+def topic_url(channel_id: str) -> str:
+    """The channel's Atom feed, the topic to subscribe to."""
+    return f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"
+
+
+def parse_topic(topic: str) -> str | None:
+    """Get the channel id from a topic URL."""
+    if query := parse_qs(urlparse(topic).query).get("channel_id"):
+        return query[0]
+    return None
+
+
+def lease_key(channel_id: str) -> str:
+    return f"websub:lease:{channel_id}"
+
+
+def intent_key(channel_id: str) -> str:
+    """Key of the (un)subscription asked for, which the hub is yet to verify."""
+    return f"websub:intent:{channel_id}"
+
+
+def callback_url() -> str:
+    return f"https://{current_app.config['DOMAIN']}/websub/callback"
+
+
+def verify_signature(body: bytes, signature: str | None) -> bool:
+    """
+    Verify the HMAC signature of the notification body.
+    Without a secret nothing can be verified, so nothing is accepted.
+    """
+    if not (secret := current_app.config["WEBSUB_SECRET"]):
+        return False
+    if not signature or "=" not in signature:
+        return False
+    method, digest = signature.split("=", 1)
+    if method not in ("sha1", "sha256", "sha384", "sha512"):
+        return False
+    expected = hmac.new(secret.encode(), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, digest)
+
+
+def parse_notification(body: bytes) -> dict[str, str]:
+    """
+    Get the videos from an Atom notification.
+    Deleted entries are ignored, those are left to the reconciliation scans.
+
+    Returns:
+    dict: Channel id by video id.
+    """
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return {}
+
+    videos = {}
+    for entry in root.findall("atom:entry", NAMESPACES):
+        video_id = entry.findtext("yt:videoId", namespaces=NAMESPACES)
+        channel_id = entry.findtext("yt:channelId", namespaces=NAMESPACES)
+        if video_id and channel_id:
+            videos[video_id] = channel_id
+
+    return videos
+
+
+def subscribe(channel_id: str, mode: str = "subscribe") -> bool:
+    """
+    Ask the hub to (un)subscribe to the channel's feed.
+    The hub confirms asynchronously by calling the callback with a challenge.
+    Refused without a secret, the notifications couldn't be verified.
+    """
+    if not (secret := current_app.config["WEBSUB_SECRET"]):
+        current_app.logger.warning("WEBSUB_SECRET is not set, not subscribing.")
+        return False
+
+    # the callback confirms only the (un)subscriptions asked for
+    redis_client = current_app.config["REDIS_CLIENT"]
+    redis_client.setex(intent_key(channel_id), INTENT_TIMEOUT, mode)
+
+    data = {
+        "hub.callback": callback_url(),
+        "hub.topic": topic_url(channel_id),
+        "hub.mode": mode,
+        "hub.verify": "async",
+        "hub.lease_seconds": current_app.config["WEBSUB_LEASE_SECONDS"],
+        "hub.secret": secret,
+    }
+
+    try:
+        hub = current_app.config["WEBSUB_HUB"]
+        response = requests.post(hub, data=data, timeout=10)
+    except requests.RequestException as e:
+        current_app.logger.warning(f"Could not subscribe to {channel_id}. Error: {e}")
+        return False
+
+    return response.status_code in (202, 204)
+
+
+def renew_subscriptions() -> int:
+    """
+    Subscribe to the feeds of the channels without a lease
+    or with a lease expiring within a day. Return the number of requests.
+    """
+    if not current_app.config["WEBSUB_SECRET"]:
+        current_app.logger.warning("WEBSUB_SECRET is not set, not subscribing.")
+        return 0
+
+    redis_client = current_app.config["REDIS_CLIENT"]
+    count = 0
+    for (channel_id,) in Playlist.query.with_entities(Playlist.channel_id):
+        # TTL is negative if the key doesn't exist
+        if redis_client.ttl(lease_key(channel_id)) > 86400:
+            continue
+        if subscribe(channel_id):
+            count += 1
+    return count
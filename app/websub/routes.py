@@ -0,0 +1,65 @@
+from werkzeug.wrappers.response import Response
+from flask import Blueprint, current_app, request, make_response, abort
+
+from app.websub.helpers import (
+    PENDING_KEY,
+    intent_key,
+    lease_key,
+    parse_topic,
+    parse_notification,
+    verify_signature,
+)
+
+
+bp = Blueprint("websub", __name__)
+
+
+@bp.route("/websub/callback", methods=["GET"])
+def verify() -> Response:
+    """Confirm a (un)subscription by echoing the hub's challenge."""
+    mode = request.args.get("hub.mode")
+    challenge = request.args.get("hub.challenge")
+    channel_id = parse_topic(request.args.get("hub.topic", ""))
+
+    if not (mode and challenge and channel_id):
+        abort(404)
+
+    redis_client = current_app.config["REDIS_CLIENT"]
+
+    # confirm only the (un)subscriptions we asked for, once
+    if redis_client.get(intent_key(channel_id)) != mode.encode():
+        abort(404)
+    redis_client.delete(intent_key(channel_id))
+
+    if mode == "subscribe":
+        max_lease = current_app.config["WEBSUB_LEASE_SECONDS"]
+        try:
+            lease_seconds = int(request.args.get("hub.lease_seconds", ""))
+        except ValueError:
+            lease_seconds = max_lease
+        # a longer lease than asked for would hold off the renewals
+        lease_seconds = min(max(lease_seconds, 1), max_lease)
+        # remember when the subscription expires, so it can be renewed
+        redis_client.setex(lease_key(channel_id), lease_seconds, "1")
+    elif mode == "unsubscribe":
+        redis_client.delete(lease_key(channel_id))
+
+    response = make_response(challenge, 200)
+    response.headers["content-type"] = "text/plain; charset=utf-8"
+    return response
+
+
+@bp.route("/websub/callback", methods=["POST"])
+def notify() -> Response:
+    """
+    Accept a notification about new or updated videos and leave them
+    pending for the worker. Respond right away, as the hub expects.
+    """
+    body = request.get_data()
+    if verify_signature(body, request.headers.get("X-Hub-Signature")):
+        if videos := parse_notification(body):
+            redis_client = current_app.config["REDIS_CLIENT"]
+            redis_client.hset(PENDING_KEY, mapping=videos)  # type: ignore
+
+    # acknowledge even an invalid signature, as the spec requires
+    return make_response("", 204)
@@ -0,0 +1,30 @@
+"""
+Size and decode time of a cached page of cards,
+the packed tuples against the pickled `to_dict` list.
+
+python -m benchmarks.cards
+"""
+
+import pickle
+import timeit
+
+from app import cards
+from tests.unit.test_cards import sample_page
+
+
+def benchmark(number: int = 2000) -> None:
+    page = sample_page()
+    current = pickle.dumps(page)
+    packed = pickle.dumps(cards.page.pack(page))
+    print(f"size: {len(current)} B pickled dicts, {len(packed)} B packed")
+
+    for name, decode in (
+        ("pickled dicts", lambda: pickle.loads(current)),
+        ("packed", lambda: cards.page.unpack(pickle.loads(packed))),
+    ):
+        seconds = timeit.timeit(decode, number=number)
+        print(f"decode {name}: {seconds / number * 1e6:.1f} µs per page")
+
+
+if __name__ == "__main__":
+    benchmark()
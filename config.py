@@ -31,6 +31,36 @@ class Config:
 
     # ======================================== #
 
+    # Worker settings
+    WORKER_CONCURRENCY = load_env("WORKER_CONCURRENCY") or 8
+    WORKER_BATCH_SIZE = load_env("WORKER_BATCH_SIZE") or 100
+    # pages of videos buffered between the fetching and the ingesting threads,
+    # and video ids remembered to drop the duplicates across playlists
+    WORKER_QUEUE_SIZE = load_env("WORKER_QUEUE_SIZE") or 32
+    WORKER_DEDUPE_SIZE = load_env("WORKER_DEDUPE_SIZE") or 100000
+    # max number of orphan posts revalidated against YouTube per run
+    WORKER_REVALIDATION_BUDGET = load_env("WORKER_REVALIDATION_BUDGET") or 500
+    # local category classifier, min training posts and min confidence to use it
+    CLASSIFIER_MIN_DOCS = load_env("CLASSIFIER_MIN_DOCS") or 200
+    CLASSIFIER_THRESHOLD = load_env("CLASSIFIER_THRESHOLD") or 0.9
+    # seconds between full (reconciliation) scans of a playlist
+    WORKER_FULL_SCAN_INTERVAL = load_env("WORKER_FULL_SCAN_INTERVAL") or 604800
+    # seconds before the playlists and channels metadata is refreshed
+    SOURCE_METADATA_TTL = load_env("SOURCE_METADATA_TTL") or 86400
+    # seconds a reserved job is hidden from the other consumers, and attempts per job
+    JOB_VISIBILITY_TIMEOUT = load_env("JOB_VISIBILITY_TIMEOUT") or 1800
+    JOB_MAX_ATTEMPTS = load_env("JOB_MAX_ATTEMPTS") or 5
+    # seconds an interrupted run can be resumed since its last checkpoint
+    WORKER_JOURNAL_TTL = load_env("WORKER_JOURNAL_TTL") or 86400
+    # seconds before the lease of a dead worker instance expires
+    WORKER_LOCK_TTL = load_env("WORKER_LOCK_TTL") or 60
+    # number of shards the catalog is split into, for running on several nodes,
+    # and seconds a processed shard is left alone (less than the runs interval)
+    WORKER_SHARDS = load_env("WORKER_SHARDS") or 1
+    WORKER_SHARD_COOLDOWN = load_env("WORKER_SHARD_COOLDOWN") or 1800
+
+    # ======================================== #
+
     # FB APIs settings
     FB_CLIENT_ID = str(load_env("FB_CLIENT_ID"))
     FB_CLIENT_SECRET = load_env("FB_CLIENT_SECRET")
@@ -46,12 +76,32 @@ class Config:
     YOUTUBE_API_KEY = load_env("YOUTUBE_API_KEY")
     GEMINI_API_KEY = load_env("GEMINI_API_KEY")
     GEMINI_MODEL = load_env("GEMINI_MODEL") or "gemini-2.5-flash"
+    # the model's requests per minute limit
+    GEMINI_RPM = load_env("GEMINI_RPM") or 60
+    YOUTUBE_RPS = load_env("YOUTUBE_RPS") or 10
+    # seconds to keep the YouTube responses for conditional (ETag) requests
+    YOUTUBE_ETAG_TIMEOUT = load_env("YOUTUBE_ETAG_TIMEOUT") or 604800
+    # consecutive upstream failures that open the circuit, seconds it stays open
+    API_FAILURE_THRESHOLD = load_env("API_FAILURE_THRESHOLD") or 5
+    API_RESET_TIMEOUT = load_env("API_RESET_TIMEOUT") or 60
+    # seconds to keep the memoized Gemini outputs
+    GENERATED_INFO_CACHE_TIMEOUT = load_env("GENERATED_INFO_CACHE_TIMEOUT") or 7776000
     GOOGLE_OAUTH_SCOPES = load_env("GOOGLE_OAUTH_SCOPES")
     _GOOGLE_OAUTH_CLIENT_BASE64 = load_env("GOOGLE_OAUTH_CLIENT") or ""
     GOOGLE_OAUTH_CLIENT = json.loads(base64.b64decode(_GOOGLE_OAUTH_CLIENT_BASE64))
 
     # ======================================== #
 
+    # WebSub (YouTube push notifications)
+    WEBSUB_HUB = load_env("WEBSUB_HUB") or "https://pubsubhubbub.appspot.com/subscribe"
+    # required, the unsigned notifications are ignored
+    WEBSUB_SECRET = load_env("WEBSUB_SECRET")
+    WEBSUB_LEASE_SECONDS = load_env("WEBSUB_LEASE_SECONDS") or 432000
+    # tries to ingest a notified video before giving up on it
+    WEBSUB_MAX_ATTEMPTS = load_env("WEBSUB_MAX_ATTEMPTS") or 5
+
+    # ======================================== #
+
     # AdSense
     ADSENSE_ACCOUNT = load_env("ADSENSE_ACCOUNT")
     AD_SLOT_SIDEBAR = load_env("AD_SLOT_SIDEBAR")
@@ -76,6 +126,20 @@ class Config:
     # Flask-Caching
     CACHE_TYPE = load_env("CACHE_TYPE") or "SimpleCache"
     CACHE_DEFAULT_TIMEOUT = load_env("CACHE_DEFAULT_TIMEOUT") or 300
+    # the tagged listings are invalidated on change, they can live long
+    CACHE_TAGGED_TIMEOUT = load_env("CACHE_TAGGED_TIMEOUT") or 604800
+    # per-process LRU cache in front of Redis, 0 entries disables it
+    CACHE_LOCAL_SIZE = load_env("CACHE_LOCAL_SIZE")
+    CACHE_LOCAL_SIZE = 1024 if CACHE_LOCAL_SIZE is None else CACHE_LOCAL_SIZE
+    CACHE_LOCAL_TTL = load_env("CACHE_LOCAL_TTL") or 10
+    # how long past their timeout the stale entries are still served
+    CACHE_STALE_TIMEOUT = load_env("CACHE_STALE_TIMEOUT") or 86400
+    # lock of the request recomputing an entry, in case it dies
+    CACHE_LOCK_TIMEOUT = load_env("CACHE_LOCK_TIMEOUT") or 30
+    # the warmer's budget, seconds and concurrent queries, and pages per listing
+    CACHE_WARM_TIMEOUT = load_env("CACHE_WARM_TIMEOUT") or 300
+    CACHE_WARM_WORKERS = load_env("CACHE_WARM_WORKERS") or 4
+    CACHE_WARM_PAGES = load_env("CACHE_WARM_PAGES") or 2
     CACHE_REDIS_URL = (
         f"redis://{REDIS_USERNAME}:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}"
     )
@@ -1,7 +1,13 @@
+import os
 import pytest
+import sqlalchemy
+import datetime as dt
+from fnmatch import fnmatch
+from flask import Flask
+from redis.exceptions import ResponseError
 
-from app import create_app
-from app.models import User
+from app import create_app, db, cache
+from app.models import User, Post
 
 
 @pytest.fixture()
@@ -36,3 +42,293 @@ def new_facebook_user():
     facebook_info = user_info().copy()
     facebook_info["facebook_id"] = "0987654321"
     return User(**facebook_info)
+
+
+def encode(value) -> bytes:
+    """A value as Redis returns it."""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, f)(*args, **kw) for f, args, kw in self.calls]
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def subscribe(self, **handlers):
+        self.redis.handlers.update(handlers)
+
+    def run_in_thread(self, **kwargs):
+        pass
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the Redis commands the app uses.
+    The expiry times are recorded but never enforced, the values are returned
+    as bytes, like Redis does, the Lua scripts are emulated and the messages
+    are delivered to the subscribers right away.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}  # key -> seconds to expire
+        self.handlers = {}
+        self.calls = 0  # number of mget round trips
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def pubsub(self, **kwargs):
+        return FakePubSub(self)
+
+    def publish(self, channel, message):
+        if handler := self.handlers.get(channel):
+            handler({"channel": channel, "data": message})
+
+    def register_script(self, script):
+        def run(keys, args):
+            # move a job between two sorted sets, if it's still in the first one
+            if "ZREM" in script:
+                source, destination = keys
+                job_id, score = args
+                if self.zrem(source, job_id):
+                    self.zadd(destination, {job_id: float(score)})
+                    return 1
+                return 0
+            # renew or release a lease, if it still holds the token
+            if self.get(keys[0]) != encode(args[0]):
+                return 0
+            if "DEL" in script:
+                return self.delete(keys[0])
+            return 1
+
+        return run
+
+    # keys and strings
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self.calls += 1
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = encode(value)
+        self.ttls.pop(key, None)
+        if ex or px:
+            self.expire(key, ex or px / 1000)
+        return True
+
+    def setex(self, key, time, value):
+        if time <= 0:
+            raise ResponseError("invalid expire time in 'setex' command")
+        return self.set(key, value, ex=time)
+
+    def incr(self, key):
+        value = int(self.data.get(key) or 0) + 1
+        self.data[key] = encode(value)
+        return value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.ttls.pop(key, None)
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def expire(self, key, time):
+        if key not in self.data:
+            return 0
+        self.ttls[key] = time
+        return 1
+
+    def ttl(self, key):
+        if key not in self.data:
+            return -2
+        return self.ttls.get(key, -1)
+
+    def scan_iter(self, match):
+        return (encode(key) for key in list(self.data) if fnmatch(key, match))
+
+    # hashes
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        mapping = mapping or {field: value}
+        hash = self.data.setdefault(key, {})
+        hash.update({encode(k): encode(v) for k, v in mapping.items()})
+        return len(mapping)
+
+    def hsetnx(self, key, field, value):
+        if self.hexists(key, field):
+            return 0
+        return self.hset(key, field, value)
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(encode(field))
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hexists(self, key, field):
+        return encode(field) in self.data.get(key, {})
+
+    def hdel(self, key, *fields):
+        hash = self.data.get(key, {})
+        return sum(hash.pop(encode(field), None) is not None for field in fields)
+
+    def hincrby(self, key, field, amount=1):
+        value = int(self.hget(key, field) or 0) + amount
+        self.hset(key, field, value)
+        return value
+
+    # sets
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(map(encode, members))
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    # sorted sets
+
+    def zadd(self, key, mapping):
+        zset = self.data.setdefault(key, {})
+        zset.update({encode(member): score for member, score in mapping.items()})
+
+    def zrem(self, key, member):
+        return int(self.data.get(key, {}).pop(encode(member), None) is not None)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zrange(self, key, start, end):
+        members = sorted(self.data.get(key, {}).items(), key=lambda x: x[1])
+        return [member for member, _ in members][start : end + 1 or None]
+
+    def zrangebyscore(self, key, low, high):
+        members = sorted(self.data.get(key, {}).items(), key=lambda x: x[1])
+        return [member for member, score in members if score <= high]
+
+    # lists
+
+    def lpush(self, key, *values):
+        for value in values:
+            self.data.setdefault(key, []).insert(0, encode(value))
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data.get(key, [])[start : end + 1 or None]
+
+    def lrange(self, key, start, end):
+        return self.data.get(key, [])[start : end + 1 or None]
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+
+@pytest.fixture()
+def redis_client():
+    return FakeRedis()
+
+
+class FakeSearchIndex:
+    """In-memory stand-in for the RediSearch index, the documents by id."""
+
+    def __init__(self):
+        self.documents = {}
+
+    def add_document(self, doc_id, replace=False, **fields):
+        self.documents[doc_id] = fields
+
+    def delete_document(self, doc_id, delete_actual_document=False):
+        self.documents.pop(doc_id, None)
+
+
+def autocommit_driver(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def begin_transaction(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+def database_app(database_uri: str, redis_client: FakeRedis) -> Flask:
+    """Bare app with a database, a fake Redis and search index."""
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "SQLALCHEMY_DATABASE_URI": database_uri,
+            "CACHE_TYPE": "SimpleCache",
+            "CACHE_TAGGED_TIMEOUT": 60,
+            "CACHE_LOCAL_SIZE": 0,
+            "REDIS_CLIENT": redis_client,
+            "SEARCH_INDEX": FakeSearchIndex(),
+        }
+    )
+    db.init_app(app)
+    cache.init_app(app)
+    return app
+
+
+@pytest.fixture()
+def db_app(redis_client):
+    """Bare app with an in-memory database."""
+    app = database_app("sqlite://", redis_client)
+    with app.app_context():
+        # let SQLAlchemy begin the transactions, pysqlite breaks the savepoints
+        # https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#pysqlite-serializable
+        sqlalchemy.event.listen(db.engine, "connect", autocommit_driver)
+        sqlalchemy.event.listen(db.engine, "begin", begin_transaction)
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture()
+def pg_app(redis_client):
+    """
+    Bare app with a PostgreSQL database, for the statements SQLite lacks.
+    The database at TEST_DATABASE_URL is emptied, skipped if it's not set.
+    """
+    if not (database_uri := os.getenv("TEST_DATABASE_URL")):
+        pytest.skip("TEST_DATABASE_URL is not set.")
+    app = database_app(database_uri, redis_client)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def make_post():
+    """Factory of the new posts, by video id."""
+
+    def make(video_id: str) -> Post:
+        thumbnail = {"url": f"https://i.ytimg.com/vi/{video_id}", "width": 320}
+        return Post(
+            video_id=video_id,
+            title=f"Video {video_id}",
+            thumbnails={"medium": thumbnail},
+            duration="PT1H",
+            upload_date=dt.datetime(2024, 1, 1),
+        )
+
+    return make
@@ -0,0 +1,168 @@
+import pytest
+from flask import Flask
+
+from app import db, cache, caching
+from app.models import Post
+from app.caching import LocalCache, Entry, tagged, bump, _local_caches
+
+
+@pytest.fixture()
+def cache_app(redis_client):
+    """Bare app with a local cache and a fake Redis for the generations."""
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "CACHE_TYPE": "SimpleCache",
+            "CACHE_TAGGED_TIMEOUT": 60,
+            "CACHE_LOCAL_SIZE": 16,
+            "CACHE_LOCAL_TTL": 60,
+            "CACHE_STALE_TIMEOUT": 60,
+            "CACHE_LOCK_TIMEOUT": 30,
+            "REDIS_CLIENT": redis_client,
+        }
+    )
+    cache.init_app(app)
+    _local_caches.clear()
+    with app.app_context():
+        yield app
+    _local_caches.clear()
+
+
+def test_tagged_invalidation(cache_app):
+    """
+    GIVEN a function cached with a tag per playlist
+    WHEN the tag of one playlist is bumped
+    THEN check only that playlist's result is computed again
+    """
+    calls = []
+
+    @tagged("posts", lambda playlist_id: f"playlist:{playlist_id}")
+    def playlist_posts(playlist_id):
+        calls.append(playlist_id)
+        return [playlist_id]
+
+    assert playlist_posts("PL1") == ["PL1"] and playlist_posts("PL2") == ["PL2"]
+    playlist_posts("PL1"), playlist_posts("PL2")
+    assert calls == ["PL1", "PL2"]
+
+    bump("playlist:PL1")
+    playlist_posts("PL1"), playlist_posts("PL2")
+    assert calls == ["PL1", "PL2", "PL1"]
+
+    bump("posts")
+    playlist_posts("PL2")
+    assert calls == ["PL1", "PL2", "PL1", "PL2"]
+
+
+def test_local_cache_tier(cache_app):
+    """
+    GIVEN a cached function with the local cache in front of Redis
+    WHEN it's called repeatedly and then its tag is bumped by another process
+    THEN check the repeated calls don't reach Redis
+    and the bump is fanned out to the local cache
+    """
+    redis_client = cache_app.config["REDIS_CLIENT"]
+    calls = []
+
+    @tagged("posts")
+    def home():
+        calls.append(1)
+        return ["post"]
+
+    home()
+    redis_calls = redis_client.calls
+    for _ in range(10):
+        assert home() == ["post"]
+    assert redis_client.calls == redis_calls and len(calls) == 1
+
+    # another process bumps the tag and publishes it
+    redis_client.incr("cache:gen:posts")
+    redis_client.publish("cache:invalidate", '["posts"]')
+    home()
+    assert len(calls) == 2
+
+
+def test_stale_while_revalidate(cache_app, monkeypatch):
+    """
+    GIVEN a cached function whose tag is bumped while another process
+    is already recomputing it
+    WHEN it's called
+    THEN check the stale value is served without computing it again,
+    and a soft expired value is refreshed by one caller only
+    """
+    cache_app.config["CACHE_LOCAL_SIZE"] = 0
+    redis_client = cache_app.config["REDIS_CLIENT"]
+    calls = []
+
+    @tagged("posts")
+    def home():
+        calls.append(1)
+        return len(calls)
+
+    key, version = home.cache_key()
+    assert home() == 1
+
+    # another process holds the lock
+    redis_client.incr("cache:gen:posts")
+    redis_client.set(f"{key}:lock", 1)
+    assert home() == 1 and len(calls) == 1
+
+    redis_client.delete(f"{key}:lock")
+    assert home() == 2 and len(calls) == 2
+
+    # soft expired, refreshed once, in the background
+    monkeypatch.setattr(caching, "in_background", lambda func: func())
+    key, version = home.cache_key()
+    cache.set(key, Entry(2, version, expires_at=0, delta=0.1))
+    assert home() == 2 and len(calls) == 3
+    assert home() == 3 and len(calls) == 3
+    assert f"{key}:lock" not in redis_client.data
+
+
+def test_local_cache_eviction():
+    """
+    GIVEN a local cache of two entries
+    WHEN a third entry is added
+    THEN check the least recently used entry is evicted
+    """
+    local = LocalCache(maxsize=2, ttl=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")
+    local.set("c", 3)
+    assert (local.get("a"), local.get("b"), local.get("c")) == (1, None, 3)
+
+    expired = LocalCache(maxsize=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
+
+
+def test_post_cache_tags():
+    """
+    GIVEN a new post in a category and a playlist
+    WHEN its cache tags are requested
+    THEN check they're the listings it shows in
+    """
+    post = Post(video_id="abc", category_id=3, playlist_id="PL1")
+    assert post.cache_tags(added_or_deleted=True) == {
+        "posts",
+        "orphans",
+        "categories",
+        "category:3",
+        "playlist:PL1",
+    }
+
+
+def test_tags_bumped_on_outer_commit(db_app, make_post):
+    """
+    GIVEN a new post added in a savepoint
+    WHEN the savepoint is released and then the transaction commits
+    THEN check the tags are bumped only by the outer commit
+    """
+    redis_client = db_app.config["REDIS_CLIENT"]
+    with db.session.begin_nested():
+        db.session.add(make_post("a"))
+    assert redis_client.get("cache:gen:posts") is None
+
+    db.session.commit()
+    assert redis_client.get("cache:gen:posts") == b"1"
@@ -0,0 +1,49 @@
+import pickle
+import datetime as dt
+
+from app import cards
+from app.models import Post
+
+
+def sample_page(count: int = 24) -> tuple[list[dict], str]:
+    """A page of cards as the listings return them, with a cursor."""
+    posts = []
+    for i in range(count):
+        video_id = f"vid{i:08d}"
+        base = f"https://i.ytimg.com/vi/{video_id}"
+        sizes = [("default", "default", 120, 90), ("medium", "mqdefault", 320, 180)]
+        sizes += [("high", "hqdefault", 480, 360), ("standard", "sddefault", 640, 480)]
+        thumbnails = {
+            size: {"url": f"{base}/{name}.jpg", "width": width, "height": height}
+            for size, name, width, height in sizes
+        }
+        now = dt.datetime(2024, 1, 1, 12, 0) + dt.timedelta(seconds=i, microseconds=7)
+        posts.append(
+            Post(
+                video_id=video_id,
+                title=f"The Secret Life of Plants & Trees, Part {i}",
+                thumbnails=thumbnails,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+    return [post.to_dict for post in posts], "eyJpZCI6IDQyfQ"
+
+
+def test_cards_round_trip():
+    """
+    GIVEN a page of post cards
+    WHEN it's packed, pickled and unpacked
+    THEN check the cards are the same and the page is several times smaller
+    """
+    page = sample_page()
+    packed = pickle.dumps(cards.page.pack(page))
+    posts, cursor = cards.page.unpack(pickle.loads(packed))
+
+    assert cursor == page[1]
+    assert posts == page[0]
+    assert str(posts[0]["title"]) == "The Secret Life of Plants &amp; Trees, Part 0"
+    assert len(pickle.dumps(page)) > 3 * len(packed)
+
+    assert cards.listing.unpack(cards.listing.pack([])) == []
+
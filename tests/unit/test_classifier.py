@@ -0,0 +1,58 @@
+from app.cron.classifier import CategoryClassifier
+
+
+def trained_classifier():
+    classifier = CategoryClassifier()
+    classifier.partial_fit(1, "Lions of the African Savanna wildlife", 1)
+    classifier.partial_fit(2, "Sharks wildlife ocean", 1)
+    classifier.partial_fit(3, "World War Two battle history", 2)
+    classifier.partial_fit(4, "Roman Empire ancient history", 2)
+    return classifier
+
+
+def test_predict():
+    """
+    GIVEN a classifier trained on labelled posts
+    WHEN new titles are classified
+    THEN check the predicted categories
+    """
+    classifier = trained_classifier()
+    assert classifier.predict("Ocean wildlife")[0] == 1
+    assert classifier.predict("Ancient Roman battle")[0] == 2
+
+
+def test_partial_fit_is_incremental():
+    """
+    GIVEN a trained classifier
+    WHEN it's fed an already learned post
+    THEN check it's not learned twice and a changed category is noticed
+    """
+    classifier = trained_classifier()
+    classifier.partial_fit(1, "Lions of the African Savanna wildlife", 1)
+    assert classifier.num_docs == 4
+    assert not classifier.relabelled({1: 1, 3: 2, 5: 1})
+    assert classifier.relabelled({1: 2})
+
+
+def test_save_and_load(tmp_path):
+    """
+    GIVEN a trained classifier
+    WHEN saved to disk and loaded back
+    THEN check it predicts the same and remembers the learned posts
+    """
+    classifier = trained_classifier()
+    path = str(tmp_path / "classifier.npz")
+    classifier.save(path)
+    loaded = CategoryClassifier.load(path)
+    assert loaded.trained == {1: 1, 2: 1, 3: 2, 4: 2}
+    assert loaded.predict("Ocean wildlife") == classifier.predict("Ocean wildlife")
+
+
+def test_untrained():
+    """
+    GIVEN a missing model file
+    WHEN loaded
+    THEN check an untrained classifier makes no prediction
+    """
+    classifier = CategoryClassifier.load("/nonexistent/classifier.npz")
+    assert classifier.predict("Ocean wildlife") == (None, 0.0)
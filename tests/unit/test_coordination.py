@@ -0,0 +1,102 @@
+import pytest
+from flask import Flask
+
+from app.cron.coordination import (
+    HashRing,
+    Lease,
+    LeaseNotAcquiredError,
+    claim_shard,
+    claim_catalog,
+    run_lock,
+    shards_in_progress,
+)
+
+
+def test_lease_is_exclusive(redis_client):
+    """
+    GIVEN a lease held by one instance
+    WHEN another instance tries to take it
+    THEN check it can't, until the lease is released
+    """
+    first = Lease(redis_client, "worker:lock:run")
+    second = Lease(redis_client, "worker:lock:run")
+
+    with first:
+        assert first.renew()
+        assert not second.renew()
+        with pytest.raises(LeaseNotAcquiredError):
+            with second:
+                pass
+
+    assert second.acquire()
+    # releasing someone else's lease does nothing
+    first.release()
+    assert redis_client.get("worker:lock:run") == second.token.encode()
+
+
+def test_hash_ring_consistency():
+    """
+    GIVEN a consistent hashing ring of 4 nodes
+    WHEN a fifth node is added
+    THEN check the keys are spread and only about a fifth of them move
+    """
+    keys = [f"PL{i}" for i in range(2000)]
+    ring = HashRing(list(range(4)))
+    before = {key: ring.node(key) for key in keys}
+    assert all(list(before.values()).count(node) > 300 for node in range(4))
+
+    ring = HashRing(list(range(5)))
+    moved = [key for key in keys if ring.node(key) != before[key]]
+    assert 0.1 < len(moved) / len(keys) < 0.3
+    # keys move only to the new node
+    assert all(ring.node(key) == 4 for key in moved)
+
+
+def test_plain_and_sharded_runs_exclusive(redis_client):
+    """
+    GIVEN a plain worker run holding its lease
+    WHEN a sharded run tries to claim a shard, and the other way around
+    THEN check the later one backs off
+    """
+    app = Flask(__name__)
+    app.config.update(
+        {"REDIS_CLIENT": redis_client, "WORKER_SHARDS": 2, "WORKER_LOCK_TTL": 60}
+    )
+    with app.app_context():
+        with run_lock("run"):
+            assert claim_shard(exclude=set()) is None
+            assert not shards_in_progress()
+
+        shard = claim_shard(exclude=set())
+        assert shard and shards_in_progress()
+
+
+def test_catalog_work_once_per_cycle(redis_client):
+    """
+    GIVEN two shards processed by different instances
+    WHEN they try to take the catalog wide work after their shard
+    THEN check only the one finishing the last shard takes it, once per cycle
+    """
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "REDIS_CLIENT": redis_client,
+            "WORKER_SHARDS": 2,
+            "WORKER_LOCK_TTL": 60,
+            "WORKER_SHARD_COOLDOWN": 1800,
+        }
+    )
+    with app.app_context():
+        first, second = claim_shard(exclude=set()), claim_shard(exclude={0})
+        first.mark_done()
+        assert claim_catalog() is None
+
+        second.mark_done()
+        lease = claim_catalog()
+        assert lease and claim_catalog() is None
+        lease.release()
+        assert claim_catalog() is None
+
+        # a shard done again makes it pending again
+        second.mark_done()
+        assert claim_catalog()
@@ -0,0 +1,131 @@
+import pytest
+from flask import Flask
+
+from app import db
+from app.models import Post, PostLike
+from app.cron.handlers import (
+    Documentary,
+    generate_info,
+    generated_info_key,
+    save_posts,
+    commit_batch,
+    reconcile_counters,
+)
+
+
+@pytest.fixture()
+def worker_app():
+    """Bare app with just the config the API upstream guards need."""
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "GEMINI_RPM": 6000,
+            "YOUTUBE_RPS": 100,
+            "API_FAILURE_THRESHOLD": 5,
+            "API_RESET_TIMEOUT": 60,
+        }
+    )
+    with app.app_context():
+        yield app
+
+
+class FakeResponse:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+
+class FakeGenerateContent:
+    """Local stand-in for `client.models.generate_content`."""
+
+    def __init__(self, parsed):
+        self.parsed = parsed
+        self.prompts = []
+
+    def __call__(self, contents):
+        self.prompts.append(contents)
+        return FakeResponse(self.parsed)
+
+
+def test_generate_info(worker_app):
+    """
+    GIVEN a fake Gemini client
+    WHEN the info for a title is generated
+    THEN check the parsed response is returned and the prompt has the categories
+    """
+    documentary = Documentary(title="Title", description="Synopsis.", category="Nature")
+    fake = FakeGenerateContent(documentary)
+    assert generate_info("Title", "History, Nature", fake) == documentary
+    assert "History, Nature" in fake.prompts[0]
+
+
+def test_generate_info_unparsed(worker_app):
+    """
+    GIVEN a fake Gemini client
+    WHEN the response can't be parsed
+    THEN check an empty documentary is returned
+    """
+    info = generate_info("Title", "History, Nature", FakeGenerateContent(None))
+    assert not info.description and not info.category
+
+
+def test_generated_info_key():
+    """
+    GIVEN a title, a categories prompt and a model
+    WHEN the memoization key is computed
+    THEN check the title is normalized and a different model or categories change it
+    """
+    key = generated_info_key("The  Title ", "History, Nature", "gemini-2.5-flash")
+    assert key == generated_info_key("the title", "History, Nature", "gemini-2.5-flash")
+    assert key != generated_info_key("the title", "History", "gemini-2.5-flash")
+    assert key != generated_info_key("the title", "History, Nature", "gemini-2.5-pro")
+
+
+def test_save_posts_batch(db_app, make_post):
+    """
+    GIVEN a batch of new posts with one already posted video
+    WHEN it's saved, falling back to a savepoint per post, and committed
+    THEN check the new posts are indexed only once the batch is committed
+    """
+    documents = db_app.config["SEARCH_INDEX"].documents
+    db.session.add(make_post("a"))
+    db.session.commit()
+    documents.clear()
+
+    assert save_posts([make_post("b"), make_post("a"), make_post("c")]) == 2
+    assert documents == {}
+
+    commit_batch()
+    titles = {document["title"] for document in documents.values()}
+    assert titles == {"Video b", "Video c"}
+
+
+def test_save_posts_rolled_back(db_app, make_post):
+    """
+    GIVEN a batch of new posts saved in a savepoint
+    WHEN the outer transaction is rolled back
+    THEN check nothing is indexed, not even by a later commit
+    """
+    documents = db_app.config["SEARCH_INDEX"].documents
+    assert save_posts([make_post("a"), make_post("b")]) == 2
+    db.session.rollback()
+    db.session.commit()
+    assert documents == {} and db.session.query(Post).count() == 0
+
+
+def test_reconcile_counters(db_app, make_post, new_google_user, new_facebook_user):
+    """
+    GIVEN posts whose like counters drifted from their likes
+    WHEN the counters are reconciled, twice
+    THEN check only the drifted counters are repaired, the first time
+    """
+    liked, unliked = make_post("a"), make_post("b")
+    unliked.like_count = 5
+    users = new_google_user, new_facebook_user
+    likes = [PostLike(user=user, post=liked) for user in users]
+    db.session.add_all([liked, unliked, *likes])
+    db.session.commit()
+
+    assert reconcile_counters() == 2
+    assert (liked.like_count, unliked.like_count) == (2, 0)
+    assert (liked.fave_count, unliked.fave_count) == (0, 0)
+    assert reconcile_counters() == 0
@@ -0,0 +1,198 @@
+import json
+import time
+import httpx
+import pytest
+import httplib2
+from app.cron.helpers import (
+    newest_first,
+    reached_watermark,
+    is_retryable,
+    SeenVideos,
+    TokenBucket,
+    CircuitBreaker,
+    Upstream,
+    CircuitOpenError,
+)
+
+
+def playlist_items():
+    return [
+        {"contentDetails": {"videoId": "c", "videoPublishedAt": "2024-03-01T00:00:00Z"}},
+        {"contentDetails": {"videoId": "b", "videoPublishedAt": "2024-02-01T00:00:00Z"}},
+        {"contentDetails": {"videoId": "a"}},
+    ]
+
+
+def test_reached_watermark_by_video_id():
+    """
+    GIVEN a page of playlist items
+    WHEN the last seen video is among them
+    THEN check the watermark is reached
+    """
+    assert reached_watermark(playlist_items(), "b", None)
+    assert not reached_watermark(playlist_items(), "z", None)
+
+
+def test_reached_watermark_by_publish_date():
+    """
+    GIVEN a page of playlist items
+    WHEN no item is newer than the newest publish date
+    THEN check the watermark is reached
+    """
+    assert reached_watermark(playlist_items(), None, "2024-03-01T00:00:00Z")
+    assert not reached_watermark(playlist_items(), None, "2024-02-15T00:00:00Z")
+
+
+def test_newest_first():
+    """
+    GIVEN a page of playlist items
+    WHEN it's checked for the newest first order
+    THEN check only the pages ordered by publish date, newest first, pass
+    """
+    assert newest_first(playlist_items())
+    assert not newest_first(list(reversed(playlist_items())))
+
+
+def test_no_watermark():
+    """
+    GIVEN a page of playlist items
+    WHEN there is no watermark (full scan)
+    THEN check the watermark is never reached
+    """
+    assert not reached_watermark(playlist_items(), None, None)
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"Error {code}")
+        self.code = code
+
+
+def test_is_retryable():
+    """
+    GIVEN API errors
+    WHEN checked if they are worth retrying
+    THEN check only rate limit, server and network errors are retried
+    """
+    assert is_retryable(FakeAPIError(429))
+    assert is_retryable(FakeAPIError(503))
+    assert is_retryable(ConnectionError())
+    assert is_retryable(TimeoutError())
+    assert is_retryable(httplib2.ServerNotFoundError())
+    assert is_retryable(httpx.ConnectTimeout("timed out"))
+    assert not is_retryable(FakeAPIError(400))
+    assert not is_retryable(FakeAPIError(403))
+    assert not is_retryable(KeyError("items"))
+    assert not is_retryable(json.JSONDecodeError("Expecting value", "", 0))
+
+
+def test_seen_videos_is_bounded():
+    """
+    GIVEN a dedupe window of 2 video ids
+    WHEN more ids are seen
+    THEN check the duplicates are detected and the least recent id is forgotten
+    """
+    seen = SeenVideos(maxsize=2)
+    assert seen.add("a") and seen.add("b")
+    assert not seen.add("a")
+    assert seen.add("c")
+    assert len(seen.ids) == 2
+    assert not seen.add("a") and seen.add("b")
+
+
+def test_token_bucket_rate():
+    """
+    GIVEN a token bucket of 50 tokens per second
+    WHEN 6 tokens are acquired
+    THEN check it took at least the time to refill 5 tokens
+    """
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_circuit_breaker():
+    """
+    GIVEN a circuit breaker with a threshold of 2 failures
+    WHEN the upstream fails twice in a row
+    THEN check the circuit opens and closes again after the reset timeout
+    """
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_upstream_fails_fast_and_accounts_quota():
+    """
+    GIVEN an upstream with a threshold of 1 failure
+    WHEN a call fails with a server error
+    THEN check the next call is rejected and the usage is accounted
+    """
+    upstream = Upstream("youtube", rate=1000, threshold=1, reset_timeout=60)
+    assert upstream.call("videos.list", lambda: "ok") == "ok"
+
+    def fail():
+        raise FakeAPIError(503)
+
+    with pytest.raises(FakeAPIError):
+        upstream.call("videos.list", fail)
+    with pytest.raises(CircuitOpenError):
+        upstream.call("videos.list", lambda: "ok")
+
+    usage = upstream.usage["videos.list"]
+    assert (usage["calls"], usage["units"], usage["errors"]) == (2, 2, 1)
+    assert usage["rejected"] == 1
+    assert not is_retryable(CircuitOpenError())
+
+
+class FakeRequest:
+    """Stand-in for a googleapiclient HttpRequest."""
+
+    def __init__(self, response):
+        self.response = response
+        self.headers = {}
+
+    def execute(self):
+        if self.headers.get("If-None-Match") == self.response["etag"]:
+            raise FakeAPIError(304)
+        return self.response
+
+
+def test_youtube_conditional_request(redis_client):
+    """
+    GIVEN a YouTube API wrapper with an ETag cache
+    WHEN the same unchanged resource is requested twice
+    THEN check the second request is conditional and served from the cache
+    """
+    from flask import Flask
+    from app.cron.helpers import YouTubeAPI
+
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "REDIS_CLIENT": redis_client,
+            "YOUTUBE_ETAG_TIMEOUT": 60,
+            "YOUTUBE_RPS": 1000,
+            "GEMINI_RPM": 6000,
+            "API_FAILURE_THRESHOLD": 5,
+            "API_RESET_TIMEOUT": 60,
+        }
+    )
+    with app.app_context():
+        api = YouTubeAPI(youtube_resource=None)
+        response = {"etag": "abc", "items": [{"id": "video"}]}
+        scope = {"id": "video", "part": "snippet"}
+
+        assert api._execute("videos.list", FakeRequest(response), scope) == response
+        request = FakeRequest(response)
+        assert api._execute("videos.list", request, scope) == response
+        assert request.headers["If-None-Match"] == "abc"
+        assert api.upstream.usage["videos.list"]["not_modified"] == 1
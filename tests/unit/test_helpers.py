@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from app.helpers import encode_cursor, decode_cursor
+from app.models import Post, cursor_values
+
+
+def test_pagination_cursor():
+    """
+    GIVEN the sort key values of a page's last post
+    WHEN they're encoded into a cursor and decoded back
+    THEN check the values survive and an invalid cursor is rejected
+    """
+    upload_date = datetime(2024, 5, 17, 10, 30)
+    cursor = encode_cursor((upload_date, 42))
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == [upload_date.isoformat(), 42]
+    assert decode_cursor("not a cursor!") is None
+    assert decode_cursor(None) is None
+
+
+def test_cursor_values():
+    """
+    GIVEN the cursors of a listing sorted by the upload date and the id
+    WHEN their values are checked against the sort keys
+    THEN check only the values of the keys' types and number pass
+    """
+    keys = [Post.upload_date, Post.id]
+    upload_date = datetime(2024, 5, 17, 10, 30)
+    assert cursor_values(encode_cursor((upload_date, 42)), keys) == [upload_date, 42]
+
+    assert cursor_values(encode_cursor(["2024-01-01T00:00:00", "x"]), keys) is None
+    assert cursor_values(encode_cursor(["2024-01-01T00:00:00", True]), keys) is None
+    assert cursor_values(encode_cursor(["yesterday", 42]), keys) is None
+    assert cursor_values(encode_cursor([42]), keys) is None
+    assert cursor_values(encode_cursor(["5", 42]), [Post.like_count, Post.id]) is None
+    assert cursor_values("not a cursor!", keys) is None
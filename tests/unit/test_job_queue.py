@@ -0,0 +1,86 @@
+import time
+
+from app.cron.queue import HIGH, LOW, JobQueue
+
+
+def test_job_queue_priority(redis_client):
+    """
+    GIVEN a job queue
+    WHEN jobs of different priorities are queued
+    THEN check the high priority job is reserved first, then in queued order
+    """
+    queue = JobQueue(redis_client)
+    first = queue.enqueue("enrich_post", LOW, post_id=1)
+    second = queue.enqueue("enrich_post", LOW, post_id=2)
+    urgent = queue.enqueue("add_post", HIGH, video_id="abc", user_id=1)
+
+    assert [queue.reserve()["id"] for _ in range(3)] == [urgent, first, second]
+    assert queue.reserve() is None
+
+
+def test_job_queue_ack(redis_client):
+    """
+    GIVEN a reserved job
+    WHEN it's acknowledged
+    THEN check nothing is left in the queue
+    """
+    queue = JobQueue(redis_client)
+    queue.enqueue("revalidate_batch", post_ids=[1])
+    job = queue.reserve()
+    assert job["args"] == {"post_ids": [1]} and job["attempts"] == 1
+
+    queue.ack(job)
+    assert queue.stats() == {"ready": 0, "delayed": 0, "processing": 0, "dead": 0}
+
+
+def test_job_queue_dedupe(redis_client):
+    """
+    GIVEN a job queued with a job id
+    WHEN the same job is queued again before and after it's done
+    THEN check it's queued once while pending and again once acknowledged
+    """
+    queue = JobQueue(redis_client)
+    first = queue.enqueue("enrich_post", job_id="enrich_post:1", post_id=1)
+    again = queue.enqueue("enrich_post", job_id="enrich_post:1", post_id=1)
+    assert first == again == "enrich_post:1"
+    assert queue.stats()["ready"] == 1
+
+    queue.ack(queue.reserve())
+    queue.enqueue("enrich_post", job_id="enrich_post:1", post_id=1)
+    assert queue.stats()["ready"] == 1
+
+
+def test_job_queue_retry_and_dead_letter(redis_client):
+    """
+    GIVEN a job queue without a retry delay and two attempts per job
+    WHEN a job fails twice
+    THEN check it's retried once and then dead-lettered with the error
+    """
+    queue = JobQueue(redis_client, max_attempts=2, retry_delay=0)
+    queue.enqueue("enrich_post", post_id=1)
+
+    queue.fail(queue.reserve(), "Gemini is down.")
+    assert queue.stats()["delayed"] == 1
+
+    job = queue.reserve()
+    assert job["attempts"] == 2
+    queue.fail(job, "Gemini is down.")
+
+    assert queue.reserve() is None
+    dead = queue.dead_letters()
+    assert len(dead) == 1 and dead[0]["error"] == "Gemini is down."
+
+
+def test_job_queue_visibility_timeout(redis_client):
+    """
+    GIVEN a job queue with a short visibility timeout
+    WHEN a reserved job is not acknowledged in time
+    THEN check it becomes visible again
+    """
+    queue = JobQueue(redis_client, visibility_timeout=0)
+    job_id = queue.enqueue("ingest_playlist", playlist_id="PL1")
+    assert queue.reserve()["id"] == job_id
+
+    time.sleep(0.01)
+    job = queue.reserve()
+    assert job["id"] == job_id and job["attempts"] == 2
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from app.cron.journal import RunJournal
+
+
+def test_journal_resume(redis_client):
+    """
+    GIVEN a run journal with checkpoints
+    WHEN the run is started again
+    THEN check it resumes with the cursors, the stats and the fetched playlists
+    """
+    journal = RunJournal(redis_client)
+    assert journal.start() is None
+
+    journal.mark_playlist_done("PL1", fetched=10, deleted=1)
+    journal.add_stats(new=3, updated=1)
+    journal.mark_done("ingest")
+    journal.checkpoint("enrich", 100, updated=2)
+    journal.checkpoint("enrich", 200, updated=3)
+
+    journal = RunJournal(redis_client)
+    assert isinstance(journal.start(), datetime)
+    assert journal.is_done("ingest") and not journal.is_done("reindex")
+    assert journal.cursor("enrich") == 200 and journal.cursor("reindex") == 0
+    assert journal.stats() == {"fetched": 10, "deleted": 1, "new": 3, "updated": 6}
+    assert journal.done_playlists() == {"PL1"}
+
+
+def test_journal_fresh(redis_client):
+    """
+    GIVEN a run journal with checkpoints
+    WHEN a fresh run is started
+    THEN check the checkpoints are discarded
+    """
+    journal = RunJournal(redis_client)
+    journal.start()
+    journal.checkpoint("enrich", 42, updated=10)
+
+    assert journal.start(fresh=True) is None
+    assert journal.cursor("enrich") == 0 and journal.stats() == {}
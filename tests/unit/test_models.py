@@ -1,3 +1,10 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import PostLike
+
+
 def assert_new_user(user):
     assert user.name == "Test User"
     assert user.email == "test@email.com"
@@ -24,3 +31,56 @@ def test_new_facebook_user(new_facebook_user):
     assert_new_user(new_facebook_user)
     assert new_facebook_user.google_id == None
     assert new_facebook_user.facebook_id == "0987654321"
+
+
+@pytest.fixture()
+def casting(pg_app, make_post, new_google_user, new_facebook_user):
+    """Two users and a post, saved."""
+    post = make_post("a")
+    db.session.add_all([post, new_google_user, new_facebook_user])
+    db.session.commit()
+    return post, new_google_user, new_facebook_user
+
+
+def test_cast(casting):
+    """
+    GIVEN a post and two users
+    WHEN they like, fave and take back the like or the fave of the post
+    THEN check the returned counters move with the likes and the faves
+    """
+    post, user, other = casting
+    assert user.cast("a", "like") == 1
+    assert other.cast("a", "like") == 2
+    assert user.cast("a", "fave") == 1
+    assert user.casts(post) == {"like": True, "fave": True}
+
+    assert user.cast("a", "unlike") == 1
+    assert user.casts(post) == {"like": False, "fave": True}
+    assert user.cast("a", "like") == 2
+    assert user.cast("a", "unfave") == 0
+    assert user.cast("missing", "like") is None
+
+    db.session.commit()
+    db.session.refresh(post)
+    assert (post.like_count, post.fave_count) == (2, 0)
+
+
+def test_cast_is_idempotent(casting):
+    """
+    GIVEN a post and a user
+    WHEN the user likes the post twice and takes the like back twice
+    THEN check the repeated casts change nothing and a duplicate like is refused
+    """
+    post, user, _ = casting
+    assert user.cast("a", "like") == 1
+    assert user.cast("a", "like") == 1
+    assert user.liked.count() == 1
+
+    assert user.cast("a", "unlike") == 0
+    assert user.cast("a", "unlike") == 0
+    assert user.liked.count() == 0
+
+    # one like per user and post
+    db.session.add_all([PostLike(user=user, post=post), PostLike(user=user, post=post)])
+    with pytest.raises(IntegrityError):
+        db.session.commit()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.cron.similarity import SimilarityIndex
+
+
+DOCS = {
+    1: "The secret life of whales in the deep ocean",
+    2: "Whales and dolphins of the ocean",
+    3: "History of the Roman empire",
+    4: "The fall of the Roman empire and its legions",
+    5: "Cooking pasta at home",
+}
+
+
+def test_similarity_scores():
+    """
+    GIVEN a TF-IDF index of a few documents
+    WHEN the similarity of a document to all of them is computed
+    THEN check it matches the dense cosine similarity
+    """
+    index = SimilarityIndex(DOCS, max_df=1.0)
+    scores = index.scores(1)
+
+    # dense tf-idf vectors for comparison
+    dense = np.zeros((len(DOCS), index.term_indptr.size - 1))
+    for row in range(len(DOCS)):
+        start, end = index.indptr[row], index.indptr[row + 1]
+        dense[row, index.terms[start:end]] = index.weights[start:end]
+
+    assert np.allclose(scores, dense @ dense[0])
+    assert np.isclose(scores[0], 1.0)
+
+
+def test_most_similar():
+    """
+    GIVEN a TF-IDF index of a few documents
+    WHEN the most similar documents of a document are requested
+    THEN check they're the related ones, without itself or the unrelated ones
+    """
+    # "the" is found in most of the documents and is ignored
+    index = SimilarityIndex(DOCS)
+    assert index.most_similar(1, 1) == [2]
+    assert index.most_similar(3, 4) == [4]
+    assert index.most_similar(5, 3) == []
@@ -0,0 +1,31 @@
+import time
+from flask import Flask, current_app
+
+from app.cron.warmer import run_tasks
+
+
+def test_warming_order_and_budget():
+    """
+    GIVEN ranked warming tasks, one of them failing
+    WHEN they're run on a single worker and then past the deadline
+    THEN check they run in their order, each in an app context,
+    the failure doesn't stop the others and nothing runs past the deadline
+    """
+    app = Flask(__name__)
+    done = []
+
+    def task(name):
+        def run():
+            done.append((name, current_app.name))
+
+        return run
+
+    def fail():
+        raise ValueError
+
+    tasks = [("home", task("home")), ("broken", fail), ("category", task("category"))]
+    assert run_tasks(app, tasks, workers=1, deadline=time.monotonic() + 60) == 2
+    assert done == [("home", app.name), ("category", app.name)]
+
+    assert run_tasks(app, tasks, workers=2, deadline=time.monotonic() - 1) == 0
+    assert len(done) == 2
@@ -0,0 +1,154 @@
+import hmac
+import pytest
+import hashlib
+from flask import Flask
+
+from app.websub import helpers
+from app.websub.routes import bp
+from app.websub.helpers import (
+    topic_url,
+    parse_topic,
+    parse_notification,
+    verify_signature,
+    intent_key,
+    lease_key,
+    subscribe,
+)
+
+
+NOTIFICATION = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015"
+      xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>yt:video:VIDEO_ID</id>
+    <yt:videoId>VIDEO_ID</yt:videoId>
+    <yt:channelId>CHANNEL_ID</yt:channelId>
+    <title>Video title</title>
+  </entry>
+</feed>"""
+
+
+def test_topic():
+    """
+    GIVEN a channel id
+    WHEN the topic URL is constructed
+    THEN check the channel id can be parsed back
+    """
+    assert parse_topic(topic_url("CHANNEL_ID")) == "CHANNEL_ID"
+    assert parse_topic("https://www.youtube.com/xml/feeds/videos.xml") is None
+
+
+def test_parse_notification():
+    """
+    GIVEN an Atom notification from the hub
+    WHEN it's parsed
+    THEN check the video and its channel are extracted
+    """
+    assert parse_notification(NOTIFICATION) == {"VIDEO_ID": "CHANNEL_ID"}
+    assert parse_notification(b"not xml") == {}
+
+
+def test_verify_signature():
+    """
+    GIVEN a subscription secret, or none
+    WHEN a notification is received
+    THEN check only the correctly signed body is accepted, and none without a secret
+    """
+    app = Flask(__name__)
+    app.config["WEBSUB_SECRET"] = "secret"
+    digest = hmac.new(b"secret", NOTIFICATION, hashlib.sha1).hexdigest()
+    with app.app_context():
+        assert verify_signature(NOTIFICATION, f"sha1={digest}")
+        assert not verify_signature(NOTIFICATION, "sha1=invalid")
+        assert not verify_signature(NOTIFICATION, None)
+
+    # without a secret nothing can be verified
+    app.config["WEBSUB_SECRET"] = None
+    with app.app_context():
+        assert not verify_signature(NOTIFICATION, f"sha1={digest}")
+
+
+@pytest.fixture()
+def websub_app(redis_client):
+    """Bare app with the WebSub callback and a fake Redis."""
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "REDIS_CLIENT": redis_client,
+            "DOMAIN": "example.com",
+            "WEBSUB_HUB": "https://hub.example.com",
+            "WEBSUB_SECRET": "secret",
+            "WEBSUB_LEASE_SECONDS": 432000,
+        }
+    )
+    app.register_blueprint(bp)
+    with app.app_context():
+        yield app
+
+
+def verification(mode: str = "subscribe", lease_seconds: int | None = None) -> dict:
+    """Query string of the hub's verification request."""
+    args = {
+        "hub.mode": mode,
+        "hub.challenge": "CHALLENGE",
+        "hub.topic": topic_url("CHANNEL_ID"),
+    }
+    if lease_seconds is not None:
+        args["hub.lease_seconds"] = lease_seconds
+    return args
+
+
+class FakeHubResponse:
+    status_code = 202
+
+
+def test_verify_requested_subscription(websub_app, redis_client, monkeypatch):
+    """
+    GIVEN a subscription asked for from the hub
+    WHEN the hub verifies it, asking for a longer lease than ours
+    THEN check the challenge is confirmed once and the lease is capped
+    """
+    monkeypatch.setattr(helpers.requests, "post", lambda *a, **kw: FakeHubResponse())
+    assert subscribe("CHANNEL_ID")
+
+    client = websub_app.test_client()
+    args = verification(lease_seconds=10**9)
+    response = client.get("/websub/callback", query_string=args)
+    assert response.status_code == 200 and response.text == "CHALLENGE"
+    assert redis_client.ttl(lease_key("CHANNEL_ID")) == 432000
+
+    # the request is confirmed only once
+    response = client.get("/websub/callback", query_string=verification())
+    assert response.status_code == 404
+
+
+def test_verify_unrequested_subscription(websub_app, redis_client):
+    """
+    GIVEN no (un)subscription asked for
+    WHEN a (un)subscription is verified
+    THEN check it's not confirmed
+    """
+    client = websub_app.test_client()
+    for mode in ("subscribe", "unsubscribe"):
+        response = client.get("/websub/callback", query_string=verification(mode))
+        assert response.status_code == 404
+    assert redis_client.ttl(lease_key("CHANNEL_ID")) == -2
+
+    # a subscription asked for doesn't confirm an unsubscription
+    redis_client.setex(intent_key("CHANNEL_ID"), 60, "subscribe")
+    response = client.get("/websub/callback", query_string=verification("unsubscribe"))
+    assert response.status_code == 404
+
+
+def test_verify_invalid_lease(websub_app, redis_client):
+    """
+    GIVEN a subscription asked for from the hub
+    WHEN the hub verifies it with a lease of zero seconds
+    THEN check the lease is kept for at least a second instead of failing
+    """
+    redis_client.setex(intent_key("CHANNEL_ID"), 60, "subscribe")
+    client = websub_app.test_client()
+    args = verification(lease_seconds=0)
+    response = client.get("/websub/callback", query_string=args)
+    assert response.status_code == 200
+    assert redis_client.ttl(lease_key("CHANNEL_ID")) == 1
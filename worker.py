@@ -5,6 +5,7 @@ https://ai.google.dev/gemini-api/docs/models/gemini
 https://github.com/googleapis/python-genai
 """
 
+import argparse
 import functools
 from flask import Flask
 
@@ -12,8 +13,22 @@ from google import genai
 from google.genai import types
 
 from app import create_app
-from app.models import Post
-from app.cron.handlers import Documentary, process_videos
+from app.websub.helpers import renew_subscriptions
+from app.cron.coordination import (
+    Shard,
+    LeaseNotAcquiredError,
+    run_lock,
+    shards_in_progress,
+)
+from app.cron.handlers import (
+    Documentary,
+    process_videos,
+    process_shards,
+    ingest_pending_videos,
+    reconcile_counters,
+)
+from app.cron.warmer import warm_caches
+from app.cron.jobs import run_consumers, enqueue_scheduled_jobs
 
 
 def setup_generative_ai(app: Flask) -> None:
@@ -60,9 +75,84 @@ def setup_generative_ai(app: Flask) -> None:
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Fetch and post videos.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--websub",
+        action="store_true",
+        help="renew the push subscriptions and ingest the notified videos only",
+    )
+    mode.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="queue the playlists ingestion and the revalidation as jobs",
+    )
+    mode.add_argument(
+        "--consume",
+        type=int,
+        metavar="N",
+        help="run N concurrent job consumers until stopped",
+    )
+    mode.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="recount the like and fave counters of the posts",
+    )
+    mode.add_argument(
+        "--warm",
+        action="store_true",
+        help="warm the caches of the most visited pages, e.g. before taking traffic",
+    )
+    mode.add_argument(
+        "--sharded",
+        action="store_true",
+        help="process the free shards of the catalog, to run on several nodes",
+    )
+    run = parser.add_mutually_exclusive_group()
+    run.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume the interrupted run from its last checkpoint (default)",
+    )
+    run.add_argument(
+        "--fresh",
+        action="store_true",
+        help="discard the interrupted run's checkpoints and start over",
+    )
+    args = parser.parse_args()
+
     app = create_app()
     setup_generative_ai(app)
 
+    if args.consume:
+        run_consumers(app, args.consume)
+        raise SystemExit
+
     with app.app_context():
-        process_videos()
-        Post.reindex()
+        if args.sharded:
+            count = process_shards(fresh=args.fresh)
+            app.logger.info(f"Processed {count} shards.")
+            raise SystemExit
+
+        modes = ("websub", "enqueue", "reconcile", "warm")
+        command = next((mode for mode in modes if getattr(args, mode)), "run")
+        try:
+            # one run of a command at a time, even across nodes
+            with run_lock(command) as lock:
+                if args.websub:
+                    renew_subscriptions()
+                    ingest_pending_videos()
+                elif args.enqueue:
+                    count = enqueue_scheduled_jobs()
+                    app.logger.info(f"Queued {count} jobs.")
+                elif args.reconcile:
+                    reconcile_counters()
+                elif args.warm:
+                    warm_caches()
+                elif shards_in_progress():
+                    # a sharded run is processing the same catalog
+                    raise LeaseNotAcquiredError("A sharded run is in progress.")
+                else:
+                    process_videos(fresh=args.fresh, shard=Shard(lease=lock))
+        except LeaseNotAcquiredError:
+            app.logger.info(f"Another '{command}' run is in progress, exiting.")